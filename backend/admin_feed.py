@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from debate_system import DEBATE_CRITERIA
+
+logger = logging.getLogger(__name__)
+
+RECENT_COMPLETED_LIMIT = 10
+
+
+def active_session_summary(session_key: str, session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """What the admin dashboard shows for an active session"""
+    turns_taken = session_data.get("turns_taken", 0)
+    session = session_data.get("session")
+    return {
+        "team_id": session_data.get("team_id", session_key),
+        "topic": session_data.get("topic"),
+        "status": session_data.get("status"),
+        "current_phase": session_data.get("current_phase"),
+        "members": session_data.get("members", []),
+        "turns_taken": turns_taken,
+        # Phase 2/3 turns change the summary too, so each one reaches the dashboard as a delta
+        "phase2_turns": len(getattr(session, "turns", ())),
+        "phase3_turns": len(getattr(session, "phase3_turns", ())),
+        "course_code": session_data.get("course_code", ""),
+        "progress": min(100, turns_taken * 20),  # Rough progress calculation
+    }
+
+
+def live_scoring_item(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Row of the live scoring tab for an active session summary"""
+    return {
+        "team_id": summary["team_id"],
+        "topic": summary["topic"],
+        "status": "in_progress",
+        "current_phase": summary["current_phase"],
+        "members": summary["members"],
+        "progress": summary["progress"],
+        "elapsed_time": "00:15:30"  # Could calculate actual time
+    }
+
+
+def completed_session_summary(session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """What the admin dashboard shows for a completed session"""
+    # For sessions that were force-ended without evaluation, create basic evaluation
+    evaluation = session_data.get("evaluation")
+    if not evaluation and session_data.get("status") == "ended":
+        scores = {}
+        for phase_key, criteria_list in DEBATE_CRITERIA.items():
+            scores[phase_key] = {criterion['id']: 0 for criterion in criteria_list}
+
+        evaluation = {
+            "total_score": 0,
+            "scores": scores,
+            "feedback": "Session was ended manually before completion. No detailed evaluation available."
+        }
+        session_data["evaluation"] = evaluation  # Save it back
+
+    return {
+        "team_id": session_data.get("team_id"),
+        "topic": session_data.get("topic"),
+        "status": session_data.get("status"),
+        "completed_at": session_data.get("completed_at"),
+        "members": session_data.get("members", []),
+        "score": evaluation.get("total_score", 0) if evaluation else 0,
+        "evaluation": evaluation  # Include full evaluation data
+    }
+
+
+class AdminFeed:
+    """
+    Push feed for the admin dashboard.
+
+    Registered as a session store listener, it keeps one summary per active session
+    plus running live-scoring statistics, and only publishes when a summary actually
+    changes (phase change, new turn, session started/archived) or the archive changes.
+    Subscribers get one snapshot, then deltas; with nothing changing nothing is sent
+    apart from a keep-alive ping.
+    """
+
+    def __init__(self, session_store, poll_interval: float = 1.0, keepalive_seconds: float = 15.0,
+                 max_queue: int = 1000):
+        self.session_store = session_store
+        self.poll_interval = poll_interval
+        self.keepalive_seconds = keepalive_seconds
+        self.max_queue = max_queue
+
+        # Listeners also run on the session store's I/O threads
+        self._state_lock = threading.RLock()
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._completed: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._participants = 0
+        self._progress_sum = 0
+        self._phases: Dict[str, int] = {}
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._poller: Optional[asyncio.Task] = None
+
+        session_store.add_active_listener(self._on_active)
+        session_store.add_completed_listener(self._on_completed)
+
+    # --- State --------------------------------------------------------------
+
+    def _account(self, summary: Dict[str, Any], sign: int):
+        self._participants += sign * len(summary["members"])
+        self._progress_sum += sign * summary["progress"]
+        phase = summary["current_phase"] or "Unknown"
+        self._phases[phase] = self._phases.get(phase, 0) + sign
+        if not self._phases[phase]:
+            del self._phases[phase]
+
+    def statistics(self) -> Dict[str, Any]:
+        with self._state_lock:
+            count = len(self._summaries)
+            return {
+                "active_debates": count,
+                "total_participants": self._participants,
+                "average_progress": self._progress_sum / count if count else 0,
+                "phases_distribution": dict(self._phases)
+            }
+
+    def active_summaries(self) -> List[Dict[str, Any]]:
+        with self._state_lock:
+            return list(self._summaries.values())
+
+    def recent_completed(self) -> List[Dict[str, Any]]:
+        with self._state_lock:
+            recent = list(self._completed.values())[-RECENT_COMPLETED_LIMIT:]
+            return [completed_session_summary(session_data) for session_data in recent]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._state_lock:
+            active = self.active_summaries()
+            return {
+                "active": active,
+                "live_scoring": [live_scoring_item(summary) for summary in active],
+                "completed": self.recent_completed(),
+                "statistics": self.statistics(),
+                "criteria": DEBATE_CRITERIA
+            }
+
+    def _on_active(self, session_key: str, session_data: Optional[Dict[str, Any]]):
+        with self._state_lock:
+            summary = active_session_summary(session_key, session_data) if session_data is not None else None
+            previous = self._summaries.get(session_key)
+            if summary == previous:
+                return  # Saved without any visible change
+
+            if previous is not None:
+                self._account(previous, -1)
+            if summary is None:
+                del self._summaries[session_key]
+                self._publish("session_removed", {
+                    "team_id": previous["team_id"],
+                    "statistics": self.statistics()
+                })
+                return
+
+            self._summaries[session_key] = summary
+            self._account(summary, 1)
+            self._publish("session", {
+                "session": summary,
+                "live": live_scoring_item(summary),
+                "statistics": self.statistics()
+            })
+
+    def _on_completed(self, session_key: str, session_data: Optional[Dict[str, Any]]):
+        with self._state_lock:
+            self._completed.pop(session_key, None)
+            if session_data is not None:
+                self._completed[session_key] = session_data
+            if self._subscribers:
+                self._publish("completed", {"completed": self.recent_completed()})
+
+    # --- Subscribers --------------------------------------------------------
+
+    def _publish(self, event: str, data: Dict[str, Any]):
+        if not self._subscribers or self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(event, data)
+        else:
+            # Store writes made from a worker thread
+            self._loop.call_soon_threadsafe(self._deliver, event, data)
+
+    def _deliver(self, event: str, data: Dict[str, Any]):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # A stalled client: replace its backlog with a fresh snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", self.snapshot()))
+
+    async def _poll_other_workers(self):
+        """Sessions changed by other workers only reach this worker's listeners on refresh"""
+        while self._subscribers:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.session_store.arefresh_active()
+                await self.session_store.arefresh_completed()
+            except Exception as e:
+                logger.warning(f"⚠️ Admin feed refresh failed: {e}")
+
+    async def subscribe(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (event, data): a snapshot first, then deltas, with periodic pings"""
+        self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        await self.session_store.arefresh_active()
+        await self.session_store.arefresh_completed()
+        self._subscribers.add(queue)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll_other_workers())
+        logger.info(f"📡 Admin feed subscriber connected ({len(self._subscribers)} total)")
+        try:
+            yield "snapshot", self.snapshot()
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield "ping", {}
+                    continue
+                yield event, data
+        finally:
+            self._subscribers.discard(queue)
+            logger.info(f"📡 Admin feed subscriber left ({len(self._subscribers)} remaining)")
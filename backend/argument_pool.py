@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ARGUMENTS_PER_SET = 3
+
+
+def is_valid_argument_set(arguments: List[str]) -> bool:
+    """A set is only pooled if all 3 arguments parsed into the structured format"""
+    return (
+        len(arguments) == ARGUMENTS_PER_SET
+        and all(isinstance(argument, str) and argument.startswith("Luận điểm") for argument in arguments)
+    )
+
+
+class ArgumentPool:
+    """
+    Pre-generated Phase 1 argument sets for the fixed topic bank.
+
+    Topics come from a handful of fixed lists, so the AI arguments for each
+    (topic, side) can be generated ahead of time. A background task keeps up to
+    `size` validated sets per pair and refills a pair as soon as a set is taken.
+    Each set is handed out once. Refills only run while some API key is idle, so
+    live requests always go first; take() returns None when the pair is empty and
+    the caller generates live as before. Refills bypass the LLM response cache,
+    which would otherwise hand back the same completion for every set.
+    """
+
+    def __init__(self, debate_system, topics: Iterable[str], size: int = 3,
+                 sides: Tuple[str, ...] = ("supporting", "opposing"), idle_wait: float = 2.0,
+                 max_backoff: float = 300.0):
+        self.debate_system = debate_system
+        self.size = size
+        self.idle_wait = idle_wait
+        self.max_backoff = max_backoff
+        # dict.fromkeys keeps topic order and drops topics listed for several courses
+        self._sets: Dict[Tuple[str, str], Deque[List[str]]] = {
+            (topic, side): deque() for topic in dict.fromkeys(topics) for side in sides
+        }
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.rejected = 0
+
+    def take(self, topic: str, side: str) -> Optional[List[str]]:
+        """Pop a ready argument set for (topic, side), or None if none is pooled"""
+        queue = self._sets.get((topic, side))
+        if queue is None:
+            return None  # Not a topic from the fixed bank
+        if queue:
+            self.hits += 1
+            arguments = queue.popleft()
+        else:
+            self.misses += 1
+            arguments = None
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return arguments
+
+    def start(self):
+        """Start the background refill task (needs a running event loop)"""
+        if self.size <= 0 or not self._sets or self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._refill_forever())
+        logger.info(f"🧺 Argument pool filling {self.size} sets for {len(self._sets)} topic/side pairs")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _next_to_fill(self) -> Optional[Tuple[str, str]]:
+        """The emptiest pair below target, so every pair gets its first set early"""
+        pair, queue = min(self._sets.items(), key=lambda item: len(item[1]))
+        return pair if len(queue) < self.size else None
+
+    async def _refill_forever(self):
+        failures = 0
+        while True:
+            pair = self._next_to_fill()
+            if pair is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # Live requests go first: only spend quota while a key is idle
+            if not self.debate_system.key_pool.has_spare_capacity():
+                await asyncio.sleep(self.idle_wait)
+                continue
+
+            topic, side = pair
+            try:
+                arguments = await self.debate_system.agenerate_arguments(topic, side, use_cache=False)
+            except Exception as e:
+                logger.warning(f"⚠️ Argument pool refill failed for ({side}) '{topic[:40]}': {e}")
+                arguments = []
+
+            if is_valid_argument_set(arguments):
+                self._sets[pair].append(arguments)
+                self.generated += 1
+                failures = 0
+                continue
+
+            self.rejected += 1
+            failures += 1
+            # Back off while the model keeps failing (quota exhausted, bad output)
+            await asyncio.sleep(min(self.max_backoff, self.idle_wait * 2 ** failures))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "target_per_pair": self.size,
+            "ready": {f"{side}: {topic}": len(queue) for (topic, side), queue in self._sets.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Per-report DOCX render time: python-docx API on a fresh Document() vs the cloned template.
+
+Both engines lay out the same synthetic debate (sizes set by the flags) through
+write_report, so the numbers differ only in how the document is built. The
+lightweight html/markdown/json exports of the same debate are timed alongside:
+
+    cd backend
+    python benchmark_report.py --reports 50 --phase2-turns 10 --phase3-turns 5
+    python benchmark_report.py --template report_template.docx   # a prepared skeleton
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from debate_system import DEBATE_CRITERIA
+from report_template import ReportTemplate, write_report
+from report_formats import TEXT_REPORT_FORMATS, iter_text_report
+
+ANSWER = ("Theo quan điểm duy vật biện chứng, vật chất quyết định ý thức nhưng ý thức có tính độc lập "
+          "tương đối và tác động trở lại vật chất thông qua hoạt động thực tiễn của con người. ") * 3
+
+
+def sample_session_data(phase2_turns: int, phase3_turns: int) -> Dict[str, Any]:
+    """A completed, scored debate shaped like what session_store holds"""
+    turns = []
+    for i in range(1, phase2_turns + 1):
+        turns.append({"asker": "ai", "question": f"Câu hỏi {i}: {ANSWER[:120]}"})
+        turns.append({"asker": "student", "answer": f"Trả lời {i}: {ANSWER}"})
+    phase3 = []
+    for i in range(1, phase3_turns + 1):
+        phase3.append({"asker": "student", "question": f"Câu hỏi {i} của nhóm: {ANSWER[:120]}"})
+        phase3.append({"asker": "ai", "answer": f"AI trả lời {i}: {ANSWER}"})
+    arguments = [f"Luận điểm {i}: {ANSWER}" for i in range(1, 4)]
+    return {
+        "topic": "Ý thức có vai trò quyết định đối với sự phát triển của xã hội",
+        "members": ["Nguyễn Văn A", "Trần Thị B", "Lê Văn C"],
+        "course_code": "MLN111",
+        "created_at": "2024-05-01T08:00:00",
+        "completed_at": "2024-05-01T09:10:00",
+        "status": "completed",
+        "current_phase": "Phase 5",
+        "session": {
+            "team_arguments": arguments,
+            "ai_arguments": arguments,
+            "questions": [turn["question"] for turn in turns if turn["asker"] == "ai"],
+            "turns": turns,
+            "phase3_turns": phase3,
+            "conclusion": arguments[:2],
+            "ai_counter_arguments": arguments[:2],
+        },
+        "evaluation": {
+            "scores": {phase: {criterion["id"]: 4 for criterion in criteria}
+                       for phase, criteria in DEBATE_CRITERIA.items()},
+            "feedback": ANSWER,
+        },
+    }
+
+
+class DocumentWriter:
+    """
+    Report writer through the python-docx API on a fresh Document(), one call per block:
+    how reports were built before ReportTemplate, kept here as the baseline engine.
+    """
+
+    def __init__(self):
+        from docx import Document
+
+        self.document = Document()
+
+    def heading(self, text: str, level: int = 1):
+        self.document.add_heading(text, level)
+
+    def paragraph(self, text: str = "", style: Optional[str] = None, center: bool = False):
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+        para = self.document.add_paragraph(text, style=style)
+        if center:
+            para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    def table(self, rows: List[Tuple[str, ...]], style: str = 'Table Grid'):
+        table = self.document.add_table(rows=1, cols=len(rows[0]))
+        table.style = style
+        for cell, value in zip(table.rows[0].cells, rows[0]):
+            cell.text = value
+        for values in rows[1:]:
+            for cell, value in zip(table.add_row().cells, values):
+                cell.text = value
+
+    def to_bytes(self) -> bytes:
+        file_stream = BytesIO()
+        self.document.save(file_stream)
+        return file_stream.getvalue()
+
+
+def time_engine(render: Callable[[], bytes], reports: int) -> Tuple[List[float], int]:
+    """Milliseconds per render and the size of the last report"""
+    timings, size = [], 0
+    for _ in range(reports):
+        started = time.perf_counter()
+        size = len(render())
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, size
+
+
+def docx_engine(new_writer: Callable[[], Any], session_data: Dict[str, Any]) -> Callable[[], bytes]:
+    def render() -> bytes:
+        out = new_writer()
+        write_report(out, session_data, "BENCH-001")
+        return out.to_bytes()
+    return render
+
+
+def text_engine(report_format: str, session_data: Dict[str, Any]) -> Callable[[], bytes]:
+    raw = json.dumps(session_data, ensure_ascii=False)
+    return lambda: b"".join(iter_text_report(report_format, raw, "BENCH-001"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-report DOCX render time before and after the template engine")
+    parser.add_argument("--reports", type=int, default=30, help="reports rendered per engine")
+    parser.add_argument("--phase2-turns", type=int, default=8)
+    parser.add_argument("--phase3-turns", type=int, default=4)
+    parser.add_argument("--template", help="prepared .docx skeleton (python-docx default if omitted)")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    session_data = sample_session_data(args.phase2_turns, args.phase3_turns)
+    started = time.perf_counter()
+    template = ReportTemplate(args.template)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    engines = {
+        "document_api": docx_engine(DocumentWriter, session_data),
+        "template": docx_engine(template.new_writer, session_data),
+    }
+    engines.update((report_format, text_engine(report_format, session_data)) for report_format in TEXT_REPORT_FORMATS)
+    for render in engines.values():
+        time_engine(render, 2)  # warm imports and caches
+
+    results = {}
+    print(f"📄 {args.reports} reports per engine, {args.phase2_turns} + {args.phase3_turns} turn pairs "
+          f"(template loaded once in {load_ms:.1f} ms)")
+    print(f"{'engine':<14}{'mean ms':>10}{'p50 ms':>10}{'min ms':>10}{'KB':>10}")
+    for name, render in engines.items():
+        timings, size = time_engine(render, args.reports)
+        results[name] = {
+            "mean_ms": round(statistics.mean(timings), 2),
+            "p50_ms": round(statistics.median(timings), 2),
+            "min_ms": round(min(timings), 2),
+            "bytes": size,
+        }
+        row = results[name]
+        print(f"{name:<14}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}{row['min_ms']:>10.2f}{size / 1024:>10.1f}")
+    speedup = results["document_api"]["mean_ms"] / results["template"]["mean_ms"]
+    print(f"⚡ template engine: {speedup:.2f}x faster per report")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "template_load_ms": round(load_ms, 2), "engines": results,
+                       "speedup": round(speedup, 2)}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
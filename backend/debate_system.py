@@ -3,12 +3,17 @@ import os
 import json
 import random
 import re
-import time
 import logging
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.pydantic_v1 import BaseModel, Field
+from pydantic import BaseModel, Field
 from course_content import MLN111_TOPICS, MLN122_TOPICS, MLN111_MLN122_TOPICS
+from key_pool import KeyPool, parse_retry_after
+from llm_cache import CACHEABLE_METHODS, LLMCache
+from prompt_prefix import Prompt, PromptPrefixRegistry, prompt_text
+from token_budget import TokenCounter, TokenUsage, elide_middle, fit_sections, truncate_items
+from model_registry import ModelRegistry
+from turn_pairs import Phase2TurnPairs, Phase3TurnPairs
 
 # Construct the absolute path to the .env file inside the backend directory
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -65,20 +70,228 @@ class DebateEvaluation(BaseModel):
     scores: EvaluationScores = Field(description="The detailed scores for each phase.")
     feedback: str = Field(description="Detailed, constructive feedback for the student team.")
 
+def criteria_schema(criteria_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Response schema of one phase's scores: an integer per criterion id"""
+    return {
+        "type": "object",
+        "properties": {
+            criterion["id"]: {
+                "type": "integer",
+                "description": f"{criterion['name']} (0-{criterion['max_score']})"
+            }
+            for criterion in criteria_list
+        },
+        "required": [criterion["id"] for criterion in criteria_list]
+    }
+
+def evaluation_response_schema() -> Dict[str, Any]:
+    """
+    Gemini response schema for DebateEvaluation. The Dict[str, int] score maps are
+    spelled out with every criterion id from DEBATE_CRITERIA, since the API has no
+    free-form objects; phase5 has no criteria and is added back after parsing.
+    """
+    phases = {phase: criteria_schema(criteria_list) for phase, criteria_list in DEBATE_CRITERIA.items()}
+    return {
+        "type": "object",
+        "properties": {
+            "scores": {"type": "object", "properties": phases, "required": list(phases)},
+            "feedback": {"type": "string", "description": DebateEvaluation.model_fields["feedback"].description}
+        },
+        "required": ["scores", "feedback"]
+    }
+
+# The evaluation call runs in JSON mode constrained to this schema
+EVALUATION_JSON_MODE = {
+    "response_mime_type": "application/json",
+    "response_schema": evaluation_response_schema(),
+}
+# Invalid evaluations are sent back with the validation error this many times before giving up
+EVALUATION_REPAIR_ATTEMPTS = 2
+
+# Phases scored on their own as soon as they close (see PhaseEvaluator)
+PHASE_EVALUATION_TITLES = {
+    "phase1": "Phiên 1: Trình bày luận điểm mở",
+    "phase2": "Phiên 2: AI hỏi, SV trả lời",
+    "phase3": "Phiên 3: SV hỏi, AI trả lời",
+    "phase4": "Phiên 4: Kết luận",
+}
+
+def phase_evaluation_json_mode(phase_key: str) -> Dict[str, Any]:
+    """JSON mode for a single phase: its criterion scores plus short notes for the final feedback"""
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": {
+            "type": "object",
+            "properties": {
+                "scores": criteria_schema(DEBATE_CRITERIA[phase_key]),
+                "notes": {"type": "string", "description": "Nhận xét ngắn về điểm mạnh và điểm yếu trong phiên này"}
+            },
+            "required": ["scores", "notes"]
+        },
+    }
+
+# Order in which debate data is shrunk when it exceeds EVALUATION_TOKEN_BUDGET: the long
+# turn history loses its middle turns first, the AI's own text goes before the students'
+DEBATE_DATA_TRIM_ORDER = (
+    ("turns", elide_middle),
+    ("phase3_turns", elide_middle),
+    ("ai_counter_arguments", truncate_items),
+    ("ai_arguments", truncate_items),
+    ("student_summary", truncate_items),
+    ("conclusion", truncate_items),
+    ("team_arguments", truncate_items),
+)
+
+# Static system prefixes of the prompt templates; only the short suffix changes per request
+QUESTIONS_SYSTEM_PROMPT = """
+Bạn là AI chuyên gia Socratic questioning. Tạo 1 câu hỏi thông minh, sáng tạo và thách thức dựa trên phản hồi của sinh viên (CHỦ ĐỀ và PHẢN HỒI SINH VIÊN ở cuối).
+
+--- HƯỚNG DẪN PHƯƠNG PHÁP SOCRATIC (BẮT BUỘC TUÂN THỦ) ---
+1. Hướng dẫn, không bác bỏ: AI giống như bà đỡ ý tưởng (midwife of ideas), vai trò chính của AI là hỗ trợ nhóm sinh viên khám lỗ hổng trong lập luận của họ để tiến gần hơn với tri thức đúng, chứ không chỉ đơn giản là khẳng định hay phủ nhận chừng.
+2. Trung lập: AI phải duy trì sự trung lập tuyệt đối đối với nội dung và các lập luận trong cuộc tranh biện. Không bao giờ thiên vị kết luận của mình hay nhóm sinh viên, ngay cả khi nó có vẻ \"đúng\".
+3. Khuyến khích sinh viên tương tác với ý tưởng một cách tôn trọng. Đặt ra các câu hỏi dựa trên những điểm trước đó và kết nối các lập luận.
+4. Coi trọng việc khám phá kỹ lưỡng mọi mặt và luận điểm điểm chính hơn là liệt kê hỏi thật nhiều luận điểm điểm, tập trung phân tích một lỗ hổng hoặc điểm mờ hơn là hỏi nhiều luận điểm của sinh viên.
+5. Công cụ chính của AI là những câu hỏi gợi mở, sử dụng câu hỏi để dẫn dắt tư duy, không phải để \"bẫy\" nhóm sinh viên. Câu hỏi phải có tính xây dựng, không mang tính công kích.
+6. Không trực tiếp đưa ra câu trả lời hoặc giải pháp cho nhóm sinh viên, không bày tỏ định kiến.
+7. Bám sát Tài liệu Được Cung cấp: AI phải được đào tạo dựa trên các chủ đề tranh biện cụ thể, tài liệu được nền tảng, nghiên cứu tình huống và quy tắc được cung cấp cho học sinh. Các câu hỏi của nó phải thể hiện sự hiểu biết về bối cảnh này.
+8. AI phải có khả năng xác định các khái niệm nền tảng, các lập luận tiềm ẩn và các điểm xung đột có khả năng xảy ra trong chủ đề, các tài liệu đã cho.
+9. Áp dụng đúng điều tỏ tỏ, không đoán, hỏi đầu. Sử dụng các cụm từ như \"Giúp tôi hiểu...\", \"Bạn có thể giải thích rõ hơn về...\", \"Có cách nào khác để nhìn nhận...\", \"Tôi đang tự hỏi liệu...\"
+10. Ngôn ngữ chính xác & rõ ràng: Đặt câu hỏi ngắn gọn, rõ ràng. Tránh những cụm từ tối nghĩa, biết ngữ trị khi nó đã được định nghĩa rõ ràng và sử dụng trong tài liệu/đào tạo topic.
+11. Cùng có tính cực: Ghi nhận lập luận tốt hoặc câu hỏi sâu sắc từ sinh viên
+12. Tránh ám chỉ một câu trả lời nào là đúng. Thay vì hỏi \"Bạn không nghĩ X rõ ràng là đúng?\", hãy hỏi \"Những lập luận nào ủng hộ X, và những lập luận nào thách thức nó?\".
+--- HẾT HƯỚNG DẪN ---
+
+Dựa trên các luận điểm của sinh viên, hãy đặt ra 1 câu hỏi Socratic sắc bén nhất.
+- Câu hỏi phải mang tính mở, khơi gợi suy nghĩ và phản biện sâu sắc.
+- Câu hỏi không nên là câu hỏi có/không.
+- Câu hỏi phải trực tiếp thách thức giả định hoặc logic cốt lõi nhất trong luận điểm.
+
+Chỉ trả về 1 câu hỏi duy nhất, bắt đầu bằng "1. ". Không thêm bất kỳ lời giải thích nào khác.
+"""
+
+SOCRATIC_SYSTEM_PROMPT = """
+Bạn là một AI sử dụng phương pháp triết học Socrates. Sinh viên đã hỏi bạn một câu hỏi (ở cuối, kèm chủ đề và bối cảnh) và bạn cần trả lời theo phương pháp Socratic thuần túy.
+
+--- HƯỚNG DẪN PHƯƠNG PHÁP SOCRATIC CHO PHIÊN 2B (BẮT BUỘC TUÂN THỦ) ---
+1. **Hướng dẫn, không bác bỏ:** AI giống như bà đỡ ý tưởng (midwife of ideas), hỗ trợ sinh viên khám phá vấn đề sâu hơn thay vì đưa ra câu trả lời trực tiếp.
+
+2. **Trung lập tuyệt đối:** AI phải duy trì sự trung lập hoàn toàn. Không thiên vị bất kỳ quan điểm nào, ngay cả khi có vẻ "đúng".
+
+3. **Tôn trọng và xây dựng:** Ghi nhận câu hỏi tốt của sinh viên, khuyến khích tư duy phản biện một cách tôn trọng.
+
+4. **Tập trung khám phá sâu:** Thay vì trả lời rộng, hãy tập trung vào một khía cạnh cốt lõi của câu hỏi để khám phá kỹ lưỡng.
+
+5. **Sử dụng câu hỏi ngược:** Đây là cốt lõi của phương pháp Socratic - trả lời câu hỏi bằng những câu hỏi sâu sắc khác để dẫn dắt tư duy.
+
+6. **Không đưa ra giải pháp:** Tuyệt đối không đưa ra câu trả lời hoặc kết luận cuối cùng. Vai trò của AI là làm "người đỡ sinh tư tưởng".
+
+7. **Khám phá các giả định tiềm ẩn:** Giúp sinh viên nhận ra những giả định không được nói ra trong câu hỏi của họ.
+
+8. **Ngôn ngữ khiêm tốn:** Sử dụng các cụm từ như "Tôi tò mò về...", "Điều gì khiến bạn nghĩ rằng...", "Liệu có cách nào khác để xem xét...", "Bạn có thể giúp tôi hiểu..."
+
+9. **Kết nối với bối cảnh:** Liên kết câu trả lời với chủ đề tranh luận và bối cảnh MLN (văn hóa, xã hội, đạo đức).
+
+10. **Khuyến khích tự khám phá:** Thúc đẩy sinh viên tự đi đến kết luận thay vì được "cho" câu trả lời.
+--- HẾT HƯỚNG DẪN ---
+
+**NHIỆM VỤ:** Trả lời câu hỏi của sinh viên theo phương pháp Socratic. Câu trả lời phải:
+- Bắt đầu bằng việc ghi nhận câu hỏi (nếu hay)
+- Sử dụng 2-3 câu hỏi ngược để dẫn dắt tư duy
+- Khuyến khích sinh viên khám phá sâu hơn
+- Duy trì sự trung lập và không đưa ra kết luận
+
+Chỉ trả về câu trả lời Socratic, không giải thích thêm.
+"""
+
+EVALUATION_SYSTEM_PROMPT = """
+Bạn là một giám khảo AI cực kỳ nghiêm khắc và công tâm. Công việc của bạn là chấm điểm và nhận xét một phiên debate (dữ liệu phiên debate ở cuối).
+BẠN PHẢI TRẢ LỜI BẰNG MỘT ĐỐI TƯỢNG JSON. KHÔNG GIẢI THÍCH. KHÔNG DÙNG MARKDOWN.
+
+**QUY TẮC CHẤM ĐIỂM NGHIÊM NGẶT:**
+- **Phát hiện câu trả lời kém chất lượng:** Hãy đặc biệt chú ý đến các câu trả lời của sinh viên. Nếu câu trả lời chỉ là một ký tự (ví dụ: 'a', 'b'), một từ vô nghĩa, hoặc rõ ràng là không liên quan đến câu hỏi, hãy cho điểm 0 cho tiêu chí tương ứng.
+- **Không có sự nỗ lực:** Nếu nội dung của sinh viên (luận điểm, câu trả lời, tóm tắt) thể hiện sự thiếu đầu tư nghiêm trọng, điểm số phải phản ánh điều đó (tiệm cận 0).
+- **Chấm điểm dựa trên chất lượng:** Điểm số phải tương xứng với chiều sâu, sự logic, và bằng chứng được cung cấp trong câu trả lời, không chỉ dựa vào việc có trả lời hay không.
+
+Đây là các tiêu chí chấm điểm:
+--- CRITERIA ---
+""" + json.dumps(DEBATE_CRITERIA, ensure_ascii=False, indent=2) + """
+--- END CRITERIA ---
+
+Hãy trả về một đối tượng JSON duy nhất có cấu trúc sau:
+{
+  "scores": {
+    "phase1": { "1.1": <điểm>, "1.2": <điểm>, ... },
+    "phase2": { "2.1": <điểm>, "2.2": <điểm>, ... },
+    "phase3": { "3.1": <điểm>, "3.2": <điểm>, ... },
+    "phase4": { "4.1": <điểm>, "4.2": <điểm>, ... },
+    "phase5": {}
+  },
+  "feedback": "<Nhận xét chi tiết của bạn về lý do tại sao điểm số lại như vậy, chỉ ra các điểm yếu và mạnh một cách cụ thể>"
+}
+"""
+
+def phase_evaluation_system_prompt(phase_key: str) -> str:
+    """Static part of a single phase's scoring prompt: rules, that phase's criteria and the output format"""
+    return f"""
+Bạn là một giám khảo AI cực kỳ nghiêm khắc và công tâm. Hãy chấm điểm RIÊNG {PHASE_EVALUATION_TITLES[phase_key]} của một phiên debate (dữ liệu ở cuối).
+BẠN PHẢI TRẢ LỜI BẰNG MỘT ĐỐI TƯỢNG JSON. KHÔNG GIẢI THÍCH. KHÔNG DÙNG MARKDOWN.
+
+**QUY TẮC CHẤM ĐIỂM NGHIÊM NGẶT:**
+- **Phát hiện câu trả lời kém chất lượng:** Nếu nội dung của sinh viên chỉ là một ký tự, một từ vô nghĩa, hoặc không liên quan, hãy cho điểm 0 cho tiêu chí tương ứng.
+- **Không có sự nỗ lực:** Nếu nội dung thể hiện sự thiếu đầu tư nghiêm trọng, điểm số phải tiệm cận 0.
+- **Chấm điểm dựa trên chất lượng:** Điểm số phải tương xứng với chiều sâu, sự logic, và bằng chứng được cung cấp.
+
+--- CRITERIA ---
+{json.dumps(DEBATE_CRITERIA[phase_key], ensure_ascii=False)}
+--- END CRITERIA ---
+
+Trả về JSON: {{"scores": {{"<id tiêu chí>": <điểm nguyên từ 0 đến max_score>, ...}}, "notes": "<2-3 câu nhận xét điểm mạnh, điểm yếu của phiên này>"}}
+"""
+
 class DebateSystem:
+    model_name = "gemini-2.0-flash"
+
     def __init__(self):
         # Load multiple API keys from environment
         self.api_keys = self._load_multiple_api_keys()
-        self.current_key_index = 0
-        self.failed_keys: Set[int] = set()
-        self.last_reset_time = time.time()
-        self.reset_interval = 3600  # Reset failed keys after 1 hour
+        self.current_key_index = 0  # Key used by the most recent request (for logging/diagnostics)
+        self.reset_interval = 3600  # Park keys for 1 hour when their daily quota is exhausted
         
-        # Initialize with the first working API key
-        self.model = self._create_model_with_failover()
+        # Schedule concurrent requests across every key with per-key RPM/TPM budgets.
+        # Each gunicorn worker has its own pool, so the provider quota is split between them
+        workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+        self.key_pool = KeyPool(
+            len(self.api_keys),
+            rpm_limit=max(1, int(os.getenv("GEMINI_KEY_RPM_LIMIT", "15")) // workers),
+            tpm_limit=max(1, int(os.getenv("GEMINI_KEY_TPM_LIMIT", "1000000")) // workers),
+        )
+        
+        # One lazily built, reused client per API key so failover is a lookup, not a rebuild
+        self.models = ModelRegistry(self._create_model)
+        
+        # Completions of identical prompts can be reused (opt-in per method, see LLM_CACHE)
+        self.cache = self._create_cache()
+        
+        # Every prompt is measured; debate data beyond the budget is trimmed before evaluation
+        self.token_counter = TokenCounter()
+        self.token_usage = TokenUsage()
+        self.evaluation_token_budget = int(os.getenv("EVALUATION_TOKEN_BUDGET", "6000"))
+        
+        # Static instruction blocks are built once and sent as an identical leading system message
+        self.prefixes = PromptPrefixRegistry(self.token_counter)
+        self.prefixes.register("questions", QUESTIONS_SYSTEM_PROMPT)
+        self.prefixes.register("socratic", SOCRATIC_SYSTEM_PROMPT)
+        self.prefixes.register("evaluation", EVALUATION_SYSTEM_PROMPT)
+        for phase_key in PHASE_EVALUATION_TITLES:
+            self.prefixes.register(f"evaluation:{phase_key}", phase_evaluation_system_prompt(phase_key))
         
         logger.info(f"🔑 Initialized DebateSystem with {len(self.api_keys)} API keys")
 
+    @property
+    def failed_keys(self) -> Set[int]:
+        """Keys currently parked after a quota error"""
+        return self.key_pool.parked_keys()
+
     def _load_multiple_api_keys(self) -> List[str]:
         """Load API keys from environment variables"""
         api_keys = []
@@ -101,81 +314,185 @@ class DebateSystem:
         logger.info(f"✅ Loaded {len(api_keys)} valid API keys")
         return api_keys
 
-    def _create_model_with_failover(self) -> ChatGoogleGenerativeAI:
-        """Create a ChatGoogleGenerativeAI model with the current working API key"""
-        if not self.api_keys:
-            raise ValueError("No API keys available")
-            
-        # Reset failed keys if enough time has passed
-        if time.time() - self.last_reset_time > self.reset_interval:
-            self.failed_keys.clear()
-            self.last_reset_time = time.time()
-            logger.info("🔄 Reset failed keys after timeout")
-        
-        # Find next working key
-        attempts = 0
-        while attempts < len(self.api_keys):
-            if self.current_key_index not in self.failed_keys:
-                try:
-                    current_key = self.api_keys[self.current_key_index]
-                    model = ChatGoogleGenerativeAI(
-                        model="gemini-2.0-flash",
-                        temperature=0.7,
-                        api_key=current_key,
-                        convert_system_message_to_human=True
-                    )
-                    logger.info(f"🎯 Using API key #{self.current_key_index + 1}")
-                    return model
-                except Exception as e:
-                    logger.warning(f"⚠️ API key #{self.current_key_index + 1} failed: {str(e)}")
-                    self.failed_keys.add(self.current_key_index)
-            
-            self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-            attempts += 1
-        
-        raise ValueError("❌ All API keys have failed! Please check your keys or wait for quota reset")
+    def _create_cache(self) -> LLMCache:
+        methods = [method.strip() for method in os.getenv("LLM_CACHE", "").split(",") if method.strip()]
+        if methods == ["all"]:
+            methods = list(CACHEABLE_METHODS)
+        unknown = [method for method in methods if method not in CACHEABLE_METHODS]
+        if unknown:
+            logger.warning(f"⚠️ Ignoring unknown LLM_CACHE methods: {', '.join(unknown)}")
+        return LLMCache(
+            methods=[method for method in methods if method in CACHEABLE_METHODS],
+            max_entries=int(os.getenv("LLM_CACHE_SIZE", "1000")),
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL", "3600")),
+            db_path=os.getenv("LLM_CACHE_PATH") or None,
+            namespace=self.model_name,
+        )
 
-    def _invoke_with_failover(self, prompt: str) -> Any:
-        """Invoke the model with automatic failover to next API key on error"""
+    def _create_model(self, key_index: int) -> ChatGoogleGenerativeAI:
+        """Create a ChatGoogleGenerativeAI model bound to one API key"""
+        return ChatGoogleGenerativeAI(
+            model=self.model_name,
+            temperature=0.7,
+            api_key=self.api_keys[key_index],
+            convert_system_message_to_human=True
+        )
+
+    def _model_for_key(self, key_index: int) -> ChatGoogleGenerativeAI:
+        return self.models.get(key_index)
+
+    def _is_connection_error(self, error: Exception) -> bool:
+        """Check if an error means the client's channel is broken and should be rebuilt"""
+        error_msg = str(error).lower()
+        return any(keyword in error_msg for keyword in ['unavailable', 'connection reset', 'connection refused', 'channel closed'])
+
+    def _is_quota_error(self, error: Exception) -> bool:
+        """Check if an API error is a quota/rate limit error"""
+        error_msg = str(error).lower()
+        return any(keyword in error_msg for keyword in ['quota', 'rate limit', 'resource_exhausted', 'too many requests'])
+
+    def _park_key_after_quota_error(self, key_index: int, error: Exception):
+        """Park an exhausted key until its own quota window resets"""
+        retry_after = parse_retry_after(error)
+        error_msg = str(error).lower()
+        if retry_after is None and ('perday' in error_msg or 'per day' in error_msg):
+            retry_after = self.reset_interval
+        self.key_pool.park(key_index, retry_after)
+        logger.warning(f"⏰ API key #{key_index + 1} quota exhausted, dispatching to another key...")
+
+    def _estimate_tokens(self, prompt: Any) -> int:
+        """Prompt token count used to reserve TPM budget before the call"""
+        return max(1, self.token_counter.count(prompt_text(prompt)))
+
+    def _response_tokens(self, response: Any) -> Optional[int]:
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            return usage.get("total_tokens")
+        return None
+
+    def _invoke_with_failover(self, prompt: Prompt, purpose: str = "other", **model_kwargs) -> Any:
+        """Invoke the model on the least-loaded key with automatic failover on quota errors"""
         max_retries = len(self.api_keys)
+        estimated_tokens = self._estimate_tokens(prompt)
         
         for attempt in range(max_retries):
+            key_index = self.key_pool.acquire(estimated_tokens)
+            self.current_key_index = key_index
+            actual_tokens = None
             try:
-                response = self.model.invoke(prompt)
+                response = self._model_for_key(key_index).invoke(prompt, **model_kwargs)
+                actual_tokens = self._response_tokens(response)
+                self.token_usage.record(purpose, estimated_tokens, actual_tokens)
                 return response
                 
             except Exception as e:
-                error_msg = str(e).lower()
-                
                 # Check if this is a quota/rate limit error
-                if any(keyword in error_msg for keyword in ['quota', 'rate limit', 'resource_exhausted', 'too many requests']):
-                    logger.warning(f"⏰ API key #{self.current_key_index + 1} quota exhausted, switching to next key...")
-                    self.failed_keys.add(self.current_key_index)
-                    
-                    # Try next key
-                    self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-                    
-                    # Skip already failed keys
-                    retries = 0
-                    while self.current_key_index in self.failed_keys and retries < len(self.api_keys):
-                        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-                        retries += 1
-                    
-                    if retries >= len(self.api_keys):
-                        raise ValueError("❌ All API keys exhausted! Please wait for quota reset")
-                    
-                    # Create new model with next key
-                    self.model = self._create_model_with_failover()
-                    logger.info(f"🔄 Switched to API key #{self.current_key_index + 1}")
-                    
+                if self._is_quota_error(e):
+                    self._park_key_after_quota_error(key_index, e)
                 else:
                     # For non-quota errors, don't switch keys
                     logger.error(f"❌ API error (not quota): {str(e)}")
+                    if self._is_connection_error(e):
+                        self.models.invalidate(key_index)
                     raise e
+            finally:
+                self.key_pool.release(key_index, estimated_tokens, actual_tokens)
         
         raise ValueError("❌ All API key retry attempts failed!")
 
-    def generate_debate_topic(self, course_code: str) -> str:
+    async def _ainvoke_with_failover(self, prompt: Prompt, purpose: str = "other", **model_kwargs) -> Any:
+        """Async twin of _invoke_with_failover: awaits model.ainvoke so the event loop stays free"""
+        max_retries = len(self.api_keys)
+        estimated_tokens = self._estimate_tokens(prompt)
+        
+        for attempt in range(max_retries):
+            key_index = await self.key_pool.aacquire(estimated_tokens)
+            self.current_key_index = key_index
+            actual_tokens = None
+            try:
+                response = await self._model_for_key(key_index).ainvoke(prompt, **model_kwargs)
+                actual_tokens = self._response_tokens(response)
+                self.token_usage.record(purpose, estimated_tokens, actual_tokens)
+                return response
+                
+            except Exception as e:
+                if self._is_quota_error(e):
+                    self._park_key_after_quota_error(key_index, e)
+                else:
+                    logger.error(f"❌ API error (not quota): {str(e)}")
+                    if self._is_connection_error(e):
+                        self.models.invalidate(key_index)
+                    raise e
+            finally:
+                self.key_pool.release(key_index, estimated_tokens, actual_tokens)
+        
+        raise ValueError("❌ All API key retry attempts failed!")
+
+    async def _astream_with_failover(self, prompt: Prompt, purpose: str = "other"):
+        """Stream text chunks from the model; fails over to another key only before the first chunk"""
+        max_retries = len(self.api_keys)
+        estimated_tokens = self._estimate_tokens(prompt)
+        
+        for attempt in range(max_retries):
+            key_index = await self.key_pool.aacquire(estimated_tokens)
+            self.current_key_index = key_index
+            started = False
+            try:
+                async for chunk in self._model_for_key(key_index).astream(prompt):
+                    text = str(chunk.content)
+                    if text:
+                        started = True
+                        yield text
+                self.token_usage.record(purpose, estimated_tokens)
+                return
+                
+            except Exception as e:
+                # Once tokens reached the client we cannot transparently restart on another key
+                if self._is_quota_error(e) and not started:
+                    self._park_key_after_quota_error(key_index, e)
+                else:
+                    logger.error(f"❌ API streaming error: {str(e)}")
+                    if self._is_connection_error(e):
+                        self.models.invalidate(key_index)
+                    raise e
+            finally:
+                self.key_pool.release(key_index, estimated_tokens)
+        
+        raise ValueError("❌ All API key retry attempts failed!")
+
+    def _complete(self, prompt: Prompt, cache_as: Optional[str] = None, purpose: Optional[str] = None) -> str:
+        """Completion text for prompt, served from the cache when `cache_as` is opted in; `purpose` labels token usage"""
+        cached = self.cache.get(cache_as, prompt_text(prompt)) if cache_as else None
+        if cached is not None:
+            return cached
+        content = str(self._invoke_with_failover(prompt, purpose or cache_as or "other").content)
+        if cache_as:
+            self.cache.put(cache_as, prompt_text(prompt), content)
+        return content
+
+    async def _acomplete(self, prompt: Prompt, cache_as: Optional[str] = None, purpose: Optional[str] = None) -> str:
+        cached = self.cache.get(cache_as, prompt_text(prompt)) if cache_as else None
+        if cached is not None:
+            return cached
+        content = str((await self._ainvoke_with_failover(prompt, purpose or cache_as or "other")).content)
+        if cache_as:
+            self.cache.put(cache_as, prompt_text(prompt), content)
+        return content
+
+    async def _astream_completion(self, prompt: Prompt, cache_as: Optional[str] = None, purpose: Optional[str] = None):
+        """Streamed twin of _acomplete: a cached completion arrives as a single chunk"""
+        cached = self.cache.get(cache_as, prompt_text(prompt)) if cache_as else None
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        async for text in self._astream_with_failover(prompt, purpose or cache_as or "other"):
+            chunks.append(text)
+            yield text
+        if cache_as:
+            self.cache.put(cache_as, prompt_text(prompt), "".join(chunks))
+
+    def _pick_fixed_topic(self, course_code: str) -> Optional[str]:
         topics = []
         if course_code == "MLN111":
             topics = MLN111_TOPICS
@@ -186,14 +503,28 @@ class DebateSystem:
 
         if topics:
             return random.choice(topics)
-        
+        return None
+
+    def generate_debate_topic(self, course_code: str) -> str:
+        topic = self._pick_fixed_topic(course_code)
+        if topic:
+            return topic
+
         prompt = "..." # Fallback prompt
-        response = self._invoke_with_failover(prompt)
+        response = self._invoke_with_failover(prompt, "topic")
         return str(response.content)
 
-    def generate_arguments(self, topic: str, side: str) -> List[str]:
-        import traceback
-        
+    async def agenerate_debate_topic(self, course_code: str) -> str:
+        topic = self._pick_fixed_topic(course_code)
+        if topic:
+            return topic
+
+        prompt = "..." # Fallback prompt
+        response = await self._ainvoke_with_failover(prompt, "topic")
+        return str(response.content)
+
+    def _build_arguments_prompt(self, topic: str, side: str):
+        """Build the argument prompt; returns (prompt, is_counter, stance_type)"""
         # Determine if this is a counter-argument request
         is_counter = "Phản bác" in topic or "phản bác" in topic
         
@@ -266,60 +597,129 @@ Luận điểm {stance_type} 3:
 
 Chỉ trả về ĐÚNG 3 luận điểm theo format trên, không có gì khác.
 """
+        return prompt, is_counter, stance_type
+
+    def _format_argument_block(self, block: str, is_counter: bool, stance_type: str, number: int) -> Optional[str]:
+        """Validate one argument block (text after its header) and format it, or return None"""
+        argument_content = block.strip()
+        if is_counter:
+            # Check block has all required parts
+            if ('- Lập luận phản bác:' in argument_content and 
+                '- Dẫn chứng thực tiễn:' in argument_content and 
+                '- Hệ quả của lỗ hổng:' in argument_content):
+                return f"Luận điểm phản bác {number}:\n{argument_content}"
+        else:
+            # Check block has all required parts
+            if ('- Lập luận:' in argument_content and 
+                '- Dẫn chứng lý thuyết:' in argument_content and 
+                '- Ví dụ:' in argument_content):
+                return f"Luận điểm {stance_type} {number}:\n{argument_content}"
+        return None
+
+    def _parse_arguments(self, content: str, is_counter: bool, stance_type: str) -> List[str]:
+        # Parse based on prompt type
+        final_arguments = []
+        if is_counter:
+            # For counter-arguments, parse using "Luận điểm phản bác X:"
+            argument_blocks = re.split(r'\n\s*Luận điểm phản bác \d+:', content)
+            
+            for i, block in enumerate(argument_blocks):
+                if i == 0:  # Skip first empty block
+                    continue
+                formatted_arg = self._format_argument_block(block, is_counter, stance_type, len(final_arguments) + 1)
+                if formatted_arg:
+                    final_arguments.append(formatted_arg)
+        else:
+            # For stance-based arguments, parse using "Luận điểm {stance_type} X:"
+            argument_pattern = f'Luận điểm {stance_type} \\d+:(.*?)(?=Luận điểm {stance_type} \\d+:|$)'
+            matches = re.findall(argument_pattern, content, re.DOTALL)
+            
+            for i, match in enumerate(matches):
+                formatted_arg = self._format_argument_block(match, is_counter, stance_type, i + 1)
+                if formatted_arg:
+                    final_arguments.append(formatted_arg)
+        
+        # Fallback to simple parsing if structured parsing fails
+        if not final_arguments:
+            argument_parts = re.split(r'\n\s*-\s*', content)
+            final_arguments = [
+                part.strip() for part in argument_parts 
+                if 'Lập luận' in part and ('Dẫn chứng lý thuyết' in part or 'Dẫn chứng thực tiễn' in part)
+            ]
         
+        if not final_arguments:
+            return [content]
+        return final_arguments
+
+    def generate_arguments(self, topic: str, side: str) -> List[str]:
+        prompt, is_counter, stance_type = self._build_arguments_prompt(topic, side)
         try:
-            response = self._invoke_with_failover(prompt)
-            content = str(response.content).strip()
-            
-            # Parse based on prompt type
-            if is_counter:
-                # For counter-arguments, parse using "Luận điểm phản bác X:"
-                argument_blocks = re.split(r'\n\s*Luận điểm phản bác \d+:', content)
-                final_arguments = []
-                
-                for i, block in enumerate(argument_blocks):
-                    if i == 0:  # Skip first empty block
-                        continue
-                    
-                    # Check block has all required parts
-                    if ('- Lập luận phản bác:' in block and 
-                        '- Dẫn chứng thực tiễn:' in block and 
-                        '- Hệ quả của lỗ hổng:' in block):
-                        formatted_arg = f"Luận điểm phản bác {len(final_arguments) + 1}:\n{block.strip()}"
-                        final_arguments.append(formatted_arg)
-            else:
-                # For stance-based arguments, parse using "Luận điểm {stance_type} X:"
-                argument_pattern = f'Luận điểm {stance_type} \\d+:(.*?)(?=Luận điểm {stance_type} \\d+:|$)'
-                matches = re.findall(argument_pattern, content, re.DOTALL)
-                
-                final_arguments = []
-                for i, match in enumerate(matches):
-                    argument_content = match.strip()
-                    
-                    # Check block has all required parts
-                    if ('- Lập luận:' in argument_content and 
-                        '- Dẫn chứng lý thuyết:' in argument_content and 
-                        '- Ví dụ:' in argument_content):
-                        formatted_arg = f"Luận điểm {stance_type} {i+1}:\n{argument_content}"
-                        final_arguments.append(formatted_arg)
+            content = self._complete(prompt, "arguments").strip()
+            return self._parse_arguments(content, is_counter, stance_type)
+        except Exception as e:
+            logger.exception(f"❌ generate_arguments failed: {e}")
+            return [f"[LỖI AI] Không thể sinh luận điểm: {str(e)}"]
+
+    async def agenerate_arguments(self, topic: str, side: str, use_cache: bool = True) -> List[str]:
+        prompt, is_counter, stance_type = self._build_arguments_prompt(topic, side)
+        try:
+            content = (await self._acomplete(prompt, "arguments" if use_cache else None, "arguments")).strip()
+            return self._parse_arguments(content, is_counter, stance_type)
+        except Exception as e:
+            logger.exception(f"❌ agenerate_arguments failed: {e}")
+            return [f"[LỖI AI] Không thể sinh luận điểm: {str(e)}"]
+
+    async def astream_arguments(self, topic: str, side: str):
+        """
+        Stream arguments one by one: each block is parsed and yielded as soon as the
+        next argument header arrives, instead of after the whole completion.
+        """
+        prompt, is_counter, stance_type = self._build_arguments_prompt(topic, side)
+        header_pattern = re.compile(r'Luận điểm phản bác \d+:' if is_counter else f'Luận điểm {stance_type} \\d+:')
+        content = ""
+        buffer = ""
+        blocks_seen = 0
+        emitted = 0
+        
+        def take_block(block: str) -> Optional[str]:
+            nonlocal blocks_seen, emitted
+            blocks_seen += 1
+            number = emitted + 1 if is_counter else blocks_seen
+            formatted_arg = self._format_argument_block(block, is_counter, stance_type, number)
+            if formatted_arg:
+                emitted += 1
+            return formatted_arg
+        
+        try:
+            async for text in self._astream_completion(prompt, "arguments"):
+                content += text
+                buffer += text
+                headers = list(header_pattern.finditer(buffer))
+                # Every block that is followed by another header is complete
+                while len(headers) >= 2:
+                    formatted_arg = take_block(buffer[headers[0].end():headers[1].start()])
+                    if formatted_arg:
+                        yield formatted_arg
+                    buffer = buffer[headers[1].start():]
+                    headers = list(header_pattern.finditer(buffer))
             
-            # Fallback to simple parsing if structured parsing fails
-            if not final_arguments:
-                argument_parts = re.split(r'\n\s*-\s*', content)
-                final_arguments = [
-                    part.strip() for part in argument_parts 
-                    if 'Lập luận' in part and ('Dẫn chứng lý thuyết' in part or 'Dẫn chứng thực tiễn' in part)
-                ]
+            last_header = header_pattern.search(buffer)
+            if last_header:
+                formatted_arg = take_block(buffer[last_header.end():])
+                if formatted_arg:
+                    yield formatted_arg
             
-            if not final_arguments:
-                return [content]
-            return final_arguments
+            # Fallback to the full-text parser if no structured block was recognised
+            if not emitted:
+                for argument in self._parse_arguments(content.strip(), is_counter, stance_type):
+                    yield argument
         except Exception as e:
-            print("[ERROR] generate_arguments exception:", str(e))
-            traceback.print_exc()
-            return [f"[LỖI AI] Không thể sinh luận điểm: {str(e)}"]
+            logger.exception(f"❌ astream_arguments failed: {e}")
+            if not emitted:
+                yield f"[LỖI AI] Không thể sinh luận điểm: {str(e)}"
 
-    def generate_questions(self, arguments: List[str], topic: str) -> List[str]:
+    def _build_questions_prompt(self, arguments: List[str], topic: str) -> Optional[Prompt]:
+        """Build the Socratic question prompt; returns None when no argument is meaningful"""
         # 🔧 RELAXED VALIDATION: More forgiving for test mode
         meaningful_arguments = []
         for arg in arguments:
@@ -332,40 +732,16 @@ Chỉ trả về ĐÚNG 3 luận điểm theo format trên, không có gì khác
         
         # If no meaningful arguments, return generic contextual question
         if not meaningful_arguments:
-            return [f"Bạn có thể trình bày rõ hơn quan điểm của mình về chủ đề '{topic}' không?"]
+            return None
         
         student_args_str = "\n".join(f"- {arg}" for arg in meaningful_arguments)
-        prompt = f"""
-Bạn là AI chuyên gia Socratic questioning. Tạo 1 câu hỏi thông minh, sáng tạo và thách thức dựa trên phản hồi của sinh viên.
-
+        return self.prefixes.compose("questions", f"""
 CHỦ ĐỀ: "{topic}"
 PHẢN HỒI SINH VIÊN:
 {student_args_str}
+""")
 
---- HƯỚNG DẪN PHƯƠNG PHÁP SOCRATIC (BẮT BUỘC TUÂN THỦ) ---
-1. Hướng dẫn, không bác bỏ: AI giống như bà đỡ ý tưởng (midwife of ideas), vai trò chính của AI là hỗ trợ nhóm sinh viên khám lỗ hổng trong lập luận của họ để tiến gần hơn với tri thức đúng, chứ không chỉ đơn giản là khẳng định hay phủ nhận chừng.
-2. Trung lập: AI phải duy trì sự trung lập tuyệt đối đối với nội dung và các lập luận trong cuộc tranh biện. Không bao giờ thiên vị kết luận của mình hay nhóm sinh viên, ngay cả khi nó có vẻ \"đúng\".
-3. Khuyến khích sinh viên tương tác với ý tưởng một cách tôn trọng. Đặt ra các câu hỏi dựa trên những điểm trước đó và kết nối các lập luận.
-4. Coi trọng việc khám phá kỹ lưỡng mọi mặt và luận điểm điểm chính hơn là liệt kê hỏi thật nhiều luận điểm điểm, tập trung phân tích một lỗ hổng hoặc điểm mờ hơn là hỏi nhiều luận điểm của sinh viên.
-5. Công cụ chính của AI là những câu hỏi gợi mở, sử dụng câu hỏi để dẫn dắt tư duy, không phải để \"bẫy\" nhóm sinh viên. Câu hỏi phải có tính xây dựng, không mang tính công kích.
-6. Không trực tiếp đưa ra câu trả lời hoặc giải pháp cho nhóm sinh viên, không bày tỏ định kiến.
-7. Bám sát Tài liệu Được Cung cấp: AI phải được đào tạo dựa trên các chủ đề tranh biện cụ thể, tài liệu được nền tảng, nghiên cứu tình huống và quy tắc được cung cấp cho học sinh. Các câu hỏi của nó phải thể hiện sự hiểu biết về bối cảnh này.
-8. AI phải có khả năng xác định các khái niệm nền tảng, các lập luận tiềm ẩn và các điểm xung đột có khả năng xảy ra trong chủ đề, các tài liệu đã cho.
-9. Áp dụng đúng điều tỏ tỏ, không đoán, hỏi đầu. Sử dụng các cụm từ như \"Giúp tôi hiểu...\", \"Bạn có thể giải thích rõ hơn về...\", \"Có cách nào khác để nhìn nhận...\", \"Tôi đang tự hỏi liệu...\"
-10. Ngôn ngữ chính xác & rõ ràng: Đặt câu hỏi ngắn gọn, rõ ràng. Tránh những cụm từ tối nghĩa, biết ngữ trị khi nó đã được định nghĩa rõ ràng và sử dụng trong tài liệu/đào tạo topic.
-11. Cùng có tính cực: Ghi nhận lập luận tốt hoặc câu hỏi sâu sắc từ sinh viên
-12. Tránh ám chỉ một câu trả lời nào là đúng. Thay vì hỏi \"Bạn không nghĩ X rõ ràng là đúng?\", hãy hỏi \"Những lập luận nào ủng hộ X, và những lập luận nào thách thức nó?\".
---- HẾT HƯỚNG DẪN ---
-
-Dựa trên các luận điểm trên, hãy đặt ra 1 câu hỏi Socratic sắc bén nhất.
-- Câu hỏi phải mang tính mở, khơi gợi suy nghĩ và phản biện sâu sắc.
-- Câu hỏi không nên là câu hỏi có/không.
-- Câu hỏi phải trực tiếp thách thức giả định hoặc logic cốt lõi nhất trong luận điểm.
-
-Chỉ trả về 1 câu hỏi duy nhất, bắt đầu bằng "1. ". Không thêm bất kỳ lời giải thích nào khác.
-"""
-        response = self._invoke_with_failover(prompt)
-        content_str = str(response.content)
+    def _parse_questions(self, content_str: str, topic: str) -> List[str]:
         print("[DEBUG] Gemini raw response:", content_str)
         
         # 🔧 ENHANCED VALIDATION: Multiple extraction methods with validation
@@ -406,90 +782,166 @@ Chỉ trả về 1 câu hỏi duy nhất, bắt đầu bằng "1. ". Không thê
             # Ultimate fallback if AI generates nonsense
             return [f"Bạn có thể giải thích rõ hơn về lập luận cốt lõi của mình trong bối cảnh '{topic}' không?"]
 
-    def generate_socratic_answer(self, student_question: str, topic: str, previous_context: str = "") -> str:
-        """
-        AI trả lời câu hỏi của sinh viên theo phương pháp Socratic trong Phiên 2B
-        """
-        prompt = f"""
-Bạn là một AI sử dụng phương pháp triết học Socrates. Sinh viên đã hỏi bạn một câu hỏi và bạn cần trả lời theo phương pháp Socratic thuần túy.
+    def generate_questions(self, arguments: List[str], topic: str) -> List[str]:
+        prompt = self._build_questions_prompt(arguments, topic)
+        # If no meaningful arguments, return generic contextual question
+        if prompt is None:
+            return [f"Bạn có thể trình bày rõ hơn quan điểm của mình về chủ đề '{topic}' không?"]
+        return self._parse_questions(self._complete(prompt, "questions"), topic)
+
+    async def agenerate_questions(self, arguments: List[str], topic: str) -> List[str]:
+        prompt = self._build_questions_prompt(arguments, topic)
+        if prompt is None:
+            return [f"Bạn có thể trình bày rõ hơn quan điểm của mình về chủ đề '{topic}' không?"]
+        return self._parse_questions(await self._acomplete(prompt, "questions"), topic)
 
+    def _build_socratic_prompt(self, student_question: str, topic: str, previous_context: str = "") -> Prompt:
+        return self.prefixes.compose("socratic", f"""
 Chủ đề tranh luận: "{topic}"
 Câu hỏi của sinh viên: "{student_question}"
 Bối cảnh trước đó: {previous_context}
+""")
 
---- HƯỚNG DẪN PHƯƠNG PHÁP SOCRATIC CHO PHIÊN 2B (BẮT BUỘC TUÂN THỦ) ---
-1. **Hướng dẫn, không bác bỏ:** AI giống như bà đỡ ý tưởng (midwife of ideas), hỗ trợ sinh viên khám phá vấn đề sâu hơn thay vì đưa ra câu trả lời trực tiếp.
-
-2. **Trung lập tuyệt đối:** AI phải duy trì sự trung lập hoàn toàn. Không thiên vị bất kỳ quan điểm nào, ngay cả khi có vẻ "đúng".
+    def generate_socratic_answer(self, student_question: str, topic: str, previous_context: str = "") -> str:
+        """
+        AI trả lời câu hỏi của sinh viên theo phương pháp Socratic trong Phiên 2B
+        """
+        prompt = self._build_socratic_prompt(student_question, topic, previous_context)
+        return self._complete(prompt, "socratic").strip()
 
-3. **Tôn trọng và xây dựng:** Ghi nhận câu hỏi tốt của sinh viên, khuyến khích tư duy phản biện một cách tôn trọng.
+    async def agenerate_socratic_answer(self, student_question: str, topic: str, previous_context: str = "") -> str:
+        prompt = self._build_socratic_prompt(student_question, topic, previous_context)
+        return (await self._acomplete(prompt, "socratic")).strip()
 
-4. **Tập trung khám phá sâu:** Thay vì trả lời rộng, hãy tập trung vào một khía cạnh cốt lõi của câu hỏi để khám phá kỹ lưỡng.
+    async def astream_socratic_answer(self, student_question: str, topic: str, previous_context: str = ""):
+        """Stream the Socratic answer token by token as Gemini produces it"""
+        prompt = self._build_socratic_prompt(student_question, topic, previous_context)
+        async for text in self._astream_completion(prompt, "socratic"):
+            yield text
 
-5. **Sử dụng câu hỏi ngược:** Đây là cốt lõi của phương pháp Socratic - trả lời câu hỏi bằng những câu hỏi sâu sắc khác để dẫn dắt tư duy.
+    def _parse_evaluation(self, content: str) -> Dict[str, Any]:
+        """Parse and check one evaluation reply; raises ValueError saying what has to be repaired"""
+        content = content.strip().replace('```json', '').replace('```', '').strip()
+        data = json.loads(content)  # JSONDecodeError is a ValueError
+        if not isinstance(data, dict) or not isinstance(data.get("scores"), dict):
+            raise ValueError("expected an object with a 'scores' object and a 'feedback' string")
+        data["scores"].setdefault("phase5", {})
+        evaluation = DebateEvaluation.model_validate(data).model_dump()
 
-6. **Không đưa ra giải pháp:** Tuyệt đối không đưa ra câu trả lời hoặc kết luận cuối cùng. Vai trò của AI là làm "người đỡ sinh tư tưởng".
+        problems = []
+        for phase_key in DEBATE_CRITERIA:
+            problems.extend(self._score_problems(phase_key, evaluation["scores"][phase_key]))
+        if problems:
+            raise ValueError("; ".join(problems))
+        return evaluation
 
-7. **Khám phá các giả định tiềm ẩn:** Giúp sinh viên nhận ra những giả định không được nói ra trong câu hỏi của họ.
+    def _score_problems(self, phase_key: str, phase_scores: Dict[str, Any]) -> List[str]:
+        problems = []
+        for criterion in DEBATE_CRITERIA[phase_key]:
+            score = phase_scores.get(criterion['id'])
+            if score is None:
+                problems.append(f"{phase_key} is missing criterion {criterion['id']}")
+            elif not isinstance(score, int) or not 0 <= score <= criterion['max_score']:
+                problems.append(f"{phase_key} criterion {criterion['id']} = {score} is outside 0-{criterion['max_score']}")
+        return problems
 
-8. **Ngôn ngữ khiêm tốn:** Sử dụng các cụm từ như "Tôi tò mò về...", "Điều gì khiến bạn nghĩ rằng...", "Liệu có cách nào khác để xem xét...", "Bạn có thể giúp tôi hiểu..."
+    def _parse_phase_evaluation(self, phase_key: str, content: str) -> Dict[str, Any]:
+        """Parse and check a single phase's scores; raises ValueError like _parse_evaluation"""
+        data = json.loads(content.strip().replace('```json', '').replace('```', '').strip())
+        if not isinstance(data, dict) or not isinstance(data.get("scores"), dict):
+            raise ValueError("expected an object with a 'scores' object and a 'notes' string")
+        scores = {criterion['id']: data["scores"].get(criterion['id']) for criterion in DEBATE_CRITERIA[phase_key]}
+        problems = self._score_problems(phase_key, scores)
+        if problems:
+            raise ValueError("; ".join(problems))
+        return {"scores": scores, "notes": str(data.get("notes") or "")}
 
-9. **Kết nối với bối cảnh:** Liên kết câu trả lời với chủ đề tranh luận và bối cảnh MLN (văn hóa, xã hội, đạo đức).
+    def _fallback_evaluation(self) -> Dict[str, Any]:
+        # Trả về một cấu trúc rỗng nhưng đầy đủ để không làm lỗi UI
+        return {
+            "scores": {
+                "phase1": {criterion['id']: 0 for criterion in DEBATE_CRITERIA.get('phase1', [])},
+                "phase2": {criterion['id']: 0 for criterion in DEBATE_CRITERIA.get('phase2', [])},
+                "phase3": {criterion['id']: 0 for criterion in DEBATE_CRITERIA.get('phase3', [])},
+                "phase4": {criterion['id']: 0 for criterion in DEBATE_CRITERIA.get('phase4', [])},
+                "phase5": {}
+            },
+            "feedback": "Lỗi hệ thống: Không thể phân tích phản hồi từ AI."
+        }
 
-10. **Khuyến khích tự khám phá:** Thúc đẩy sinh viên tự đi đến kết luận thay vì được "cho" câu trả lời.
---- HẾT HƯỚNG DẪN ---
+    def _build_evaluation_repair_prompt(self, content: str, error: Exception,
+                                        criteria: Dict[str, List[Dict[str, Any]]]) -> str:
+        """Short follow-up asking to fix an invalid evaluation, without resending the debate"""
+        return f"""
+Phản hồi chấm điểm JSON dưới đây không hợp lệ: {error}
+--- PHẢN HỒI ---
+{content}
+--- HẾT PHẢN HỒI ---
 
-**NHIỆM VỤ:** Trả lời câu hỏi của sinh viên theo phương pháp Socratic. Câu trả lời phải:
-- Bắt đầu bằng việc ghi nhận câu hỏi (nếu hay)
-- Sử dụng 2-3 câu hỏi ngược để dẫn dắt tư duy
-- Khuyến khích sinh viên khám phá sâu hơn
-- Duy trì sự trung lập và không đưa ra kết luận
+Tiêu chí chấm điểm:
+{json.dumps(criteria, ensure_ascii=False)}
 
-Chỉ trả về câu trả lời Socratic, không giải thích thêm.
+Hãy trả về lại đúng một đối tượng JSON đã sửa: mỗi tiêu chí của {", ".join(criteria)} có đúng một điểm số nguyên từ 0 đến max_score, giữ nguyên điểm hợp lệ và phần nhận xét.
 """
-        response = self._invoke_with_failover(prompt)
-        return str(response.content).strip()
 
-    def evaluate_debate_detailed(self, debate_data: Dict[str, Any]) -> Dict[str, Any]:
-        def clean_and_parse_json(content: str) -> Dict[str, Any]:
-            content = content.strip().replace('```json', '').replace('```', '').strip()
+    def _evaluation_failed(self, content: str, error: Exception, attempt: int,
+                           criteria: Dict[str, List[Dict[str, Any]]] = DEBATE_CRITERIA) -> Optional[str]:
+        """Log an invalid evaluation; returns the repair prompt, or None once retries are used up"""
+        logger.warning(f"⚠️ Invalid evaluation (attempt {attempt + 1}/{EVALUATION_REPAIR_ATTEMPTS + 1}): {error}")
+        if attempt >= EVALUATION_REPAIR_ATTEMPTS:
+            print(f"--- DEBUG: FAILED TO PARSE JSON ---\n{content}\n------------------------------------")
+            return None
+        return self._build_evaluation_repair_prompt(content, error, criteria)
+
+    async def _aevaluate_json(self, prompt: Prompt, json_mode: Dict[str, Any], parse,
+                              criteria: Dict[str, List[Dict[str, Any]]], purpose: str) -> Optional[Dict[str, Any]]:
+        """JSON-mode call with bounded repair retries; None if the call failed or no valid reply was produced"""
+        for attempt in range(EVALUATION_REPAIR_ATTEMPTS + 1):
+            try:
+                content = str((await self._ainvoke_with_failover(prompt, purpose, **json_mode)).content)
+            except Exception:
+                # Quota exhausted on every key, transport errors, ...: callers fall back like for a bad reply
+                logger.exception(f"❌ {purpose} call failed")
+                return None
             try:
-                return json.loads(content)
-            except json.JSONDecodeError:
-                print(f"--- DEBUG: FAILED TO PARSE JSON ---\n{content}\n------------------------------------")
-                # Trả về một cấu trúc rỗng nhưng đầy đủ để không làm lỗi UI
-                return {
-                    "scores": {
-                        "phase1": {criterion['id']: 0 for criterion in DEBATE_CRITERIA.get('phase1', [])},
-                        "phase2": {criterion['id']: 0 for criterion in DEBATE_CRITERIA.get('phase2', [])},
-                        "phase3": {criterion['id']: 0 for criterion in DEBATE_CRITERIA.get('phase3', [])},
-                        "phase4": {criterion['id']: 0 for criterion in DEBATE_CRITERIA.get('phase4', [])},
-                        "phase5": {}
-                    },
-                    "feedback": "Lỗi hệ thống: Không thể phân tích phản hồi từ AI."
-                }
-
-        # Định dạng lại lịch sử debate cho dễ đọc
-        turns_history = "\n".join([
+                return parse(content)
+            except ValueError as e:
+                prompt = self._evaluation_failed(content, e, attempt, criteria)
+        return None
+
+    def _turn_lines(self, turns: List[Dict[str, Any]]) -> List[str]:
+        return [
             f"- Lượt {t.get('turn', '')}: AI hỏi \"{t.get('question', '')}\" | SV trả lời \"{t.get('answer', '')}\""
-            for t in debate_data.get('turns', [])
-        ])
+            for t in turns
+        ]
 
-        # Xây dựng prompt có cấu trúc rõ ràng
-        student_args_str = "- " + "\n- ".join(debate_data.get('team_arguments', []))
-        ai_args_str = "- " + "\n- ".join(debate_data.get('ai_arguments', []))
-        conclusion_str = "- " + "\n- ".join(debate_data.get('conclusion', []))
-        ai_counter_str = "- " + "\n- ".join(debate_data.get('ai_counter_arguments', []))
-        
-        prompt = f"""
-Bạn là một giám khảo AI cực kỳ nghiêm khắc và công tâm. Công việc của bạn là chấm điểm và nhận xét một phiên debate.
-BẠN PHẢI TRẢ LỜI BẰNG MỘT ĐỐI TƯỢNG JSON. KHÔNG GIẢI THÍCH. KHÔNG DÙNG MARKDOWN.
+    def _fit_debate_sections(self, sections: Dict[str, List[str]], purpose: str) -> Dict[str, List[str]]:
+        """Trim debate data that would push the prompt past EVALUATION_TOKEN_BUDGET"""
+        fitted, trimmed = fit_sections(self.token_counter, sections, self.evaluation_token_budget, DEBATE_DATA_TRIM_ORDER)
+        if trimmed:
+            self.token_usage.record_trim(purpose)
+            logger.info(f"✂️ Trimmed {', '.join(trimmed)} to fit the {purpose} prompt in {self.evaluation_token_budget} tokens")
+        return fitted
 
-**QUY TẮC CHẤM ĐIỂM NGHIÊM NGẶT:**
-- **Phát hiện câu trả lời kém chất lượng:** Hãy đặc biệt chú ý đến các câu trả lời của sinh viên. Nếu câu trả lời chỉ là một ký tự (ví dụ: 'a', 'b'), một từ vô nghĩa, hoặc rõ ràng là không liên quan đến câu hỏi, hãy cho điểm 0 cho tiêu chí tương ứng.
-- **Không có sự nỗ lực:** Nếu nội dung của sinh viên (luận điểm, câu trả lời, tóm tắt) thể hiện sự thiếu đầu tư nghiêm trọng, điểm số phải phản ánh điều đó (tiệm cận 0).
-- **Chấm điểm dựa trên chất lượng:** Điểm số phải tương xứng với chiều sâu, sự logic, và bằng chứng được cung cấp trong câu trả lời, không chỉ dựa vào việc có trả lời hay không.
+    def _build_evaluation_prompt(self, debate_data: Dict[str, Any]) -> Prompt:
+        # Định dạng lại lịch sử debate cho dễ đọc, cắt bớt nếu vượt giới hạn token
+        sections = self._fit_debate_sections({
+            "team_arguments": debate_data.get('team_arguments', []),
+            "ai_arguments": debate_data.get('ai_arguments', []),
+            "turns": self._turn_lines(debate_data.get('turns', [])),
+            "conclusion": debate_data.get('conclusion', []),
+            "ai_counter_arguments": debate_data.get('ai_counter_arguments', []),
+            "student_summary": [str(debate_data.get('student_summary', 'N/A'))],
+        }, "evaluation")
+        turns_history = "\n".join(sections["turns"])
 
+        # Xây dựng prompt có cấu trúc rõ ràng
+        student_args_str = "- " + "\n- ".join(sections["team_arguments"])
+        ai_args_str = "- " + "\n- ".join(sections["ai_arguments"])
+        conclusion_str = "- " + "\n- ".join(sections["conclusion"])
+        ai_counter_str = "- " + "\n- ".join(sections["ai_counter_arguments"])
+        
+        return self.prefixes.compose("evaluation", f"""
 Đây là dữ liệu phiên debate:
 --- DEBATE DATA ---
 Topic: {debate_data.get('topic', 'N/A')}
@@ -498,32 +950,120 @@ AI Arguments (Phase 1): {ai_args_str}
 Debate History (Phase 2-3): {turns_history}
 Student Conclusion (Phase 4): {conclusion_str}
 AI Counter-Arguments (Phase 4): {ai_counter_str}
-Student Summary: {debate_data.get('student_summary', 'N/A')}
+Student Summary: {sections['student_summary'][0]}
 --- END DEBATE DATA ---
+""")
 
-Đây là các tiêu chí chấm điểm:
---- CRITERIA ---
-{json.dumps(DEBATE_CRITERIA, ensure_ascii=False, indent=2)}
---- END CRITERIA ---
+    def evaluate_debate_detailed(self, debate_data: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = self._build_evaluation_prompt(debate_data)
+        for attempt in range(EVALUATION_REPAIR_ATTEMPTS + 1):
+            try:
+                content = str(self._invoke_with_failover(prompt, "evaluation", **EVALUATION_JSON_MODE).content)
+            except Exception:
+                logger.exception("❌ evaluation call failed")
+                break
+            try:
+                return self._parse_evaluation(content)
+            except ValueError as e:
+                prompt = self._evaluation_failed(content, e, attempt)
+        return self._fallback_evaluation()
 
-Hãy trả về một đối tượng JSON duy nhất có cấu trúc sau:
-{{
-  "scores": {{
-    "phase1": {{ "1.1": <điểm>, "1.2": <điểm>, ... }},
-    "phase2": {{ "2.1": <điểm>, "2.2": <điểm>, ... }},
-    "phase3": {{ "3.1": <điểm>, "3.2": <điểm>, ... }},
-    "phase4": {{ "4.1": <điểm>, "4.2": <điểm>, ... }},
-    "phase5": {{}}
-  }},
-  "feedback": "<Nhận xét chi tiết của bạn về lý do tại sao điểm số lại như vậy, chỉ ra các điểm yếu và mạnh một cách cụ thể>"
-}}
+    async def aevaluate_debate_detailed(self, debate_data: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = self._build_evaluation_prompt(debate_data)
+        evaluation = await self._aevaluate_json(
+            prompt, EVALUATION_JSON_MODE, self._parse_evaluation, DEBATE_CRITERIA, "evaluation"
+        )
+        return evaluation or self._fallback_evaluation()
+
+    def _format_phase_data(self, phase_key: str, phase_data: Dict[str, Any]) -> str:
+        def bullets(items: List[str]) -> str:
+            return "- " + "\n- ".join(items) if items else "(không có)"
+
+        sections = {
+            "team_arguments": phase_data.get('team_arguments', []),
+            "ai_arguments": phase_data.get('ai_arguments', []),
+            "turns": self._turn_lines(phase_data.get('turns', [])),
+            "phase3_turns": [
+                f"- SV hỏi \"{t.get('question', '')}\"" if t.get('asker') == 'student' else f"- AI trả lời \"{t.get('answer', '')}\""
+                for t in phase_data.get('phase3_turns', [])
+            ],
+            "conclusion": phase_data.get('conclusion', []),
+            "ai_counter_arguments": phase_data.get('ai_counter_arguments', []),
+            "student_summary": [phase_data.get('student_summary') or 'N/A'] if phase_key == "phase4" else [],
+        }
+        sections = self._fit_debate_sections(sections, f"evaluation:{phase_key}")
+
+        if phase_key == "phase1":
+            return (f"Student Arguments: {bullets(sections['team_arguments'])}\n"
+                    f"AI Arguments: {bullets(sections['ai_arguments'])}")
+        if phase_key == "phase2":
+            return "Debate History:\n" + ("\n".join(sections['turns']) or "(không có)")
+        if phase_key == "phase3":
+            return "Debate History:\n" + ("\n".join(sections['phase3_turns']) or "(không có)")
+        return (f"Student Conclusion: {bullets(sections['conclusion'])}\n"
+                f"AI Counter-Arguments: {bullets(sections['ai_counter_arguments'])}\n"
+                f"Student Summary: {sections['student_summary'][0]}")
+
+    def _build_phase_evaluation_prompt(self, phase_key: str, phase_data: Dict[str, Any]) -> Prompt:
+        return self.prefixes.compose(f"evaluation:{phase_key}", f"""
+--- DEBATE DATA ---
+Topic: {phase_data.get('topic', 'N/A')}
+{self._format_phase_data(phase_key, phase_data)}
+--- END DEBATE DATA ---
+""")
+
+    async def aevaluate_phase(self, phase_key: str, phase_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Score one closed phase: {"scores": {criterion id: score}, "notes": str}, or None if no valid reply"""
+        prompt = self._build_phase_evaluation_prompt(phase_key, phase_data)
+        return await self._aevaluate_json(
+            prompt,
+            phase_evaluation_json_mode(phase_key),
+            lambda content: self._parse_phase_evaluation(phase_key, content),
+            {phase_key: DEBATE_CRITERIA[phase_key]},
+            f"evaluation:{phase_key}"
+        )
+
+    def _build_feedback_prompt(self, topic: str, phase_results: Dict[str, Dict[str, Any]]) -> str:
+        phases = "\n".join(
+            f"- {PHASE_EVALUATION_TITLES[phase_key]}: {sum(result['scores'].values())}/"
+            f"{sum(criterion['max_score'] for criterion in DEBATE_CRITERIA[phase_key])} điểm. {result.get('notes', '')}"
+            for phase_key, result in phase_results.items()
+        )
+        return f"""
+Bạn là giám khảo AI của một phiên debate về chủ đề "{topic}". Các phiên đã được chấm điểm như sau:
+{phases}
+
+Hãy viết nhận xét tổng kết chi tiết cho nhóm sinh viên: giải thích vì sao điểm số như vậy, chỉ ra các điểm mạnh và điểm yếu cụ thể, và gợi ý cách cải thiện. Chỉ trả về đoạn nhận xét, không dùng markdown.
 """
-        response = self._invoke_with_failover(prompt)
-        return clean_and_parse_json(str(response.content))
+
+    async def agenerate_feedback(self, topic: str, phase_results: Dict[str, Dict[str, Any]]) -> str:
+        """Final feedback from the per-phase scores and notes (the small Phase 5 call)"""
+        return (await self._acomplete(self._build_feedback_prompt(topic, phase_results), purpose="feedback")).strip()
+
+def format_turns(turns: List[Dict[str, Any]], since: int = 0) -> List[Dict[str, Any]]:
+    """Turns from position `since` on, in the shape the turn endpoints return"""
+    return [{
+        "asker": turn.get("asker", "unknown"),
+        "question": turn.get("question", ""),
+        "answer": turn.get("answer"),
+        "turn_number": idx + 1
+    } for idx, turn in enumerate(turns[since:], since)]
+
 
 class DebateSession:
+    # Plain-data attributes persisted by the session store (everything except debate_system)
+    SERIALIZED_FIELDS = (
+        "team_id", "topic", "members", "course_code", "current_phase",
+        "team_arguments", "ai_arguments", "questions", "responses",
+        "turns", "phase3_turns", "chat_history", "student_summary", "ai_summary",
+        "conclusion", "ai_counter_arguments", "evaluation", "phase_scores",
+    )
+
     def __init__(self, debate_system: DebateSystem = None):
         self.debate_system = debate_system or DebateSystem()
+        self._reset_state()
+
+    def _reset_state(self):
         self.team_id: str = ""
         self.topic: str = ""
         self.members: List[str] = []
@@ -541,11 +1081,40 @@ class DebateSession:
         self.conclusion: List[str] = []  # Phase 4: Student conclusion
         self.ai_counter_arguments: List[str] = []  # Phase 4: AI counter-arguments
         self.evaluation: Optional[Dict[str, Any]] = None
+        # Partial scores of closed phases: {"phase1": {"scores", "notes", "input_hash"}, ...}
+        self.phase_scores: Dict[str, Dict[str, Any]] = {}
+        self._index_turns()
+
+    def _index_turns(self):
+        """Rebuild the turn-pair views from the turn lists (after a reset or a restore)"""
+        self.phase2_pairs = Phase2TurnPairs(self.turns)
+        self.phase3_pairs = Phase3TurnPairs(self.phase3_turns)
+
+    def to_dict(self, turn_pairs: bool = False) -> Dict[str, Any]:
+        """Serializable snapshot of the session state; turn_pairs adds the derived pair views (for reports)"""
+        data = {field: getattr(self, field) for field in self.SERIALIZED_FIELDS}
+        if turn_pairs:
+            data["phase2_pairs"] = self.phase2_pairs.pairs
+            data["phase3_pairs"] = self.phase3_pairs.pairs
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], debate_system: Optional[DebateSystem] = None) -> "DebateSession":
+        """Restore a session from to_dict() output without requiring API keys"""
+        session = cls.__new__(cls)
+        session.debate_system = debate_system
+        session._reset_state()
+        for field in cls.SERIALIZED_FIELDS:
+            if field in data:
+                setattr(session, field, data[field])
+        session._index_turns()
+        return session
 
     def add_turn(self, asker: str, question: str, answer: Optional[str] = None):
         """Add turn to Phase 2 (AI asks, Student answers)"""
         turn_data = {"turn": len(self.turns) + 1, "asker": asker, "question": question, "answer": answer}
         self.turns.append(turn_data)
+        self.phase2_pairs.add(turn_data)
         
         # 🔧 DEBUG: Log turn data to track saving
         print(f"🔧 DEBUG add_turn: Added {asker} turn #{turn_data['turn']}")
@@ -560,6 +1129,7 @@ class DebateSession:
         """Add turn to Phase 3 (Student asks, AI answers)"""
         turn_data = {"turn": len(self.phase3_turns) + 1, "asker": asker, "question": question, "answer": answer}
         self.phase3_turns.append(turn_data)
+        self.phase3_pairs.add(turn_data)
         # 🚫 REMOVED: chat_history to prevent data mixing
         # self.chat_history.append({"phase": 3, "role": asker, "content": f"Q: {question}\nA: {answer if answer else ''}"})
 
@@ -570,6 +1140,13 @@ class DebateSession:
         self.current_phase = "Phase 1: Arguments"
         return self.topic
 
+    async def astart_debate(self, course_code: str, members: List[str]) -> str:
+        self.topic = await self.debate_system.agenerate_debate_topic(course_code=course_code)
+        self.course_code = course_code
+        self.members = members
+        self.current_phase = "Phase 1: Arguments"
+        return self.topic
+
     def phase1_arguments(self) -> List[str]:
         self.ai_arguments = self.debate_system.generate_arguments(self.topic, "AI")
         return self.ai_arguments
@@ -578,11 +1155,9 @@ class DebateSession:
         self.questions = self.debate_system.generate_questions(self.team_arguments, self.topic)
         return self.questions
 
-    def evaluate_debate(self) -> Dict[str, Any]:
-        """
-        Gathers all debate data and calls the evaluation system.
-        """
-        debate_data = {
+    def _evaluation_data(self) -> Dict[str, Any]:
+        """Gathers all debate data for the evaluation system"""
+        return {
             "topic": self.topic,
             "team_arguments": self.team_arguments,
             "ai_arguments": self.ai_arguments,
@@ -592,6 +1167,27 @@ class DebateSession:
             "conclusion": self.conclusion,
             "ai_counter_arguments": self.ai_counter_arguments
         }
-        
-        self.evaluation = self.debate_system.evaluate_debate_detailed(debate_data)
+
+    def phase_evaluation_data(self, phase_key: str) -> Dict[str, Any]:
+        """The part of the debate a single phase is scored on"""
+        fields = {
+            "phase1": ("team_arguments", "ai_arguments"),
+            "phase2": ("turns",),
+            "phase3": ("phase3_turns",),
+            "phase4": ("conclusion", "ai_counter_arguments", "student_summary"),
+        }[phase_key]
+        data = {"topic": self.topic}
+        data.update({field: getattr(self, field) for field in fields})
+        return data
+
+    def evaluate_debate(self) -> Dict[str, Any]:
+        """
+        Gathers all debate data and calls the evaluation system.
+        """
+        self.evaluation = self.debate_system.evaluate_debate_detailed(self._evaluation_data())
+        return self.evaluation
+
+    async def aevaluate_debate(self) -> Dict[str, Any]:
+        """Whole-debate evaluation in one call; Phase 5's fallback when no phase was scored ahead"""
+        self.evaluation = await self.debate_system.aevaluate_debate_detailed(self._evaluation_data())
         return self.evaluation 
\ No newline at end of file
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class KeyState:
+    """Runtime state for one Gemini API key"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.in_flight = 0
+        self.request_times: Deque[float] = deque()  # Start time of each request in the window
+        self.token_log: Deque[Tuple[float, int]] = deque()  # (timestamp, tokens) in the window
+        self.tokens_in_window = 0
+        self.parked_until = 0.0
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.quota_errors = 0
+
+
+class KeyPool:
+    """
+    Dispatches concurrent LLM requests across all healthy API keys.
+
+    Each request picks the key with the fewest requests in flight among the keys
+    that still have RPM/TPM budget in the current sliding window. Keys that hit a
+    quota error are parked until their own window resets instead of a global timer.
+    """
+
+    def __init__(self, num_keys: int, rpm_limit: int = 15, tpm_limit: int = 1_000_000,
+                 window_seconds: float = 60.0, default_park_seconds: float = 60.0,
+                 max_wait_seconds: float = 30.0):
+        if num_keys <= 0:
+            raise ValueError("KeyPool needs at least one API key")
+        self.keys = [KeyState(i) for i in range(num_keys)]
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.window_seconds = window_seconds
+        self.default_park_seconds = default_park_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+
+    def _prune(self, key: KeyState, now: float):
+        """Drop requests/tokens that have left the sliding window"""
+        cutoff = now - self.window_seconds
+        while key.request_times and key.request_times[0] <= cutoff:
+            key.request_times.popleft()
+        while key.token_log and key.token_log[0][0] <= cutoff:
+            _, tokens = key.token_log.popleft()
+            key.tokens_in_window -= tokens
+
+    def _has_budget(self, key: KeyState, estimated_tokens: int) -> bool:
+        if len(key.request_times) >= self.rpm_limit:
+            return False
+        # Always let a request through on an idle key, even if it alone exceeds the TPM budget
+        if key.tokens_in_window and key.tokens_in_window + estimated_tokens > self.tpm_limit:
+            return False
+        return True
+
+    def try_acquire(self, estimated_tokens: int = 0) -> Optional[int]:
+        """Reserve the least-loaded healthy key, or return None if every key is busy/exhausted"""
+        with self._lock:
+            now = time.time()
+            best: Optional[KeyState] = None
+            for key in self.keys:
+                if key.parked_until > now:
+                    continue
+                self._prune(key, now)
+                if not self._has_budget(key, estimated_tokens):
+                    continue
+                if best is None or (key.in_flight, len(key.request_times)) < (best.in_flight, len(best.request_times)):
+                    best = key
+            if best is None:
+                return None
+
+            best.in_flight += 1
+            best.total_requests += 1
+            best.request_times.append(now)
+            if estimated_tokens:
+                best.token_log.append((now, estimated_tokens))
+                best.tokens_in_window += estimated_tokens
+            return best.index
+
+    def next_available_in(self) -> float:
+        """Seconds until some key is expected to free up budget"""
+        with self._lock:
+            now = time.time()
+            waits = []
+            for key in self.keys:
+                if key.parked_until > now:
+                    waits.append(key.parked_until - now)
+                    continue
+                self._prune(key, now)
+                oldest = []
+                if key.request_times:
+                    oldest.append(key.request_times[0])
+                if key.token_log:
+                    oldest.append(key.token_log[0][0])
+                if oldest:
+                    waits.append(max(0.0, min(oldest) + self.window_seconds - now))
+                else:
+                    waits.append(0.0)
+            return min(waits) if waits else 0.0
+
+    def acquire(self, estimated_tokens: int = 0) -> int:
+        """Blocking acquire for the sync invocation path"""
+        deadline = time.time() + self.max_wait_seconds
+        while True:
+            index = self.try_acquire(estimated_tokens)
+            if index is not None:
+                return index
+            wait = self.next_available_in()
+            if time.time() + wait > deadline:
+                raise ValueError("❌ All API keys exhausted! Please wait for quota reset")
+            time.sleep(min(max(wait, 0.05), 1.0))
+
+    async def aacquire(self, estimated_tokens: int = 0) -> int:
+        """Async acquire: waits on the event loop instead of blocking it"""
+        deadline = time.time() + self.max_wait_seconds
+        while True:
+            index = self.try_acquire(estimated_tokens)
+            if index is not None:
+                return index
+            wait = self.next_available_in()
+            if time.time() + wait > deadline:
+                raise ValueError("❌ All API keys exhausted! Please wait for quota reset")
+            await asyncio.sleep(min(max(wait, 0.05), 1.0))
+
+    def release(self, index: int, estimated_tokens: int = 0, actual_tokens: Optional[int] = None):
+        """Return a key after a request; corrects the TPM estimate with the real usage when known"""
+        with self._lock:
+            key = self.keys[index]
+            key.in_flight = max(0, key.in_flight - 1)
+            tokens = actual_tokens if actual_tokens is not None else estimated_tokens
+            key.total_tokens += tokens
+            delta = tokens - estimated_tokens
+            if delta:
+                key.token_log.append((time.time(), delta))
+                key.tokens_in_window += delta
+
+    def park(self, index: int, seconds: Optional[float] = None):
+        """Take a key out of rotation until its quota window resets"""
+        with self._lock:
+            key = self.keys[index]
+            key.quota_errors += 1
+            key.parked_until = max(key.parked_until, time.time() + (seconds or self.default_park_seconds))
+        logger.warning(f"⏰ API key #{index + 1} parked for {seconds or self.default_park_seconds:.0f}s")
+
+    def has_spare_capacity(self) -> bool:
+        """True when some key is idle with at least half of its RPM window unused (for background work)"""
+        with self._lock:
+            now = time.time()
+            for key in self.keys:
+                if key.parked_until > now:
+                    continue
+                self._prune(key, now)
+                if key.in_flight == 0 and len(key.request_times) * 2 < self.rpm_limit:
+                    return True
+            return False
+
+    def parked_keys(self) -> set:
+        now = time.time()
+        with self._lock:
+            return {key.index for key in self.keys if key.parked_until > now}
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            result = []
+            for key in self.keys:
+                self._prune(key, now)
+                result.append({
+                    "key": key.index + 1,
+                    "in_flight": key.in_flight,
+                    "requests_in_window": len(key.request_times),
+                    "tokens_in_window": key.tokens_in_window,
+                    "parked_for_seconds": round(max(0.0, key.parked_until - now), 1),
+                    "total_requests": key.total_requests,
+                    "total_tokens": key.total_tokens,
+                    "quota_errors": key.quota_errors,
+                })
+            return result
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """Extract the provider's suggested retry delay (seconds) from a quota error message"""
+    message = str(error)
+    match = re.search(r'retry[_ ]delay\s*\{\s*seconds:\s*(\d+)', message)
+    if not match:
+        match = re.search(r'retry in ([\d.]+)\s*s', message, re.IGNORECASE)
+    if match:
+        return float(match.group(1)) + 1.0
+    return None
@@ -0,0 +1,113 @@
+import bisect
+import logging
+import threading
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_SCORE = 125
+
+# Buckets of the rank distribution shown on the admin dashboard, see rank_bucket()
+RANK_BUCKETS = ("Platinum", "Gold", "Silver", "Bronze")
+
+
+def rank_bucket(total_score: float) -> str:
+    if total_score > 95:
+        return "Platinum"
+    if total_score >= 80:
+        return "Gold"
+    if total_score >= 60:
+        return "Silver"
+    return "Bronze"
+
+
+def leaderboard_entry(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Score one completed session the way the leaderboard shows it (position is filled in by top())"""
+    evaluation = session.get("evaluation") or {}
+    scores = evaluation.get("scores") or {}
+
+    total_score = 0
+    phase_scores = {}
+    for phase, phase_scores_dict in scores.items():
+        if isinstance(phase_scores_dict, dict):
+            phase_total = sum(phase_scores_dict.values())
+            phase_scores[phase] = phase_total
+            total_score += phase_total
+
+    return {
+        "position": 0,
+        "team_id": session.get("team_id"),
+        "course_code": session.get("course_code", "MLN111"),
+        "topic": session.get("topic"),
+        "members": session.get("members", []),
+        "total_score": total_score,
+        "max_score": MAX_SCORE,
+        "percentage": min(100, (total_score / MAX_SCORE) * 100) if total_score > 0 else 0,
+        "rank_level": "Gold Level" if total_score > 80 else "Silver Level",
+        "phase_scores": phase_scores,
+        "completed_at": session.get("completed_at", "2024-01-01T00:00:00")
+    }
+
+
+class Leaderboard:
+    """
+    Leaderboard over completed sessions, maintained incrementally.
+
+    Entries live in a list kept sorted by (-total_score, completion sequence), so ties
+    keep completion order like the old stable sort. The running sum and the rank
+    histogram are adjusted on every add/remove, which makes reading the top k and the
+    statistics O(k) no matter how many sessions have been archived.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Tuple[float, int, str], Dict[str, Any]]] = {}
+        self._order: List[Tuple[float, int, str]] = []
+        self._sequence = 0
+        self._score_sum = 0.0
+        self._histogram = {bucket: 0 for bucket in RANK_BUCKETS}
+
+    def _remove_locked(self, session_key: str):
+        existing = self._entries.pop(session_key, None)
+        if existing is None:
+            return
+        sort_key, entry = existing
+        index = bisect.bisect_left(self._order, sort_key)
+        if index < len(self._order) and self._order[index] == sort_key:
+            del self._order[index]
+        self._score_sum -= entry["total_score"]
+        self._histogram[rank_bucket(entry["total_score"])] -= 1
+
+    def update(self, session_key: str, session: Optional[Dict[str, Any]]):
+        """Session store listener: add/replace a completed session, or remove it when session is None"""
+        entry = leaderboard_entry(session) if session is not None else None
+        with self._lock:
+            self._remove_locked(session_key)
+            if entry is None:
+                return
+            self._sequence += 1
+            sort_key = (-entry["total_score"], self._sequence, session_key)
+            bisect.insort(self._order, sort_key)
+            self._entries[session_key] = (sort_key, entry)
+            self._score_sum += entry["total_score"]
+            self._histogram[rank_bucket(entry["total_score"])] += 1
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            result = []
+            for position, sort_key in enumerate(islice(self._order, limit), start=1):
+                entry = dict(self._entries[sort_key[2]][1])
+                entry["position"] = position
+                result.append(entry)
+            return result
+
+    def statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            count = len(self._order)
+            return {
+                "total_teams": count,
+                "average_score": self._score_sum / count if count else 0,
+                "highest_score": -self._order[0][0] if count else 0,
+                "rank_distribution": dict(self._histogram)
+            }
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Methods whose completions may be cached (see LLM_CACHE in the .env template)
+CACHEABLE_METHODS = ("arguments", "questions", "socratic")
+
+
+def prompt_key(namespace: str, prompt: str) -> str:
+    """Content address of one completion: the same namespace and prompt always map to the same key"""
+    return hashlib.sha256(f"{namespace}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Prompt-hash keyed cache of raw model completions.
+
+    Entries are kept in an LRU bounded to `max_entries` and expire `ttl_seconds`
+    after they were written. Only the methods listed in `methods` are cached, so a
+    method stays live until it is opted in. With `db_path` set, entries are also
+    written to a small SQLite table and survive restarts, which lets repeated load
+    tests and demo sessions replay without spending quota. `namespace` (the model
+    name) is part of every key, so switching models never serves old completions.
+    """
+
+    def __init__(self, methods: Iterable[str] = (), max_entries: int = 1000, ttl_seconds: float = 3600.0,
+                 db_path: Optional[str] = None, namespace: str = ""):
+        self.namespace = namespace
+        self.methods = set(methods)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits: Dict[str, int] = {method: 0 for method in self.methods}
+        self.misses: Dict[str, int] = {method: 0 for method in self.methods}
+        self.evictions = 0
+
+        if db_path and self.methods:
+            try:
+                self._conn = sqlite3.connect(db_path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA busy_timeout=5000")
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS llm_cache (
+                        key TEXT PRIMARY KEY,
+                        method TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                """)
+                self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - ttl_seconds,))
+                self._conn.commit()
+                logger.info(f"💾 LLM cache persisted to {db_path}")
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ LLM cache disk store unavailable ({e}), caching in memory only")
+                self._conn = None
+
+        if self.methods:
+            logger.info(f"🗃️ LLM cache enabled for {', '.join(sorted(self.methods))} "
+                        f"({max_entries} entries, ttl {ttl_seconds:.0f}s)")
+
+    def enabled(self, method: str) -> bool:
+        return method in self.methods and self.max_entries > 0
+
+    def _load_from_disk(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        if self._conn is None:
+            return None
+        try:
+            row = self._conn.execute("SELECT created_at, value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ LLM cache disk read failed: {e}")
+            return None
+        if row is None or now - row[0] > self.ttl_seconds:
+            return None
+        return row[0], row[1]
+
+    def get(self, method: str, prompt: str) -> Optional[str]:
+        """The cached completion for this prompt, or None (counted as a miss)"""
+        if not self.enabled(method):
+            return None
+        key = prompt_key(f"{self.namespace}/{method}", prompt)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load_from_disk(key, now)
+                if entry is not None:
+                    self._store_locked(key, entry)
+            elif now - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses[method] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits[method] += 1
+            return entry[1]
+
+    def _store_locked(self, key: str, entry: Tuple[float, str]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, method: str, prompt: str, completion: str):
+        if not self.enabled(method) or not completion:
+            return
+        key = prompt_key(f"{self.namespace}/{method}", prompt)
+        created_at = time.time()
+        with self._lock:
+            self._store_locked(key, (created_at, completion))
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, method, value, created_at) VALUES (?, ?, ?, ?)",
+                        (key, method, completion, created_at)
+                    )
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ LLM cache disk write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "methods": sorted(self.methods),
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "persisted": self._conn is not None,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Load generator for the debate API.
+
+Simulates N concurrent teams, each walking a full debate the way DebateRoom does:
+start → Phase 1 (streamed AI arguments) → Phase 2 answer/next-question turns →
+Phase 3 streamed student questions → Phase 4 conclusion, AI counter-arguments and
+evaluation → Phase 5 evaluation → DOCX export → complete. Every request is timed
+and the report lists p50/p95/p99 latency per endpoint plus overall throughput.
+
+By default the backend runs in this process with ChatGoogleGenerativeAI replaced
+by FakeChatModel, which answers every prompt with well-formed canned output after
+a configurable delay, so runs are repeatable and cost no quota:
+
+    cd backend
+    python load_test.py --teams 40 --llm-latency 1.5 --llm-jitter 0.5
+    python load_test.py --teams 10 --json before.json     # keep numbers to compare
+
+--url targets an already running server instead (real LLM calls, real quota).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+STUDENT_ANSWERS = [
+    "Theo nhóm em, yếu tố kinh tế quyết định ý thức xã hội vì đời sống vật chất tạo ra nhu cầu tinh thần.",
+    "Nhóm em cho rằng cần xét cả hoàn cảnh lịch sử cụ thể, không thể áp dụng máy móc một nguyên lý.",
+    "Ví dụ thực tế ở Việt Nam cho thấy chính sách đổi mới đã thay đổi nhận thức của người dân rất rõ.",
+    "Chúng em nghĩ rằng mối quan hệ này là biện chứng, hai mặt tác động qua lại lẫn nhau.",
+]
+STUDENT_QUESTIONS = [
+    "Tại sao AI lại cho rằng lập luận của nhóm em thiếu dẫn chứng thực tiễn?",
+    "Nếu điều kiện xã hội thay đổi thì quan điểm của AI có còn đúng không?",
+    "Làm thế nào để phân biệt nguyên nhân và kết quả trong trường hợp này?",
+]
+
+
+class FakeChatModel:
+    """
+    Stand-in for ChatGoogleGenerativeAI with the same invoke/ainvoke/astream surface.
+
+    Replies are shaped after the prompt so the real parsers accept them: numbered
+    arguments in the requested "Luận điểm ..." format, a "1. ...?" Socratic
+    question, and JSON filled from the response schema in JSON mode. Each call
+    waits `latency` plus up to `jitter` seconds; streamed replies spread that
+    delay over their chunks.
+    """
+
+    def __init__(self, latency: float = 1.0, jitter: float = 0.0, chunk_size: int = 24):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _delay(self) -> float:
+        with self._lock:
+            self.calls += 1
+        return self.latency + random.uniform(0, self.jitter)
+
+    def _fill(self, schema: Dict[str, Any]) -> Any:
+        if schema.get("type") == "object":
+            return {name: self._fill(field) for name, field in schema.get("properties", {}).items()}
+        if schema.get("type") == "integer":
+            # criteria_schema puts the range in the description: "<name> (0-<max>)"
+            limit = re.search(r"\(0-(\d+)\)", schema.get("description", ""))
+            return random.randint(0, int(limit.group(1))) if limit else 0
+        return "Nhóm lập luận khá chặt chẽ nhưng cần thêm dẫn chứng thực tiễn."
+
+    def _reply(self, prompt: Any, model_kwargs: Dict[str, Any]) -> str:
+        from prompt_prefix import prompt_text
+
+        if model_kwargs.get("response_mime_type") == "application/json":
+            return json.dumps(self._fill(model_kwargs["response_schema"]), ensure_ascii=False)
+        text = prompt_text(prompt)
+        heading = re.search(r'Bắt đầu ngay với "(Luận điểm [^"]+?) 1:"', text)
+        if heading:
+            if "phản bác" in heading.group(1):
+                parts = ("Lập luận phản bác", "Dẫn chứng thực tiễn", "Hệ quả của lỗ hổng")
+            else:
+                parts = ("Lập luận", "Dẫn chứng lý thuyết", "Ví dụ")
+            return "\n\n\n".join(
+                f"{heading.group(1)} {n}:\n" + "\n".join(f"- {part}: nội dung mẫu số {n}." for part in parts)
+                for n in range(1, 4)
+            )
+        if "Socratic questioning" in text:
+            return "1. Điều gì khiến nhóm bạn tin rằng giả định này luôn đúng trong mọi hoàn cảnh?"
+        return ("Đó là một câu hỏi thú vị. Tôi tò mò điều gì khiến bạn nghĩ như vậy? "
+                "Liệu có cách nào khác để xem xét vấn đề này không?")
+
+    def invoke(self, prompt: Any, **model_kwargs):
+        from langchain_core.messages import AIMessage
+
+        time.sleep(self._delay())
+        return AIMessage(content=self._reply(prompt, model_kwargs))
+
+    async def ainvoke(self, prompt: Any, **model_kwargs):
+        from langchain_core.messages import AIMessage
+
+        await asyncio.sleep(self._delay())
+        return AIMessage(content=self._reply(prompt, model_kwargs))
+
+    async def astream(self, prompt: Any, **model_kwargs):
+        from langchain_core.messages import AIMessageChunk
+
+        delay = self._delay()
+        text = self._reply(prompt, model_kwargs)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        for chunk in chunks:
+            await asyncio.sleep(delay / len(chunks))
+            yield AIMessageChunk(content=chunk)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    """Thread-safe collection of (endpoint, seconds, ok) samples"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[Tuple[float, bool]]] = {}
+        self.errors: List[str] = []
+
+    def add(self, endpoint: str, seconds: float, ok: bool, detail: str = ""):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((seconds, ok))
+            if not ok:
+                self.errors.append(f"{endpoint}: {detail}")
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        rows = {}
+        for endpoint, samples in self.samples.items():
+            latencies = sorted(seconds * 1000 for seconds, _ in samples)
+            rows[endpoint] = {
+                "count": len(samples),
+                "errors": sum(1 for _, ok in samples if not ok),
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+                "p99_ms": round(percentile(latencies, 99), 1),
+                "max_ms": round(latencies[-1], 1),
+            }
+        return rows
+
+
+class TeamRun:
+    """One simulated team walking a whole debate over HTTP"""
+
+    def __init__(self, base_url: str, team_id: str, recorder: Recorder, phase2_turns: int, phase3_turns: int):
+        self.api = f"{base_url.rstrip('/')}/api"
+        self.team_id = team_id
+        self.recorder = recorder
+        self.phase2_turns = phase2_turns
+        self.phase3_turns = phase3_turns
+        self.http = requests.Session()
+
+    def call(self, method: str, endpoint: str, path: str, json_body: Any = None, stream: bool = False,
+             idempotency_key: Optional[str] = None) -> requests.Response:
+        headers = {"Idempotency-Key": f"{self.team_id}-{idempotency_key}"} if idempotency_key else {}
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, f"{self.api}{path}", json=json_body, headers=headers,
+                                         stream=stream, timeout=300)
+            if stream:
+                # Time to the first event separately: that is what the student waits for
+                lines = response.iter_lines()
+                next(lines, None)
+                self.recorder.add(f"{endpoint} (first event)", time.perf_counter() - started, response.ok)
+                for _ in lines:
+                    pass
+            else:
+                response.content
+        except requests.RequestException as e:
+            self.recorder.add(endpoint, time.perf_counter() - started, False, str(e))
+            raise
+        ok = response.ok
+        detail = str(response.status_code) if stream else f"{response.status_code} {response.text[:200]}"
+        self.recorder.add(endpoint, time.perf_counter() - started, ok, detail)
+        if not ok:
+            raise RuntimeError(f"{endpoint} failed with {response.status_code}")
+        return response
+
+    def phase(self, name: str):
+        self.call("POST", "POST /phase", f"/debate/{self.team_id}/phase", {"phase": name})
+
+    def run(self) -> bool:
+        team = self.team_id
+        try:
+            self.call("POST", "POST /start", "/debate/start",
+                      {"course_code": "MLN111", "members": ["SV A", "SV B", "SV C"], "team_id": self.team_id})
+
+            self.phase("Phiên 1: Trình bày luận điểm mở")
+            self.call("POST", "POST /phase1/stream", f"/debate/{team}/phase1/stream", {}, stream=True)
+
+            self.phase("Phiên 2: AI hỏi, SV trả lời")
+            response = self.call("POST", "POST /phase2", f"/debate/{team}/phase2",
+                                 {"team_arguments": random.sample(STUDENT_ANSWERS, 2)})
+            question = (response.json().get("data", {}).get("ai_questions") or [""])[0]
+            self.call("POST", "POST /phase2/start", f"/debate/{team}/phase2/start")
+            for turn in range(self.phase2_turns):
+                self.call("POST", "POST /ai-question/turn", f"/debate/{team}/ai-question/turn",
+                          {"answer": random.choice(STUDENT_ANSWERS), "asker": "student", "question": question},
+                          idempotency_key=f"phase2-answer-{turn}")
+                response = self.call("POST", "POST /ai-question/generate", f"/debate/{team}/ai-question/generate",
+                                     idempotency_key=f"phase2-next-{turn}")
+                question = response.json().get("new_question", question)
+
+            self.phase("Phiên 3: SV hỏi, AI trả lời")
+            for _ in range(self.phase3_turns):
+                self.call("POST", "POST /student-question/stream", f"/debate/{team}/student-question/stream",
+                          {"asker": "student", "question": random.choice(STUDENT_QUESTIONS), "answer": None},
+                          stream=True)
+
+            self.phase("Phiên 4: Kết luận & Đánh giá")
+            self.call("POST", "POST /phase4/conclusion", f"/debate/{team}/phase4/conclusion",
+                      {"team_id": self.team_id, "arguments": [random.choice(STUDENT_ANSWERS)]},
+                      idempotency_key="phase4-conclusion")
+            self.call("POST", "POST /phase4/ai-conclusion", f"/debate/{team}/phase4/ai-conclusion",
+                      idempotency_key="phase4-ai-conclusion")
+            self.call("POST", "POST /phase4/evaluate", f"/debate/{team}/phase4/evaluate",
+                      idempotency_key="phase4-evaluate")
+            self.call("POST", "POST /phase5/evaluate", f"/debate/{team}/phase5/evaluate",
+                      idempotency_key="phase5-evaluate")
+
+            self.call("GET", "GET /export_docx", f"/debate/{team}/export_docx")
+            self.call("POST", "POST /complete", f"/debate/{team}/complete")
+            return True
+        except Exception as e:
+            print(f"❌ {self.team_id}: {e}", file=sys.stderr)
+            return False
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_backend(args) -> Tuple[str, Any, threading.Thread, FakeChatModel]:
+    """Run main.app with FakeChatModel in a background uvicorn server; returns (url, server, thread, model)"""
+    os.environ.setdefault("GEMINI_API_KEY", "load-test")
+    # The fake has no provider quota; only the key pool's own limits would throttle it
+    os.environ["GEMINI_KEY_RPM_LIMIT"] = str(args.rpm_limit)
+    os.environ.setdefault("SESSION_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="load_test_"), "sessions.db"))
+
+    import debate_system
+    fake_model = FakeChatModel(args.llm_latency, args.llm_jitter)
+    debate_system.DebateSystem._create_model = lambda self, key_index: fake_model
+
+    import uvicorn
+    import main
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Backend failed to start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server, thread, fake_model
+
+
+def print_report(rows: Dict[str, Dict[str, Any]], summary: Dict[str, Any], out):
+    print(f"\n{'endpoint':<42}{'count':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}", file=out)
+    for endpoint, row in sorted(rows.items(), key=lambda item: -item[1]["p95_ms"]):
+        print(f"{endpoint:<42}{row['count']:>7}{row['errors']:>5}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+              f"{row['p99_ms']:>10}{row['max_ms']:>10}", file=out)
+    print(f"\n🏁 {summary['completed_teams']}/{summary['teams']} debates completed in {summary['wall_seconds']}s — "
+          f"{summary['requests']} requests, {summary['requests_per_second']} req/s, "
+          f"{summary['debates_per_minute']} debates/min", file=out)
+    if "llm_calls" in summary:
+        print(f"🤖 {summary['llm_calls']} fake LLM calls ({summary['llm_calls_per_debate']} per debate)", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent full debates and report latency percentiles")
+    parser.add_argument("--teams", type=int, default=10, help="concurrent simulated teams")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which team starts are spread")
+    parser.add_argument("--phase2-turns", type=int, default=3)
+    parser.add_argument("--phase3-turns", type=int, default=2)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="fake LLM seconds per call")
+    parser.add_argument("--llm-jitter", type=float, default=0.3, help="extra random fake LLM seconds (0..jitter)")
+    parser.add_argument("--rpm-limit", type=int, default=100000, help="per-key RPM the key pool enforces against the fake")
+    parser.add_argument("--url", help="test a running server (real LLM) instead of the in-process fake backend")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="keep the backend's own output")
+    args = parser.parse_args()
+
+    out = sys.stdout
+    server = thread = fake_model = None
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            # The handlers print debug lines for every turn; keep the report readable
+            stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+        if args.url:
+            base_url = args.url
+        else:
+            base_url, server, thread, fake_model = start_fake_backend(args)
+            if not args.verbose:
+                logging.getLogger().setLevel(logging.WARNING)
+        print(f"🚀 {args.teams} teams against {base_url} "
+              f"({'fake LLM %.1fs±%.1fs' % (args.llm_latency, args.llm_jitter) if fake_model else 'live LLM'})", file=out)
+
+        recorder = Recorder()
+        run_id = time.strftime("%H%M%S")
+        teams = [TeamRun(base_url, f"LOAD-{run_id}-{n:03d}", recorder, args.phase2_turns, args.phase3_turns)
+                 for n in range(args.teams)]
+
+        def run_team(index: int) -> bool:
+            time.sleep(args.ramp * index / max(1, args.teams))
+            return teams[index].run()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.teams) as pool:
+            results = list(pool.map(run_team, range(args.teams)))
+        wall = time.perf_counter() - started
+
+        if server is not None:
+            server.should_exit = True
+            thread.join(timeout=10)
+
+    rows = recorder.report()
+    requests_made = sum(row["count"] for endpoint, row in rows.items() if not endpoint.endswith("(first event)"))
+    summary = {
+        "teams": args.teams,
+        "completed_teams": sum(results),
+        "wall_seconds": round(wall, 1),
+        "requests": requests_made,
+        "requests_per_second": round(requests_made / wall, 1),
+        "debates_per_minute": round(sum(results) / wall * 60, 1),
+    }
+    if fake_model is not None:
+        summary["llm_calls"] = fake_model.calls
+        summary["llm_calls_per_debate"] = round(fake_model.calls / max(1, args.teams), 1)
+    print_report(rows, summary, out)
+    for error in recorder.errors[:10]:
+        print(f"⚠️ {error}", file=out)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "summary": summary, "endpoints": rows}, f, ensure_ascii=False, indent=2)
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,33 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+import asyncio
 import json
+import logging
 from datetime import datetime
 from urllib.parse import unquote
 import unicodedata
-from debate_system import DebateSystem, DebateSession
+from debate_system import DebateSystem, DebateSession, format_turns
+from session_store import create_session_store, SessionConflictError
+from leaderboard import Leaderboard
+from argument_pool import ArgumentPool
+from question_prefetch import QuestionPrefetcher
+from single_flight import SingleFlight
+from session_guard import SessionGuard
+from phase_evaluator import PhaseEvaluator
+from llm_cache import prompt_key
+from course_content import MLN111_MLN122_TOPICS
+from admin_feed import AdminFeed, active_session_summary, completed_session_summary, live_scoring_item
+from report_docx import DOCX_MEDIA_TYPE, create_report_renderer, stream_reports_zip
+from report_formats import TEXT_REPORT_FORMATS, iter_text_report
+from session_store import serialize_session_data
 import random
 import re # Added for regex validation
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="MLN Debate System API", version="1.0.0")
 
 # Helper function to decode team_id
@@ -22,35 +39,32 @@ def normalize_team_key(team_id: str) -> str:
     """Create a normalized key for team IDs to avoid Unicode/casing mismatches"""
     return unicodedata.normalize("NFKC", team_id).strip().lower()
 
-def get_active_session(team_id: str):
+async def get_active_session(team_id: str):
     """Resolve and return the active session data by team identifier"""
     decoded_id = decode_team_id(team_id)
     session_key = normalize_team_key(decoded_id)
-    session_data = active_sessions.get(session_key)
+    session_data = await session_store.aget(session_key)
     if not session_data:
-        print(f"❌ Session lookup failed for team_id='{decoded_id}'. Active sessions: {[data.get('team_id') for data in active_sessions.values()]}")
+        print(f"❌ Session lookup failed for team_id='{decoded_id}'. Active sessions: {[data.get('team_id') for _, data in await session_store.alist_active()]}")
         raise HTTPException(status_code=404, detail="Session not found")
     return session_key, session_data
 
-def get_any_session(team_id: str):
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def get_any_session(team_id: str):
     """Resolve and return session data from either active or completed sessions"""
     decoded_id = decode_team_id(team_id)
     session_key = normalize_team_key(decoded_id)
-    session_data = active_sessions.get(session_key)
+    session_data = await session_store.aget(session_key)
     if session_data:
         return session_key, session_data
 
-    # Fallback: iterate active sessions in case of unexpected key mismatch
-    for key, active_data in active_sessions.items():
-        if normalize_team_key(active_data.get("team_id", "")) == session_key:
-            return key, active_data
-
-    for session in completed_sessions:
-        if normalize_team_key(session.get("team_id", "")) == session_key:
-            return session_key, session
-    for session in completed_sessions:
-        if normalize_team_key(session.get("session_key", "")) == session_key:
-            return session.get("session_key"), session
+    # Completed sessions are indexed by the same normalized key
+    session_data = await session_store.aget_completed(session_key)
+    if session_data:
+        return session_key, session_data
     print(f"❌ Session lookup failed (any) for team_id='{decoded_id}'.")
     raise HTTPException(status_code=404, detail="Session not found")
 
@@ -116,9 +130,58 @@ except Exception as e:
     print(f"⚠️ Warning: Could not initialize debate system: {e}")
     debate_system = None
 
-# In-memory storage (replace with database in production)
-active_sessions = {}
-completed_sessions = []
+# Phase 1 AI arguments for the fixed topic bank are generated ahead of time in the
+# background (ARGUMENT_POOL_SIZE sets per topic and side, 0 disables the pool).
+# Every gunicorn worker fills its own pool, so the target is split between them
+# (rounded up) instead of multiplying the quota spent on refills
+argument_pool_workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+argument_pool = ArgumentPool(
+    debate_system,
+    MLN111_MLN122_TOPICS,
+    size=-(-int(os.getenv("ARGUMENT_POOL_SIZE", "3")) // argument_pool_workers)
+) if debate_system else None
+
+# Next Phase 2 AI question, generated while the student reads their stored answer
+question_prefetcher = QuestionPrefetcher()
+
+# Retries of a slow generation (axios times out after 30s) join the call still in flight
+# instead of starting a second one; keyed by (session, endpoint, prompt hash)
+llm_flights = SingleFlight()
+
+# Per-session locks for state-mutating endpoints, plus replay of Idempotency-Key retries
+session_guard = SessionGuard(lambda team_id: normalize_team_key(decode_team_id(team_id)))
+
+@app.on_event("startup")
+async def start_argument_pool():
+    if argument_pool:
+        argument_pool.start()
+
+@app.on_event("shutdown")
+async def stop_argument_pool():
+    if argument_pool:
+        await argument_pool.stop()
+
+# Session storage: SQLite (WAL) by default so debates survive restarts and are shared
+# between gunicorn workers; SESSION_STORE=redis for several hosts, see session_store.py
+session_store = create_session_store(debate_system)
+# Leaderboard is kept up to date as sessions are archived/deleted instead of recomputed per request
+leaderboard = Leaderboard()
+session_store.add_completed_listener(leaderboard.update)
+# Admin dashboard push feed: per-session deltas instead of full-payload polling
+admin_feed = AdminFeed(session_store)
+# Each phase is scored in the background when it closes; Phase 5 only merges and writes feedback
+phase_evaluator = PhaseEvaluator(debate_system, session_store, session_guard.lock) if debate_system else None
+# DOCX exports are rendered off the event loop and cached until the session changes
+report_renderer = create_report_renderer()
+
+@app.on_event("shutdown")
+async def stop_report_renderer():
+    report_renderer.close()
+
+def score_closed_phases(session_key: str, session_data: Dict[str, Any], next_phase: int):
+    """The debate moved on to `next_phase`: start scoring every phase before it"""
+    if phase_evaluator:
+        phase_evaluator.schedule(session_key, session_data["session"], [f"phase{n}" for n in range(1, min(next_phase, 5))])
 session_counter = 0
 class StartDebateRequest(BaseModel):
     course_code: str
@@ -155,21 +218,24 @@ async def start_debate(request: StartDebateRequest):
         # Auto-generate if not provided
         global session_counter
         session_counter += 1
+        # Other workers share the store, so skip ids they have already handed out
+        while await session_store.aget(normalize_team_key(f"TEAM{session_counter:03d}")) is not None:
+            session_counter += 1
         team_id = f"TEAM{session_counter:03d}"
 
     session_key = normalize_team_key(team_id)
     # Check if normalized team_id already exists
-    if session_key in active_sessions:
+    if await session_store.aget(session_key) is not None:
         raise HTTPException(status_code=400, detail=f"Team ID '{team_id}' already exists. Please choose a different one.")
     
     try:
         session = DebateSession(debate_system)
-        topic = session.start_debate(request.course_code, request.members)
+        topic = await session.astart_debate(request.course_code, request.members)
         
         # Randomly assign stance (agree/disagree)
         stance = random.choice(["agree", "disagree"])
         
-        active_sessions[session_key] = {
+        await session_store.aput(session_key, {
             "session": session,
             "team_id": team_id,
             "session_key": session_key,
@@ -181,7 +247,7 @@ async def start_debate(request: StartDebateRequest):
             "created_at": datetime.now().isoformat(),
             "turns_taken": 0,
             "stance": stance  # Add stance to session data
-        }
+        })
         
         return {
             "success": True,
@@ -190,14 +256,17 @@ async def start_debate(request: StartDebateRequest):
             "stance": stance,  # Return stance in response
             "message": f"Debate session started successfully. Your team will {'ĐỒNG TÌNH' if stance == 'agree' else 'PHẢN ĐỐI'} với chủ đề."
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start debate: {str(e)}")
 
 @app.post("/api/debate/{team_id}/arguments")
+@session_guard.mutation("arguments")
 async def submit_arguments(team_id: str, request: SubmitArgumentsRequest):
     """Submit Phase 1 arguments"""
     try:
-        _, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session = session_data["session"]
         
         # 🔧 FIX: Store arguments in BOTH places for sync
@@ -208,25 +277,31 @@ async def submit_arguments(team_id: str, request: SubmitArgumentsRequest):
         print(f"🔧 DEBUG: Stored team_arguments: {session.team_arguments}")
         
         # Generate AI questions based on arguments
-        questions = debate_system.generate_questions(request.arguments, session_data["topic"])
+        questions = await debate_system.agenerate_questions(request.arguments, session_data["topic"])
         session_data["ai_questions"] = questions
         
+        await session_store.aput(session_key, session_data)
+        score_closed_phases(session_key, session_data, 2)
+        
         return {
             "success": True,
             "questions": questions,
             "message": "Arguments submitted successfully. AI has generated questions for Phase 2A."
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to submit arguments: {str(e)}")
 
 @app.post("/api/debate/{team_id}/question")
+@session_guard.mutation("question")
 async def submit_question(team_id: str, request: SubmitQuestionRequest):
     """Submit a question in Phase 2B"""
     try:
-        _, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         
         # Generate Socratic response
-        ai_response = debate_system.generate_socratic_answer(
+        ai_response = await debate_system.agenerate_socratic_answer(
             request.question, 
             session_data["topic"], 
             session_data.get("previous_context", "")
@@ -235,11 +310,15 @@ async def submit_question(team_id: str, request: SubmitQuestionRequest):
         session_data["current_phase"] = "Phase 2B"
         session_data["turns_taken"] += 1
         
+        await session_store.aput(session_key, session_data)
+        
         return {
             "success": True,
             "ai_response": ai_response,
             "message": "Question submitted successfully"
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to submit question: {str(e)}")
 
@@ -247,7 +326,7 @@ async def submit_question(team_id: str, request: SubmitQuestionRequest):
 async def get_debate_info(team_id: str):
     """Get debate session information"""
     try:
-        _, session_data = get_active_session(team_id)
+        _, session_data = await get_active_session(team_id)
         return {
             "success": True,
             "team_id": session_data["team_id"],
@@ -266,36 +345,19 @@ async def get_debate_info(team_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get debate info: {str(e)}")
 
 @app.get("/api/debate/{team_id}/turns")
-async def get_debate_turns(team_id: str):
-    """Get separated Phase 2 and Phase 3 turns"""
+async def get_debate_turns(team_id: str, since_phase2: int = Query(0, ge=0), since_phase3: int = Query(0, ge=0)):
+    """Get separated Phase 2 and Phase 3 turns (only those after the since_* cursors, if given)"""
     try:
-        _, session_data = get_active_session(team_id)
+        _, session_data = await get_active_session(team_id)
         session = session_data["session"]
         
-        # Format Phase 2 turns (AI asks, Student answers)
-        phase2_turns = []
-        if hasattr(session, 'turns'):
-            phase2_turns = [{
-                "asker": turn.get("asker", "unknown"),
-                "question": turn.get("question", ""),
-                "answer": turn.get("answer"),
-                "turn_number": idx + 1
-            } for idx, turn in enumerate(session.turns)]
-        
-        # Format Phase 3 turns (Student asks, AI answers)
-        phase3_turns = []
-        if hasattr(session, 'phase3_turns'):
-            phase3_turns = [{
-                "asker": turn.get("asker", "unknown"),
-                "question": turn.get("question", ""),
-                "answer": turn.get("answer"),
-                "turn_number": idx + 1
-            } for idx, turn in enumerate(session.phase3_turns)]
-        
+        # Phase 2: AI asks, Student answers / Phase 3: Student asks, AI answers
         return {
             "success": True,
-            "phase2_turns": phase2_turns,
-            "phase3_turns": phase3_turns,
+            "phase2_turns": format_turns(session.turns, since_phase2),
+            "phase3_turns": format_turns(session.phase3_turns, since_phase3),
+            "phase2_cursor": len(session.turns),
+            "phase3_cursor": len(session.phase3_turns),
             "message": "Turns data retrieved successfully"
         }
     except Exception as e:
@@ -308,55 +370,82 @@ class StanceRequest(BaseModel):
     stance: str
 
 @app.post("/api/debate/{team_id}/stance")
+@session_guard.mutation("stance")
 async def set_stance(team_id: str, request: StanceRequest):
     """Set team stance (ĐỒNG TÌNH or PHẢN ĐỐI)"""
     try:
-        _, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session_data["stance"] = request.stance
         
+        await session_store.aput(session_key, session_data)
+        
         return {
             "success": True,
             "stance": request.stance,
             "message": f"Stance set to {request.stance}"
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to set stance: {str(e)}")
 
 @app.post("/api/debate/{team_id}/phase")
+@session_guard.mutation("phase")
 async def update_phase(team_id: str, request: UpdatePhaseRequest):
     """Update debate phase"""
     try:
-        _, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session_data["current_phase"] = request.phase
         
+        await session_store.aput(session_key, session_data)
+        # "Phiên 3: ..." means Phase 1 and 2 are over
+        phase_number = re.search(r"\d", request.phase)
+        if phase_number:
+            score_closed_phases(session_key, session_data, int(phase_number.group()))
+        
         return {
             "success": True,
             "current_phase": request.phase,
             "message": f"Phase updated to {request.phase}"
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update phase: {str(e)}")
 
 # Update Phase 1 to consider stance
 @app.post("/api/debate/{team_id}/phase1")
+@session_guard.mutation("phase1", lock=False)
 async def get_ai_arguments_phase1(team_id: str):
     """Generate AI arguments for Phase 1"""
     if not debate_system:
         raise HTTPException(status_code=503, detail="Debate system not available")
     
     try:
-        _, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session = session_data["session"]
         topic = session_data["topic"]
         stance = session_data.get("stance", "agree")
         
-        # Generate AI arguments opposing the team's stance
+        # Generate AI arguments opposing the team's stance (pre-generated when available)
         ai_stance = "opposing" if stance == "agree" else "supporting"
-        ai_arguments = debate_system.generate_arguments(topic, ai_stance)
         
-        session.ai_arguments = ai_arguments
-        session_data["ai_arguments"] = ai_arguments
-        session_data["current_phase"] = "Phase 1.5"
+        async def generate():
+            async with session_guard.lock(session_key):
+                ai_arguments = argument_pool.take(topic, ai_stance) if argument_pool else None
+                if not ai_arguments:
+                    ai_arguments = await debate_system.agenerate_arguments(topic, ai_stance)
+                
+                session.ai_arguments = ai_arguments
+                session_data["ai_arguments"] = ai_arguments
+                session_data["current_phase"] = "Phase 1.5"
+                
+                await session_store.aput(session_key, session_data)
+                return ai_arguments
+        
+        ai_arguments = await llm_flights.run(
+            (session_key, "phase1", prompt_key(ai_stance, topic)), generate
+        )
         
         return {
             "success": True,
@@ -367,20 +456,88 @@ async def get_ai_arguments_phase1(team_id: str):
                 "message": "AI arguments generated successfully"
             }
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate AI arguments: {str(e)}")
 
+@app.post("/api/debate/{team_id}/phase1/stream")
+async def stream_ai_arguments_phase1(team_id: str):
+    """Stream AI arguments for Phase 1 as Server-Sent Events, one event per parsed argument"""
+    if not debate_system:
+        raise HTTPException(status_code=503, detail="Debate system not available")
+    
+    session_key, session_data = await get_active_session(team_id)
+    session = session_data["session"]
+    topic = session_data["topic"]
+    stance = session_data.get("stance", "agree")
+    
+    # Generate AI arguments opposing the team's stance
+    ai_stance = "opposing" if stance == "agree" else "supporting"
+    
+    async def generate(emit):
+        async with session_guard.lock(session_key):
+            ai_arguments = []
+            pooled_arguments = argument_pool.take(topic, ai_stance) if argument_pool else None
+            if pooled_arguments:
+                # Pre-generated set: all arguments are available at once
+                for argument in pooled_arguments:
+                    ai_arguments.append(argument)
+                    emit(argument)
+            else:
+                async for argument in debate_system.astream_arguments(topic, ai_stance):
+                    ai_arguments.append(argument)
+                    emit(argument)
+            
+            session.ai_arguments = ai_arguments
+            session_data["ai_arguments"] = ai_arguments
+            session_data["current_phase"] = "Phase 1.5"
+            
+            await session_store.aput(session_key, session_data)
+            return ai_arguments
+    
+    async def event_stream():
+        # A retry while the arguments are still streaming joins the same generation
+        # and is sent every argument from the first one
+        ai_arguments = []
+        try:
+            async for argument in llm_flights.stream(
+                (session_key, "phase1/stream", prompt_key(ai_stance, topic)), generate
+            ):
+                ai_arguments.append(argument)
+                yield sse_event("argument", {"index": len(ai_arguments) - 1, "content": argument})
+        except SessionConflictError as e:
+            yield sse_event("error", {"status": 409, "detail": str(e)})
+            return
+        
+        yield sse_event("done", {
+            "success": True,
+            "data": {
+                "ai_arguments": ai_arguments,
+                "topic": topic,
+                "stance": stance,
+                "message": "AI arguments generated successfully"
+            }
+        })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 class Phase2Request(BaseModel):
     team_arguments: List[str]
 
 @app.post("/api/debate/{team_id}/phase2")
+@session_guard.mutation("phase2")
 async def get_ai_questions_phase2(team_id: str, request: Phase2Request):
     """Generate AI questions for Phase 2 and store student arguments"""
     if not debate_system:
         raise HTTPException(status_code=503, detail="Debate system not available")
     
     try:
-        _, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session = session_data["session"]
         topic = session_data["topic"]
         
@@ -398,7 +555,7 @@ async def get_ai_questions_phase2(team_id: str, request: Phase2Request):
         
         # Generate AI questions challenging the students' position  
         if debate_system:
-            ai_questions = debate_system.generate_questions(student_arguments, topic)
+            ai_questions = await debate_system.agenerate_questions(student_arguments, topic)
         else:
             ai_questions = ["Bạn có thể giải thích rõ hơn về quan điểm này không?"]
         
@@ -410,6 +567,9 @@ async def get_ai_questions_phase2(team_id: str, request: Phase2Request):
             session.add_turn("ai", ai_questions[0], None)
             print(f"🔧 DEBUG Phase2: Added first AI question to turns: {ai_questions[0][:50]}...")
         
+        await session_store.aput(session_key, session_data)
+        score_closed_phases(session_key, session_data, 2)
+        
         return {
             "success": True,
             "data": {
@@ -418,21 +578,28 @@ async def get_ai_questions_phase2(team_id: str, request: Phase2Request):
                 "message": "AI questions generated successfully"
             }
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate AI questions: {str(e)}")
 
 @app.post("/api/debate/{team_id}/phase2/start")
+@session_guard.mutation("phase2/start")
 async def start_phase2(team_id: str):
     """Start Phase 2 of the debate"""
     try:
-        _, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session_data["current_phase"] = "Phase 2"
         
+        await session_store.aput(session_key, session_data)
+        
         return {
             "success": True,
             "current_phase": "Phase 2",
             "message": "Phase 2 started successfully"
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start Phase 2: {str(e)}")
 
@@ -441,11 +608,25 @@ class AIQuestionTurnRequest(BaseModel):
     asker: str
     question: str
 
+def is_substantive_answer(answer: str) -> bool:
+    """Whether a Phase 2 answer gets an AI follow-up question (obvious nonsense gets a fallback)"""
+    # 🔧 RELAXED VALIDATION: More forgiving for test mode
+    answer_clean = answer.strip().lower()
+    
+    # More permissive validation - still block clear spam but allow test content
+    severe_patterns = ['ádfasd', 'asdf', 'ấd', 'ád']  # Only severe nonsense patterns
+    has_severe_nonsense = any(pattern in answer_clean for pattern in severe_patterns)
+    is_extremely_short = len(answer.strip()) < 5  # Very short only
+    is_pure_numbers = bool(re.match(r'^[0-9\s]+$', answer.strip()))  # Only pure numbers
+    
+    return not (has_severe_nonsense or is_extremely_short or is_pure_numbers)
+
 @app.post("/api/debate/{team_id}/ai-question/turn")
-async def ai_question_turn(team_id: str, request: AIQuestionTurnRequest):
+@session_guard.mutation("ai-question/turn")
+async def ai_question_turn(team_id: str, request: AIQuestionTurnRequest, since: int = Query(0, ge=0)):
     """Handle Phase 2: Student answers AI question and gets next AI question"""
     try:
-        _, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session = session_data["session"]
         
         # Validate student answer
@@ -462,6 +643,12 @@ async def ai_question_turn(team_id: str, request: AIQuestionTurnRequest):
         # 🔧 FIX: Add student answer turn with NO question (student only provides answers in Phase 2)
         session.add_turn("student", "", answer)
         
+        await session_store.aput(session_key, session_data)
+        
+        # Start generating the follow-up question now; /ai-question/generate picks it up
+        if session.debate_system and is_substantive_answer(answer):
+            question_prefetcher.start(session_key, answer, session.debate_system, session_data["topic"])
+        
         # 🔧 DEBUG: Log after adding turn
         print(f"🔧 DEBUG ai_question_turn: After adding student answer, total turns: {len(session.turns)}")
         
@@ -470,35 +657,29 @@ async def ai_question_turn(team_id: str, request: AIQuestionTurnRequest):
         # This prevents the "jumping to next question" issue
         print(f"🔧 BEHAVIOR: NOT auto-generating next AI question to prevent UI jumping")
         
-        # Format turns for frontend
-        formatted_turns = []
-        for idx, turn in enumerate(session.turns):
-            formatted_turn = {
-                "asker": turn.get("asker", "unknown"),
-                "question": turn.get("question", ""),
-                "answer": turn.get("answer"),
-                "turn_number": idx + 1
-            }
-            formatted_turns.append(formatted_turn)
-        
-        print(f"🔧 DEBUG: Phase 2 turns formatted. Total: {len(formatted_turns)}")
+        print(f"🔧 DEBUG: Phase 2 turns formatted. Total: {len(session.turns)}")
         
+        # Only the turns after the client's cursor (all of them without one)
         return {
             "success": True,
-            "turns": formatted_turns,
+            "turns": format_turns(session.turns, since),
+            "cursor": len(session.turns),
             "message": "Turn processed successfully"
         }
         
     except HTTPException as he:
         raise he
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process turn: {str(e)}")
 
 @app.post("/api/debate/{team_id}/ai-question/generate")
-async def generate_next_ai_question(team_id: str):
+@session_guard.mutation("ai-question/generate")
+async def generate_next_ai_question(team_id: str, since: int = Query(0, ge=0)):
     """Generate next AI question for Phase 2 based on previous student answers"""
     try:
-        _, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session = session_data["session"]
         
         # Get the latest student answer to generate question from
@@ -514,46 +695,42 @@ async def generate_next_ai_question(team_id: str):
         # Generate next AI question
         next_ai_question = None
         
-        # 🔧 RELAXED VALIDATION: More forgiving for test mode
-        answer_clean = latest_student_answer.strip().lower()
-        
-        # More permissive validation - still block clear spam but allow test content
-        severe_patterns = ['ádfasd', 'asdf', 'ấd', 'ád']  # Only severe nonsense patterns
-        has_severe_nonsense = any(pattern in answer_clean for pattern in severe_patterns)
-        is_extremely_short = len(latest_student_answer.strip()) < 5  # Very short only
-        is_pure_numbers = bool(re.match(r'^[0-9\s]+$', latest_student_answer.strip()))  # Only pure numbers
-        
         # SOFTER BLOCKING: Only block extremely obvious nonsense
-        if has_severe_nonsense or is_extremely_short or is_pure_numbers:
+        prefetched = question_prefetcher.take(session_key, latest_student_answer)
+        if not is_substantive_answer(latest_student_answer):
             print(f"🚨 BLOCKED: Severe nonsense detected - using fallback only")
             next_ai_question = None
         else:
             # Only for CLEAN content - call AI system
             try:
                 print(f"✅ CLEAN content detected - calling AI system")
-                if session.debate_system:
-                    ai_questions = session.debate_system.generate_questions(
+                ai_questions = None
+                if prefetched is not None:
+                    # Started when the answer was stored, usually finished by now
+                    ai_questions = await prefetched
+                elif session.debate_system:
+                    ai_questions = await session.debate_system.agenerate_questions(
                         [latest_student_answer],
                         session_data["topic"]
                     )
-                    if ai_questions and len(ai_questions) > 0:
-                        candidate_question = ai_questions[0].strip()
-                        
-                        # Final validation of AI response
-                        is_clean_response = (
-                            len(candidate_question) > 20 and 
-                            '?' in candidate_question and
-                            not any(pattern in candidate_question.lower() for pattern in blocked_patterns) and
-                            not re.search(r'[0-9]{5,}', candidate_question) and
-                            any(word in candidate_question.lower() for word in ['bạn', 'có', 'thể', 'như', 'nào', 'tại', 'sao', 'gì'])
-                        )
+                if ai_questions and len(ai_questions) > 0:
+                    candidate_question = ai_questions[0].strip()
+                    
+                    # Final validation of AI response
+                    is_clean_response = (
+                        len(candidate_question) > 20 and 
+                        '?' in candidate_question and
+                        not any(pattern in candidate_question.lower() for pattern in blocked_patterns) and
+                        not re.search(r'[0-9]{5,}', candidate_question) and
+                        any(word in candidate_question.lower() for word in ['bạn', 'có', 'thể', 'như', 'nào', 'tại', 'sao', 'gì'])
+                    )
+                    
+                    if is_clean_response:
+                        next_ai_question = candidate_question
+                        print(f"✅ AI response validated and accepted")
+                    else:
+                        print(f"🚨 AI response failed validation")
                         
-                        if is_clean_response:
-                            next_ai_question = candidate_question
-                            print(f"✅ AI response validated and accepted")
-                        else:
-                            print(f"🚨 AI response failed validation")
-                            
             except Exception as e:
                 print(f"Error in AI generation: {e}")
                 
@@ -601,26 +778,21 @@ async def generate_next_ai_question(team_id: str):
         # Add the question to session
         session.add_turn("ai", next_ai_question, None)
         
-        # Format turns for frontend
-        formatted_turns = []
-        for idx, turn in enumerate(session.turns):
-            formatted_turn = {
-                "asker": turn.get("asker", "unknown"),
-                "question": turn.get("question", ""),
-                "answer": turn.get("answer"),
-                "turn_number": idx + 1
-            }
-            formatted_turns.append(formatted_turn)
+        await session_store.aput(session_key, session_data)
         
+        # Only the turns after the client's cursor (all of them without one)
         return {
             "success": True,
-            "turns": formatted_turns,
+            "turns": format_turns(session.turns, since),
+            "cursor": len(session.turns),
             "new_question": next_ai_question,
             "message": "Next AI question generated successfully"
         }
         
     except HTTPException as he:
         raise he
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate next question: {str(e)}")
 
@@ -629,19 +801,27 @@ class StudentQuestionTurnRequest(BaseModel):
     question: str
     answer: Optional[str] = None
 
+PHASE3_FALLBACK_ANSWER = "Tôi không chắc mình hiểu câu hỏi của bạn. Bạn có thể diễn đạt rõ hơn hoặc nêu cụ thể điều muốn hỏi không?"
+
+def validate_student_question(question: str) -> str:
+    """Validate a Phase 3 student question and return it cleaned"""
+    cleaned_question = question.strip()
+    if len(cleaned_question) < 12 or '?' not in cleaned_question or not re.search(r'[a-zA-ZÀ-ỹ]', cleaned_question):
+        raise HTTPException(
+            status_code=400,
+            detail="Câu hỏi chưa đủ rõ ràng. Vui lòng đặt lại với nội dung cụ thể và có dấu chấm hỏi."
+        )
+    return cleaned_question
+
 @app.post("/api/debate/{team_id}/student-question/turn")
-async def student_question_turn(team_id: str, request: StudentQuestionTurnRequest):
+@session_guard.mutation("student-question/turn")
+async def student_question_turn(team_id: str, request: StudentQuestionTurnRequest, since: int = Query(0, ge=0)):
     """Handle Phase 3: Student asks question and gets AI answer"""
     try:
-        _, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session = session_data["session"]
         
-        cleaned_question = request.question.strip()
-        if len(cleaned_question) < 12 or '?' not in cleaned_question or not re.search(r'[a-zA-ZÀ-ỹ]', cleaned_question):
-            raise HTTPException(
-                status_code=400,
-                detail="Câu hỏi chưa đủ rõ ràng. Vui lòng đặt lại với nội dung cụ thể và có dấu chấm hỏi."
-            )
+        cleaned_question = validate_student_question(request.question)
         
         # 🔧 FIX: Use session.add_phase3_turn() for Phase 3 data
         # First add student question
@@ -650,7 +830,7 @@ async def student_question_turn(team_id: str, request: StudentQuestionTurnReques
         # Generate AI answer using Socratic method
         try:
             if session.debate_system:
-                ai_answer = session.debate_system.generate_socratic_answer(
+                ai_answer = await session.debate_system.agenerate_socratic_answer(
                     student_question=request.question.strip(),
                     topic=session_data["topic"],
                     previous_context=""
@@ -665,28 +845,95 @@ async def student_question_turn(team_id: str, request: StudentQuestionTurnReques
         except Exception as e:
             print(f"Error generating AI answer: {e}")
             # If AI generation fails, add default response
-            session.add_phase3_turn(
-                "ai",
-                None,
-                "Tôi không chắc mình hiểu câu hỏi của bạn. Bạn có thể diễn đạt rõ hơn hoặc nêu cụ thể điều muốn hỏi không?"
-            )
+            session.add_phase3_turn("ai", None, PHASE3_FALLBACK_ANSWER)
+        
+        await session_store.aput(session_key, session_data)
         
         print(f"🔧 DEBUG: Phase 3 turns added. Total phase3_turns: {len(session.phase3_turns)}")
         
+        # Only the Phase 3 turns after the client's cursor (all of them without one)
         return {
             "success": True,
-            "turns": session.phase3_turns,  # Return Phase 3 turns list
+            "turns": format_turns(session.phase3_turns, since),
+            "cursor": len(session.phase3_turns),
             "message": "Question processed successfully"
         }
         
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process question: {str(e)}")
 
+@app.post("/api/debate/{team_id}/student-question/stream")
+async def student_question_stream(team_id: str, request: StudentQuestionTurnRequest, since: int = Query(0, ge=0)):
+    """Handle Phase 3 with token streaming: forwards the AI answer as Server-Sent Events"""
+    session_key, _ = await get_active_session(team_id)
+    cleaned_question = validate_student_question(request.question)
+    
+    async def event_stream():
+        # The session lock is held for the whole stream, so no other request lands between
+        # the question and its answer
+        async with session_guard.lock(session_key):
+            session_data = await session_store.aget(session_key)
+            if not session_data:
+                yield sse_event("error", {"status": 404, "detail": "Session not found"})
+                return
+            session = session_data["session"]
+            session.add_phase3_turn("student", cleaned_question, None)
+            try:
+                await session_store.aput(session_key, session_data)
+            except SessionConflictError as e:
+                yield sse_event("error", {"status": 409, "detail": str(e)})
+                return
+            
+            chunks = []
+            conflict = None
+            try:
+                if session.debate_system:
+                    async for text in session.debate_system.astream_socratic_answer(
+                        student_question=cleaned_question,
+                        topic=session_data["topic"],
+                        previous_context=""
+                    ):
+                        chunks.append(text)
+                        yield sse_event("token", {"content": text})
+                else:
+                    chunks.append("Hệ thống AI tạm thời không khả dụng.")
+            except Exception as e:
+                logger.exception(f"❌ Error streaming AI answer: {e}")
+            finally:
+                # Also runs when the client disconnects mid-stream: the question always gets
+                # an answer, the partial text if any arrived
+                ai_answer = "".join(chunks).strip() or PHASE3_FALLBACK_ANSWER
+                session.add_phase3_turn("ai", None, ai_answer)
+                try:
+                    await asyncio.shield(session_store.aput(session_key, session_data))
+                except SessionConflictError as e:
+                    conflict = e
+            
+            if conflict is not None:
+                yield sse_event("error", {"status": 409, "detail": str(conflict)})
+                return
+            
+            yield sse_event("done", {
+                "success": True,
+                "answer": ai_answer,
+                "turns": format_turns(session.phase3_turns, since),
+                "cursor": len(session.phase3_turns)
+            })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.delete("/api/debate/{team_id}/end")
+@session_guard.mutation("end")
 async def end_debate(team_id: str):
     """End/delete a debate session"""
     try:
-        session_key, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         
         # Move to completed sessions as "ended"
         completed_session = {
@@ -695,21 +942,26 @@ async def end_debate(team_id: str):
             "completed_at": datetime.now().isoformat(),
             "end_reason": "manual_end"
         }
-        completed_sessions.append(completed_session)
-        del active_sessions[session_key]
+        question_prefetcher.cancel(session_key)
+        if phase_evaluator:
+            phase_evaluator.cancel(session_key)
+        await session_store.aarchive(session_key, completed_session)
         
         return {
             "success": True,
             "message": f"Debate {team_id} ended successfully"
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to end debate: {str(e)}")
 
 @app.post("/api/debate/{team_id}/complete")
+@session_guard.mutation("complete")
 async def complete_debate(team_id: str):
     """Complete a debate session after Phase 5 evaluation"""
     try:
-        session_key, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         
         # Check if evaluation exists (Phase 5 completed)
         if "evaluation" not in session_data:
@@ -721,14 +973,18 @@ async def complete_debate(team_id: str):
             "status": "completed",
             "completed_at": datetime.now().isoformat()
         }
-        completed_sessions.append(completed_session)
-        del active_sessions[session_key]
+        question_prefetcher.cancel(session_key)
+        if phase_evaluator:
+            phase_evaluator.cancel(session_key)
+        await session_store.aarchive(session_key, completed_session)
         
         return {
             "success": True,
             "evaluation": session_data["evaluation"],
             "message": "Debate session completed and archived successfully"
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to complete debate: {str(e)}")
 
@@ -737,47 +993,16 @@ async def get_sessions():
     """Get all active and completed sessions"""
     try:
         # Convert active sessions to API format
-        active = []
-        for session_key, session_data in active_sessions.items():
-            active.append({
-                "team_id": session_data.get("team_id", session_key),
-                "topic": session_data["topic"],
-                "status": session_data["status"],
-                "current_phase": session_data["current_phase"],
-                "members": session_data["members"],
-                "turns_taken": session_data["turns_taken"],
-                "course_code": session_data.get("course_code", "")
-            })
+        active = [
+            active_session_summary(session_key, session_data)
+            for session_key, session_data in await session_store.alist_active()
+        ]
         
         # Convert completed sessions to API format
-        completed = []
-        for session_data in completed_sessions[-10:]:  # Last 10 completed
-            # For sessions that were force-ended without evaluation, create basic evaluation
-            evaluation = session_data.get("evaluation")
-            if not evaluation and session_data.get("status") == "ended":
-                # Import criteria from debate_system 
-                from debate_system import DEBATE_CRITERIA
-                
-                scores = {}
-                for phase_key, criteria_list in DEBATE_CRITERIA.items():
-                    scores[phase_key] = {criterion['id']: 0 for criterion in criteria_list}
-                
-                evaluation = {
-                    "total_score": 0,
-                    "scores": scores,
-                    "feedback": "Session was ended manually before completion. No detailed evaluation available."
-                }
-                session_data["evaluation"] = evaluation  # Save it back
-            
-            completed.append({
-                "team_id": session_data["team_id"],
-                "topic": session_data["topic"],
-                "status": session_data["status"],
-                "completed_at": session_data["completed_at"],
-                "members": session_data["members"],
-                "score": evaluation.get("total_score", 0) if evaluation else 0,
-                "evaluation": evaluation  # Include full evaluation data
-            })
+        completed = [
+            completed_session_summary(session_data)
+            for session_data in await session_store.arecent_completed(10)  # Last 10 completed
+        ]
         
         # Import criteria from debate_system 
         from debate_system import DEBATE_CRITERIA
@@ -803,55 +1028,11 @@ async def get_sessions():
 async def get_leaderboard(): 
     """Get leaderboard from completed sessions"""
     try:
-        # Calculate leaderboard from completed sessions
-        leaderboard_data = []
-        for i, session in enumerate(completed_sessions):
-            evaluation = session.get("evaluation", {})
-            scores = evaluation.get("scores", {})
-            
-            # Calculate total score
-            total_score = 0
-            phase_scores = {}
-            for phase, phase_scores_dict in scores.items():
-                if isinstance(phase_scores_dict, dict):
-                    phase_total = sum(phase_scores_dict.values())
-                    phase_scores[phase] = phase_total
-                    total_score += phase_total
-            
-            leaderboard_data.append({
-                "position": i + 1,
-                "team_id": session["team_id"],
-                "course_code": session.get("course_code", "MLN111"),
-                "topic": session["topic"],
-                "members": session["members"],
-                "total_score": total_score,
-                "max_score": 125,
-                "percentage": min(100, (total_score / 125) * 100) if total_score > 0 else 0,
-                "rank_level": "Gold Level" if total_score > 80 else "Silver Level",
-                "phase_scores": phase_scores,
-                "completed_at": session.get("completed_at", "2024-01-01T00:00:00")
-            })
-        
-        # Sort by total score
-        leaderboard_data.sort(key=lambda x: x["total_score"], reverse=True)
-        
-        # Update positions
-        for i, entry in enumerate(leaderboard_data):
-            entry["position"] = i + 1
-        
+        # Pick up sessions archived by other workers, then read the maintained leaderboard
+        await session_store.arefresh_completed()
         return {
-            "leaderboard": leaderboard_data[:20],  # Top 20
-            "statistics": {
-                "total_teams": len(completed_sessions),
-                "average_score": sum(entry["total_score"] for entry in leaderboard_data) / len(leaderboard_data) if leaderboard_data else 0,
-                "highest_score": max((entry["total_score"] for entry in leaderboard_data), default=0),
-                "rank_distribution": {
-                    "Platinum": len([e for e in leaderboard_data if e["total_score"] > 95]),
-                    "Gold": len([e for e in leaderboard_data if 80 <= e["total_score"] <= 95]),
-                    "Silver": len([e for e in leaderboard_data if 60 <= e["total_score"] < 80]),
-                    "Bronze": len([e for e in leaderboard_data if e["total_score"] < 60])
-                }
-            }
+            "leaderboard": leaderboard.top(20),  # Top 20
+            "statistics": leaderboard.statistics()
         }
     except Exception as e:
         print(f"Error in get_leaderboard: {e}")
@@ -870,24 +1051,15 @@ async def get_leaderboard():
 async def get_live_scoring(): 
     """Get live scoring data"""
     try:
-        live_data = []
-        for session_key, session_data in active_sessions.items():
-            live_data.append({
-                "team_id": session_data.get("team_id", session_key),
-                "topic": session_data["topic"],
-                "status": "in_progress",
-                "current_phase": session_data["current_phase"],
-                "members": session_data["members"],
-                "progress": min(100, session_data["turns_taken"] * 20),  # Rough progress calculation
-                "elapsed_time": "00:15:30"  # Could calculate actual time
-            })
-        
+        # The admin feed already keeps per-session summaries and running statistics
+        await session_store.arefresh_active()
+        statistics = admin_feed.statistics()
         return {
-            "live_scoring": live_data,
+            "live_scoring": [live_scoring_item(summary) for summary in admin_feed.active_summaries()],
             "statistics": {
-                "active_debates": len(active_sessions),
-                "total_participants": sum(len(session["members"]) for session in active_sessions.values()),
-                "average_progress": sum(min(100, session["turns_taken"] * 20) for session in active_sessions.values()) / len(active_sessions) if active_sessions else 0
+                "active_debates": statistics["active_debates"],
+                "total_participants": statistics["total_participants"],
+                "average_progress": statistics["average_progress"]
             }
         }
     except Exception as e:
@@ -901,11 +1073,48 @@ async def get_live_scoring():
             }
         }
 
+@app.get("/api/admin/feed")
+async def admin_feed_stream():
+    """Live admin feed (Server-Sent Events): a snapshot, then only per-session deltas"""
+    async def event_stream():
+        async for event, data in admin_feed.subscribe():
+            yield sse_event(event, data)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/admin/llm-stats")
+async def get_llm_stats():
+    """Get per-key LLM scheduling statistics"""
+    if not debate_system:
+        raise HTTPException(status_code=503, detail="Debate system not available")
+    return {
+        "keys": debate_system.key_pool.stats(),
+        "clients": debate_system.models.stats(),
+        "argument_pool": argument_pool.stats() if argument_pool else None,
+        "question_prefetch": question_prefetcher.stats(),
+        "cache": debate_system.cache.stats(),
+        "prompt_prefixes": debate_system.prefixes.stats(),
+        "tokens": {
+            "counter": debate_system.token_counter.method,
+            "evaluation_budget": debate_system.evaluation_token_budget,
+            "usage": debate_system.token_usage.stats(),
+        },
+        "single_flight": llm_flights.stats(),
+        "session_guard": session_guard.stats(),
+        "phase_evaluator": phase_evaluator.stats(),
+        "reports": report_renderer.stats()
+    }
+
 @app.post("/api/debate/{team_id}/phase4/conclusion")
+@session_guard.mutation("phase4/conclusion")
 async def submit_conclusion(team_id: str, request: SubmitArgumentsRequest):
     """Phase 4 Step 1: Submit student final conclusion - why they should win"""
     try:
-        session_key, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session = session_data["session"]
         
         # Check if conclusion already exists
@@ -932,33 +1141,45 @@ async def submit_conclusion(team_id: str, request: SubmitArgumentsRequest):
         session.conclusion = valid_arguments  # Sync with DebateSession
         session_data["current_phase"] = "Phase 4 - Student Conclusion"
         
+        await session_store.aput(session_key, session_data)
+        
         return {
             "success": True,
             "conclusion": valid_arguments,
             "message": "Phase 4 Step 1 completed: Student conclusion submitted. Now AI will generate counter-arguments."
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to submit conclusion: {str(e)}")
 
 @app.post("/api/debate/{team_id}/phase5/evaluate")
+@session_guard.mutation("phase5/evaluate")
 async def evaluate_debate_phase5(team_id: str):
     """Phase 5: Final evaluation and scoring"""
+    if not debate_system:
+        raise HTTPException(status_code=503, detail="Debate system not available")
+    
     try:
-        session_key, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session = session_data["session"]
         
-        # Generate comprehensive evaluation
-        evaluation = session.evaluate_debate()
+        # Merge the per-phase scores (computed in the background as phases closed) and write feedback
+        evaluation = await phase_evaluator.evaluate(session_key, session)
         
         # Update session data
         session_data["current_phase"] = "Phase 5"
         session_data["evaluation"] = evaluation
         
+        await session_store.aput(session_key, session_data)
+        
         return {
             "success": True,
             "evaluation": evaluation,
             "message": "Phase 5 evaluation completed successfully"
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to evaluate debate: {str(e)}")
 
@@ -966,7 +1187,7 @@ async def evaluate_debate_phase5(team_id: str):
 async def get_phase4_info(team_id: str):
     """Get Phase 4 conclusion information"""
     try:
-        session_key, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         return {
             "success": True,
             "team_id": session_data["team_id"],
@@ -981,10 +1202,11 @@ async def get_phase4_info(team_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get phase 4 info: {str(e)}")
 
 @app.post("/api/debate/{team_id}/phase4/evaluate")
+@session_guard.mutation("phase4/evaluate")
 async def evaluate_phase4(team_id: str):
     """Phase 4 Step 3: Mark Phase 4 as completed after AI counter-conclusion"""
     try:
-        session_key, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         
         # Check if already completed
         if session_data.get("current_phase") == "Phase 4 Completed":
@@ -1004,22 +1226,28 @@ async def evaluate_phase4(team_id: str):
         # Mark Phase 4 as completed
         session_data["current_phase"] = "Phase 4 Completed"
         
+        await session_store.aput(session_key, session_data)
+        score_closed_phases(session_key, session_data, 5)
+        
         return {
             "success": True,
             "current_phase": "Phase 4 Completed",
             "message": "Phase 4 evaluation completed. Ready for Phase 5."
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to evaluate Phase 4: {str(e)}")
 
 @app.post("/api/debate/{team_id}/phase4/ai-conclusion")
+@session_guard.mutation("phase4/ai-conclusion", lock=False)
 async def generate_ai_conclusion(team_id: str):
     """Phase 4 Step 2: Generate AI counter-conclusion - why AI should win"""
     if not debate_system:
         raise HTTPException(status_code=503, detail="Debate system not available")
     
     try:
-        session_key, session_data = get_active_session(team_id)
+        session_key, session_data = await get_active_session(team_id)
         session = session_data["session"]
         
         # Check if AI counter-arguments already exist
@@ -1038,284 +1266,70 @@ async def generate_ai_conclusion(team_id: str):
         student_conclusion = session_data["conclusion"]
         
         # Generate AI counter-conclusion (why AI should win)
-        ai_counter_arguments = debate_system.generate_arguments(
-            f"Tại sao AI nên thắng trong cuộc tranh luận về chủ đề '{topic}'. Phản bác lại các luận điểm tổng kết của sinh viên: " + "; ".join(student_conclusion), 
-            "opposing"
-        )
+        counter_topic = f"Tại sao AI nên thắng trong cuộc tranh luận về chủ đề '{topic}'. Phản bác lại các luận điểm tổng kết của sinh viên: " + "; ".join(student_conclusion)
         
-        # Store AI counter-arguments
-        session_data["ai_counter_arguments"] = ai_counter_arguments
-        session.ai_counter_arguments = ai_counter_arguments  # Sync with DebateSession
-        session_data["current_phase"] = "Phase 4 - AI Conclusion"
+        async def generate():
+            async with session_guard.lock(session_key):
+                # Checked again under the lock: a request that did not join this flight may have stored them
+                if session_data.get("ai_counter_arguments"):
+                    return session_data["ai_counter_arguments"]
+                
+                ai_counter_arguments = await debate_system.agenerate_arguments(counter_topic, "opposing")
+                
+                # Store AI counter-arguments
+                session_data["ai_counter_arguments"] = ai_counter_arguments
+                session.ai_counter_arguments = ai_counter_arguments  # Sync with DebateSession
+                session_data["current_phase"] = "Phase 4 - AI Conclusion"
+                
+                await session_store.aput(session_key, session_data)
+                return ai_counter_arguments
+        
+        ai_counter_arguments = await llm_flights.run(
+            (session_key, "phase4/ai-conclusion", prompt_key("opposing", counter_topic)), generate
+        )
         
         return {
             "success": True,
             "ai_counter_arguments": ai_counter_arguments,
             "message": "Phase 4 Step 2 completed: AI counter-conclusion generated. Ready for Phase 5 evaluation."
         }
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate AI conclusion: {str(e)}")
 
+@app.get("/api/debate/{team_id}/export")
 @app.get("/api/debate/{team_id}/export_docx")
-async def export_debate_report(team_id: str):
-    """Export debate report as DOCX file with complete debate history"""
+async def export_debate_report(team_id: str, report_format: str = Query("docx", alias="format")):
+    """Export debate report with complete debate history: DOCX file, or a lightweight html/markdown/json transcript"""
     decoded_id = decode_team_id(team_id)
 
-    _, session_data = get_any_session(team_id)
-    session_obj = session_data.get("session")
+    if report_format != "docx" and report_format not in TEXT_REPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: docx, {', '.join(TEXT_REPORT_FORMATS)}")
+
+    session_key, session_data = await get_any_session(team_id)
     team_id_display = session_data.get("team_id", decoded_id)
     
+    if report_format in TEXT_REPORT_FORMATS:
+        # Rendered from a snapshot while streaming: no python-docx, no cache needed
+        media_type, extension = TEXT_REPORT_FORMATS[report_format]
+        try:
+            chunks = iter_text_report(report_format, serialize_session_data(session_data, turn_pairs=True), team_id_display)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to generate report: {str(e)}")
+        return StreamingResponse(
+            chunks,
+            media_type=media_type,
+            headers={"Content-Disposition": f"inline; filename=debate_full_report_{team_id}.{extension}"}
+        )
+    
     try:
-        from docx import Document
-        from docx.shared import Inches
-        from docx.enum.text import WD_ALIGN_PARAGRAPH
-        from io import BytesIO
-        
-        # Create document
-        doc = Document()
-        doc.add_heading('MLN Debate System - Báo Cáo Chi Tiết & Lịch Sử Tranh Luận', 0)
-        
-        # Team information
-        doc.add_heading('📋 Thông Tin Nhóm', level=1)
-        doc.add_paragraph(f"Team ID: {team_id_display}")
-        doc.add_paragraph(f"Chủ đề: {session_data.get('topic', 'N/A')}")
-        doc.add_paragraph(f"Thành viên: {', '.join(session_data.get('members', []))}")
-        doc.add_paragraph(f"Mã học phần: {session_data.get('course_code', 'N/A')}")
-        doc.add_paragraph(f"Thời gian tạo: {session_data.get('created_at', 'N/A')}")
-        doc.add_paragraph(f"Trạng thái: {session_data.get('status', 'N/A')}")
-        if session_data.get('completed_at'):
-            doc.add_paragraph(f"Thời gian hoàn thành: {session_data.get('completed_at', 'N/A')}")
-        
-        # DEBATE HISTORY SECTION
-        doc.add_heading('🎯 Lịch Sử Tranh Luận Chi Tiết', level=1)
-        
-        # Phase 1: Initial Arguments
-        doc.add_heading('Phase 1: Luận Điểm Ban Đầu', level=2)
-        
-        # Team Arguments
-        team_arguments = session_data.get('arguments', [])
-        if session_obj and hasattr(session_obj, 'team_arguments'):
-            team_arguments = session_obj.team_arguments
-        
-        if team_arguments:
-            doc.add_heading('💭 Luận điểm của Team:', level=3)
-            for i, arg in enumerate(team_arguments, 1):
-                doc.add_paragraph(f"{i}. {arg}", style='List Number')
-        else:
-            doc.add_paragraph("Chưa có luận điểm từ team.")
-        
-        # AI Arguments  
-        ai_arguments = session_data.get('ai_arguments', [])
-        if session_obj and hasattr(session_obj, 'ai_arguments'):
-            ai_arguments = session_obj.ai_arguments
-            
-        if ai_arguments:
-            doc.add_heading('🤖 Luận điểm của AI:', level=3)
-            for i, arg in enumerate(ai_arguments, 1):
-                doc.add_paragraph(f"{i}. {arg}", style='List Number')
-        else:
-            doc.add_paragraph("Chưa có luận điểm từ AI.")
-        
-        # Phase 2: AI Questions & Team Responses
-        doc.add_heading('Phase 2: AI Chất Vấn Team', level=2)
-        
-        ai_questions = session_data.get('ai_questions', [])
-        if session_obj and hasattr(session_obj, 'questions'):
-            ai_questions = session_obj.questions
-            
-        if ai_questions:
-            doc.add_heading('❓ Câu hỏi của AI:', level=3)
-            for i, question in enumerate(ai_questions, 1):
-                doc.add_paragraph(f"Q{i}: {question}", style='Intense Quote')
-                
-        # Phase 2 Dialog: AI Questions & Student Responses
-        if session_obj and hasattr(session_obj, 'turns') and session_obj.turns:
-            doc.add_heading('🔄 Cuộc hội thoại Phase 2 (AI chất vấn Team):', level=3)
-            
-            # 🔧 FIXED: Phase 2 = ALL turns from session.turns
-            # The session.turns array contains ONLY Phase 2 data
-            # Phase 3 data is stored separately in session.phase3_turns
-            
-            ai_questions = []
-            student_answers = []
-            
-            # Process ALL turns from session.turns (these are ALL Phase 2)
-            for turn in session_obj.turns:
-                if turn.get('asker') == 'ai' and turn.get('question'):
-                    ai_questions.append(turn.get('question', ''))
-                elif turn.get('asker') == 'student' and turn.get('answer'):
-                    student_answers.append(turn.get('answer', ''))
-            
-            # Create pairs by matching questions with answers sequentially
-            turn_pairs = []
-            max_pairs = max(len(ai_questions), len(student_answers))
-            
-            for i in range(max_pairs):
-                ai_question = ai_questions[i] if i < len(ai_questions) else ''
-                student_answer = student_answers[i] if i < len(student_answers) else ''
-                
-                if ai_question or student_answer:  # Only add if there's content
-                    turn_pairs.append({
-                        'ai_question': ai_question,
-                        'student_answer': student_answer
-                    })
-            
-            # Display pairs nicely
-            for i, pair in enumerate(turn_pairs, 1):
-                doc.add_paragraph(f"Lượt {i}:", style='Heading 4')
-                doc.add_paragraph(f"🤖 AI hỏi: {pair.get('ai_question', '')}")
-                if pair.get('student_answer'):
-                    doc.add_paragraph(f"👥 Team trả lời: {pair.get('student_answer', '')}", style='Intense Quote')
-                else:
-                    doc.add_paragraph(f"👥 Team trả lời: (Chưa trả lời)")
-                doc.add_paragraph()  # Empty line
-        
-        # Phase 3: Team Questions & AI Responses  
-        doc.add_heading('Phase 3: Team Chất Vấn AI', level=2)
-        
-        # 🔧 FIXED: Use dedicated phase3_turns array - no complex logic needed
-        if session_obj and hasattr(session_obj, 'phase3_turns') and session_obj.phase3_turns:
-            doc.add_heading('🔄 Lượt hỏi đáp Phase 3:', level=3)
-            
-            # Group Phase 3 turns by pairs (Student question + AI answer)
-            phase3_pairs = []
-            current_phase3_pair = {}
-            
-            for turn in session_obj.phase3_turns:
-                if turn.get('asker') == 'student' and turn.get('question'):
-                    if current_phase3_pair:  # Save previous pair
-                        phase3_pairs.append(current_phase3_pair)
-                    current_phase3_pair = {'student_question': turn.get('question', ''), 'ai_answer': ''}
-                elif turn.get('asker') == 'ai' and turn.get('answer'):
-                    if current_phase3_pair:
-                        current_phase3_pair['ai_answer'] = turn.get('answer', '')
-            
-            if current_phase3_pair:  # Add last pair
-                phase3_pairs.append(current_phase3_pair)
-            
-            # Display Phase 3 pairs
-            for i, pair in enumerate(phase3_pairs, 1):
-                doc.add_paragraph(f"Lượt {i}:", style='Heading 4')
-                doc.add_paragraph(f"👥 Team hỏi: {pair.get('student_question', '')}")
-                if pair.get('ai_answer'):
-                    doc.add_paragraph(f"🤖 AI trả lời: {pair.get('ai_answer', '')}", style='Intense Quote')
-                else:
-                    doc.add_paragraph(f"🤖 AI trả lời: (Đang chờ AI trả lời...)")
-                doc.add_paragraph()  # Empty line
-        else:
-            doc.add_paragraph("(Chưa có lượt hỏi đáp nào trong Phase 3)")
-        
-        # Phase 4: Final Conclusions
-        doc.add_heading('Phase 4: Kết Luận Cuối Cùng', level=2)
-        
-        # Student Conclusion
-        conclusion = session_data.get('conclusion', [])
-        if session_obj and hasattr(session_obj, 'conclusion'):
-            conclusion = session_obj.conclusion
-            
-        if conclusion:
-            doc.add_heading('🎯 Kết luận của Team (Tại sao team nên thắng):', level=3)
-            for i, conc in enumerate(conclusion, 1):
-                doc.add_paragraph(f"{i}. {conc}", style='List Number')
-        else:
-            doc.add_paragraph("Chưa có kết luận từ team.")
-        
-        # AI Counter-arguments
-        ai_counter = session_data.get('ai_counter_arguments', [])
-        if session_obj and hasattr(session_obj, 'ai_counter_arguments'):
-            ai_counter = session_obj.ai_counter_arguments
-            
-        if ai_counter:
-            doc.add_heading('🤖 Phản bác của AI (Tại sao AI nên thắng):', level=3)
-            for i, counter in enumerate(ai_counter, 1):
-                doc.add_paragraph(f"{i}. {counter}", style='List Number')
-        else:
-            doc.add_paragraph("Chưa có phản bác từ AI.")
-        
-        # 🚫 REMOVED: Chat History section completely to prevent data mixing
-        # All conversation data is already displayed in proper Phase 2 and Phase 3 sections above
-        
-        # Evaluation scores
-        if session_data.get('evaluation'):
-            evaluation = session_data['evaluation']
-            doc.add_heading('📊 Kết Quả Chấm Điểm', level=1)
-            
-            total_score = 0
-            total_max_score = 100
-            
-            for phase_key in ['phase1', 'phase2', 'phase3', 'phase4']:
-                if phase_key in evaluation.get('scores', {}):
-                    phase_scores = evaluation['scores'][phase_key]
-                    phase_name = {
-                        'phase1': 'Giai đoạn 1: Luận điểm ban đầu',
-                        'phase2': 'Giai đoạn 2: AI chất vấn SV', 
-                        'phase3': 'Giai đoạn 3: SV chất vấn AI',
-                        'phase4': 'Giai đoạn 4: Tổng kết luận điểm'
-                    }.get(phase_key, phase_key)
-
-                    doc.add_heading(phase_name, level=2)
-                    
-                    table = doc.add_table(rows=1, cols=3)
-                    table.style = 'Table Grid'
-                    hdr_cells = table.rows[0].cells
-                    hdr_cells[0].text = 'Tiêu chí'
-                    hdr_cells[1].text = 'Điểm'
-                    hdr_cells[2].text = 'Tối đa'
-
-                    phase_total = 0
-                    for criterion_id, score in phase_scores.items():
-                        row_cells = table.add_row().cells
-                        row_cells[0].text = f"Tiêu chí {criterion_id}"
-                        row_cells[1].text = str(score)
-                        row_cells[2].text = "5" if criterion_id.endswith(('.3', '.4', '.5', '.6')) else "6"
-                        phase_total += int(score) if score else 0
-                    
-                    # Add phase total row
-                    total_row = table.add_row().cells
-                    total_row[0].text = 'Tổng điểm giai đoạn'
-                    total_row[1].text = str(phase_total)
-                    total_row[2].text = "25"
-                    
-                    total_score += phase_total
-
-            # Grand total
-            doc.add_heading('🏆 Tổng Điểm', level=2)
-            doc.add_paragraph(f"Tổng điểm: {total_score} / {total_max_score}")
-            doc.add_paragraph(f"Tỷ lệ: {(total_score/total_max_score*100):.1f}%")
-            
-            # Feedback
-            if evaluation.get('feedback'):
-                doc.add_heading('💭 Nhận Xét Từ AI', level=2)
-                doc.add_paragraph(evaluation['feedback'])
-        
-        # Summary Statistics
-        doc.add_heading('📈 Thống Kê Tổng Quan', level=1)
-        total_turns = 0
-        if session_obj and hasattr(session_obj, 'turns'):
-            total_turns = len(session_obj.turns)
-        if session_obj and hasattr(session_obj, 'phase3_turns'):
-            total_turns += len(session_obj.phase3_turns)
-            
-        doc.add_paragraph(f"Tổng số lượt hỏi đáp: {total_turns}")
-        doc.add_paragraph(f"Số luận điểm team: {len(team_arguments)}")
-        doc.add_paragraph(f"Số luận điểm AI: {len(ai_arguments)}")
-        doc.add_paragraph(f"Giai đoạn hiện tại: {session_data.get('current_phase', 'N/A')}")
-        
-        # Footer
-        doc.add_paragraph()
-        footer_para = doc.add_paragraph("📋 Báo cáo được tạo bởi MLN Debate System")
-        footer_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        footer_para = doc.add_paragraph("🌟 Hệ thống hỗ trợ tranh luận học thuật với AI")
-        footer_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        # Save to BytesIO
-        file_stream = BytesIO()
-        doc.save(file_stream)
-        file_stream.seek(0)
+        # Rendered in a worker thread; re-downloads of an unchanged session come from the cache
+        content = await report_renderer.render(session_key, session_data, team_id_display)
         
         return Response(
-            content=file_stream.getvalue(),
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            content=content,
+            media_type=DOCX_MEDIA_TYPE,
             headers={"Content-Disposition": f"attachment; filename=debate_full_report_{team_id}.docx"}
         )
         
@@ -1324,6 +1338,35 @@ async def export_debate_report(team_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate report: {str(e)}")
 
+@app.get("/api/admin/export_zip")
+async def export_reports_zip(course_code: Optional[str] = None, date_from: Optional[str] = None,
+                             date_to: Optional[str] = None):
+    """Export the DOCX reports of completed sessions (filtered by course and completion date) as one ZIP"""
+    try:
+        dates = [datetime.fromisoformat(d).date().isoformat() if d else None for d in (date_from, date_to)]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date_from/date_to must be dates like 2025-07-15")
+    
+    selected = []
+    for session_data in await session_store.alist_completed():
+        completed_on = (session_data.get("completed_at") or "")[:10]
+        if course_code and session_data.get("course_code") != course_code:
+            continue
+        if (dates[0] and completed_on < dates[0]) or (dates[1] and completed_on > dates[1]):
+            continue
+        team_id = session_data.get("team_id", "")
+        selected.append((session_data.get("session_key") or normalize_team_key(team_id), session_data, team_id))
+    
+    if not selected:
+        raise HTTPException(status_code=404, detail="No completed sessions match the filter")
+    
+    filename = "_".join(part for part in ("debate_reports", course_code, date_from, date_to) if part)
+    return StreamingResponse(
+        stream_reports_zip(report_renderer, selected),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}.zip"}
+    )
+
 @app.delete("/api/admin/history/{team_id}")
 async def delete_session_history(team_id: str):
     """Delete a session from completed history"""
@@ -1331,22 +1374,22 @@ async def delete_session_history(team_id: str):
     normalized_key = normalize_team_key(decoded_id)
     
     try:
-        # Find and remove from completed sessions
-        for i, session in enumerate(completed_sessions):
-            if normalize_team_key(session.get("team_id", "")) == normalized_key:
-                removed_session = completed_sessions.pop(i)
-                return {
-                    "success": True,
-                    "message": f"Session {removed_session.get('team_id', decoded_id)} deleted from history successfully",
-                    "deleted_session": {
-                        "team_id": removed_session["team_id"],
-                        "topic": removed_session.get("topic", "N/A"),
-                        "status": removed_session.get("status", "unknown")
-                    }
+        # Remove from completed sessions (indexed by normalized key)
+        removed_session = await session_store.aremove_completed(normalized_key)
+        report_renderer.discard(normalized_key)
+        if removed_session is not None:
+            return {
+                "success": True,
+                "message": f"Session {removed_session.get('team_id', decoded_id)} deleted from history successfully",
+                "deleted_session": {
+                    "team_id": removed_session["team_id"],
+                    "topic": removed_session.get("topic", "N/A"),
+                    "status": removed_session.get("status", "unknown")
                 }
+            }
         
         # If not found in completed, check if it's in active sessions
-        if normalized_key in active_sessions:
+        if await session_store.aget(normalized_key) is not None:
             raise HTTPException(status_code=400, detail="Cannot delete active session. Please end it first.")
         
         # Session not found
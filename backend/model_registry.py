@@ -0,0 +1,53 @@
+import logging
+import threading
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Lazily built, reusable chat model client per API key.
+
+    Each ChatGoogleGenerativeAI owns a long-lived gRPC channel (and, once used from
+    the event loop, a grpc_asyncio channel) bound to its API key. Keeping exactly one
+    client per key means every request and every failover on that key reuses the
+    same pooled connection, so switching keys costs a dictionary lookup instead of a
+    client construction plus TLS handshake.
+    """
+
+    def __init__(self, factory: Callable[[int], Any]):
+        self._factory = factory
+        self._models: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    def get(self, key_index: int) -> Any:
+        model = self._models.get(key_index)
+        if model is not None:
+            self.hits += 1
+            return model
+
+        with self._lock:
+            # Another thread may have built it while we waited for the lock
+            model = self._models.get(key_index)
+            if model is None:
+                model = self._factory(key_index)
+                self._models[key_index] = model
+                self.builds += 1
+                logger.info(f"🔌 Built client for API key #{key_index + 1}")
+            return model
+
+    def invalidate(self, key_index: int):
+        """Drop a client whose connection is broken; it is rebuilt on next use"""
+        with self._lock:
+            if self._models.pop(key_index, None) is not None:
+                logger.warning(f"♻️ Dropped client for API key #{key_index + 1}, will rebuild on next use")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._models),
+            "builds": self.builds,
+            "hits": self.hits,
+        }
@@ -0,0 +1,168 @@
+import asyncio
+import copy
+import json
+import logging
+from typing import Any, AsyncContextManager, Callable, Dict, Iterable, Tuple
+
+from debate_system import DEBATE_CRITERIA
+from llm_cache import prompt_key
+from session_store import SessionConflictError
+
+logger = logging.getLogger(__name__)
+
+
+def phase_input_hash(phase_key: str, phase_data: Dict[str, Any]) -> str:
+    """Fingerprint of what a phase was scored on, so edits after scoring trigger a re-score"""
+    return prompt_key(phase_key, json.dumps(phase_data, ensure_ascii=False, sort_keys=True))
+
+
+class PhaseEvaluator:
+    """
+    Scores each debate phase in the background as soon as it closes.
+
+    schedule() starts one evaluation per closed phase that has no up-to-date score;
+    the result is written to DebateSession.phase_scores together with a hash of the
+    phase data it was computed from. evaluate() (Phase 5) reuses every stored score
+    whose data is unchanged, awaits evaluations still running in this worker, runs
+    the missing ones concurrently, and only adds the small feedback call on top.
+    When no phase was scored ahead at all, it falls back to the single full-debate
+    evaluation instead, which is one call rather than four plus the feedback.
+    """
+
+    def __init__(self, debate_system, session_store, session_lock: Callable[[str], AsyncContextManager]):
+        self.debate_system = debate_system
+        self.session_store = session_store
+        self.session_lock = session_lock
+        self._tasks: Dict[Tuple[str, str], Tuple[str, asyncio.Task]] = {}
+        self.scheduled = 0
+        self.reused = 0
+        self.evaluated_at_phase5 = 0
+        self.full_evaluations = 0
+
+    def _is_fresh(self, session, phase_key: str, input_hash: str) -> bool:
+        stored = session.phase_scores.get(phase_key)
+        return stored is not None and stored.get("input_hash") == input_hash
+
+    def schedule(self, session_key: str, session, phases: Iterable[str]):
+        """Start background scoring of closed phases that are not scored (or not in flight) yet"""
+        for phase_key in phases:
+            phase_data = copy.deepcopy(session.phase_evaluation_data(phase_key))
+            input_hash = phase_input_hash(phase_key, phase_data)
+            if self._is_fresh(session, phase_key, input_hash):
+                continue
+            running = self._tasks.get((session_key, phase_key))
+            if running is not None and running[0] == input_hash:
+                continue
+            if running is not None:
+                running[1].cancel()  # Phase data changed while it was being scored
+
+            task = asyncio.create_task(self.debate_system.aevaluate_phase(phase_key, phase_data))
+            self._tasks[(session_key, phase_key)] = (input_hash, task)
+            task.add_done_callback(
+                lambda t, key=(session_key, phase_key), h=input_hash: self._on_done(key, h, t)
+            )
+            self.scheduled += 1
+            logger.info(f"📝 Scoring {phase_key} of '{session_key}' in the background")
+
+    def _on_done(self, key: Tuple[str, str], input_hash: str, task: asyncio.Task):
+        if self._tasks.get(key, (None, None))[1] is task:
+            del self._tasks[key]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning(f"⚠️ Background scoring of {key[1]} for '{key[0]}' failed: {task.exception()}")
+            return
+        if task.result() is not None:
+            asyncio.ensure_future(self._store(key[0], key[1], dict(task.result(), input_hash=input_hash)))
+
+    async def _store(self, session_key: str, phase_key: str, result: Dict[str, Any]):
+        async with self.session_lock(session_key):
+            for _ in range(3):
+                session_data = await self.session_store.aget(session_key)
+                if not session_data:
+                    return  # Ended or archived meanwhile
+                session = session_data["session"]
+                if session.phase_scores.get(phase_key) == result:
+                    return  # Phase 5 already stored it
+                if phase_input_hash(phase_key, session.phase_evaluation_data(phase_key)) != result["input_hash"]:
+                    return  # Scored data that has changed since
+                session.phase_scores[phase_key] = result
+                try:
+                    await self.session_store.aput(session_key, session_data)
+                    return
+                except SessionConflictError:
+                    continue  # Another worker wrote the session; reload and retry
+            logger.warning(f"⚠️ Could not store {phase_key} score for '{session_key}' after repeated conflicts")
+
+    async def _phase_result(self, session_key: str, session, phase_key: str) -> Dict[str, Any]:
+        phase_data = copy.deepcopy(session.phase_evaluation_data(phase_key))
+        input_hash = phase_input_hash(phase_key, phase_data)
+        if self._is_fresh(session, phase_key, input_hash):
+            self.reused += 1
+            return session.phase_scores[phase_key]
+
+        running = self._tasks.get((session_key, phase_key))
+        result = None
+        if running is not None and running[0] == input_hash:
+            try:
+                result = await asyncio.shield(running[1])
+                self.reused += 1
+            except Exception as e:
+                logger.warning(f"⚠️ Background scoring of {phase_key} failed, retrying: {e}")
+        if result is None:
+            self.evaluated_at_phase5 += 1
+            result = await self.debate_system.aevaluate_phase(phase_key, phase_data)
+        if result is None:
+            # Same fallback as the full evaluation when the model never returns valid scores
+            result = {
+                "scores": {criterion['id']: 0 for criterion in DEBATE_CRITERIA[phase_key]},
+                "notes": "Lỗi hệ thống: Không thể phân tích phản hồi từ AI."
+            }
+        return dict(result, input_hash=input_hash)
+
+    def _has_precomputed(self, session_key: str, session) -> bool:
+        """Some phase has an up-to-date stored score or one still being computed in this worker"""
+        for phase_key in DEBATE_CRITERIA:
+            input_hash = phase_input_hash(phase_key, session.phase_evaluation_data(phase_key))
+            running = self._tasks.get((session_key, phase_key))
+            if self._is_fresh(session, phase_key, input_hash) or (running is not None and running[0] == input_hash):
+                return True
+        return False
+
+    async def evaluate(self, session_key: str, session) -> Dict[str, Any]:
+        """Phase 5: merge the per-phase scores and write the overall feedback"""
+        if not self._has_precomputed(session_key, session):
+            self.full_evaluations += 1
+            logger.info(f"📝 No phase of '{session_key}' was scored ahead, evaluating the whole debate at once")
+            return await session.aevaluate_debate()
+
+        phase_keys = list(DEBATE_CRITERIA)
+        results = await asyncio.gather(*(self._phase_result(session_key, session, key) for key in phase_keys))
+        session.phase_scores.update(zip(phase_keys, results))
+
+        phase_results = dict(zip(phase_keys, results))
+        try:
+            feedback = await self.debate_system.agenerate_feedback(session.topic, phase_results)
+        except Exception as e:
+            logger.warning(f"⚠️ Feedback generation failed, using the phase notes: {e}")
+            feedback = ""
+        if not feedback:
+            feedback = "\n".join(result["notes"] for result in results if result.get("notes"))
+
+        scores = {key: dict(result["scores"]) for key, result in phase_results.items()}
+        scores["phase5"] = {}
+        session.evaluation = {"scores": scores, "feedback": feedback}
+        return session.evaluation
+
+    def cancel(self, session_key: str):
+        for key in [key for key in self._tasks if key[0] == session_key]:
+            self._tasks.pop(key)[1].cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._tasks),
+            "scheduled": self.scheduled,
+            "reused_at_phase5": self.reused,
+            "evaluated_at_phase5": self.evaluated_at_phase5,
+            "full_evaluations": self.full_evaluations,
+        }
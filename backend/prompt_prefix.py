@@ -0,0 +1,68 @@
+import logging
+import threading
+from typing import Any, Dict, List, Union
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from token_budget import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+Prompt = Union[str, List[BaseMessage]]
+
+
+def prompt_text(prompt: Prompt) -> str:
+    """The full text of a prompt, whether it is a plain string or prefix + suffix messages"""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(str(message.content) for message in prompt)
+
+
+class PromptPrefixRegistry:
+    """
+    Static instruction blocks shared by many prompts.
+
+    Each template is split into a static system prefix (role, rules, criteria),
+    registered here once, and a short dynamic suffix (topic, student input). Every
+    request then starts with a byte-identical system message, which is what the
+    provider's prefix caching keys on. The registry counts the prefix tokens that
+    repeat across requests, i.e. what such a cache can serve instead of re-reading,
+    with the same counter the prompt budgets use.
+    """
+
+    def __init__(self, counter: TokenCounter):
+        self.counter = counter
+        self._prefixes: Dict[str, str] = {}
+        self._uses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, text: str):
+        text = text.strip()
+        with self._lock:
+            if self._prefixes.get(name) == text:
+                return
+            if name in self._prefixes:
+                logger.warning(f"⚠️ Prompt prefix '{name}' re-registered with different text")
+            self._prefixes[name] = text
+            self._uses.setdefault(name, 0)
+
+    def compose(self, name: str, suffix: str) -> List[BaseMessage]:
+        """Messages for one request: the registered prefix, then the dynamic part"""
+        with self._lock:
+            prefix = self._prefixes[name]
+            self._uses[name] += 1
+        return [SystemMessage(content=prefix), HumanMessage(content=suffix.strip())]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            prefixes = [(name, text, self._uses[name]) for name, text in self._prefixes.items()]
+        result = {}
+        for name, text, uses in prefixes:
+            tokens = self.counter.count(text)
+            result[name] = {
+                "chars": len(text),
+                "tokens": tokens,
+                "uses": uses,
+                "reused_tokens": tokens * max(0, uses - 1),
+            }
+        return result
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionPrefetcher:
+    """
+    Speculative generation of the next Phase 2 AI question.
+
+    As soon as a student answer is stored, the follow-up question is generated in
+    the background while the student reads the turn. The next /ai-question/generate
+    call for the same answer picks up the in-flight (or finished) task instead of
+    starting its own LLM call. A newer answer for the session cancels the old
+    speculation, and results nobody asked for expire after `ttl_seconds`.
+    """
+
+    def __init__(self, ttl_seconds: float = 600.0):
+        self.ttl_seconds = ttl_seconds
+        self._tasks: Dict[str, Tuple[str, float, asyncio.Task]] = {}
+        self.started = 0
+        self.used = 0
+        self.cancelled = 0
+
+    def _expire(self):
+        now = time.time()
+        for session_key, (_, created_at, _) in list(self._tasks.items()):
+            if now - created_at > self.ttl_seconds:
+                self.cancel(session_key)
+
+    def start(self, session_key: str, answer: str, debate_system, topic: str):
+        """Begin generating the question that will follow `answer`"""
+        self._expire()
+        existing = self._tasks.get(session_key)
+        if existing is not None and existing[0] == answer:
+            return  # Same answer re-submitted: keep the running speculation
+        self.cancel(session_key)
+
+        task = asyncio.create_task(debate_system.agenerate_questions([answer], topic))
+        # Nobody may ever await this task; retrieve its exception so it is not logged as lost
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[session_key] = (answer, time.time(), task)
+        self.started += 1
+
+    def take(self, session_key: str, answer: str) -> Optional[asyncio.Task]:
+        """Hand over the speculation for exactly this answer, or None"""
+        entry = self._tasks.pop(session_key, None)
+        if entry is None:
+            return None
+        speculated_answer, _, task = entry
+        if speculated_answer != answer:
+            # Generated for an answer that has since been replaced
+            task.cancel()
+            self.cancelled += 1
+            return None
+        self.used += 1
+        return task
+
+    def cancel(self, session_key: str):
+        entry = self._tasks.pop(session_key, None)
+        if entry is not None and not entry[2].done():
+            entry[2].cancel()
+            self.cancelled += 1
+            logger.info(f"🛑 Cancelled prefetched question for '{session_key}'")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": sum(1 for _, _, task in self._tasks.values() if not task.done()),
+            "ready": sum(1 for _, _, task in self._tasks.values() if task.done()),
+            "started": self.started,
+            "used": self.used,
+            "cancelled": self.cancelled,
+        }
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+import types
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from llm_cache import prompt_key
+from report_template import ReportTemplate, init_render_worker, load_report_template, render_debate_report
+from session_store import serialize_session_data
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _render_process_context():
+    # Render processes must not be forked from the server: it already runs threads
+    # (store I/O, HTTP clients, the event loop) and a child could inherit one of
+    # their locks held. A fork server started with only report_template loaded
+    # forks clean workers; spawn where there is none.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["report_template"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+@contextmanager
+def _without_main_script():
+    # spawn and forkserver children re-run the parent's __main__ script first;
+    # under `python main.py` that would start a whole server in every render
+    # process, so workers are launched with an empty __main__ instead
+    main_module = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+
+class ReportRenderer:
+    """
+    Renders DOCX reports off the event loop and keeps the latest one per session.
+
+    Building a report is pure-Python XML work that holds the GIL, so renders run
+    in a pool of `workers` processes, each with its own copy of the template;
+    only the serialized session goes in and the .docx bytes come back. The pool
+    starts with the first render, so a server that never exports runs none.
+    A report's version is a hash of the serialized session it was built from, so
+    it stays valid exactly until the session mutates and re-downloads of an
+    archived debate never render again. Only the newest version per session is
+    kept (LRU bounded to `max_entries` sessions), and concurrent exports of the
+    same version share one render.
+    """
+
+    def __init__(self, max_entries: int = 100, workers: int = 2, template: Optional[ReportTemplate] = None):
+        self.max_entries = max_entries
+        self.workers = max(1, workers)
+        # Loaded here too, so a broken REPORT_TEMPLATE_PATH fails at start-up rather than per export
+        self.template = template or load_report_template()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._reports: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._renders = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_render_process_context(),
+                                                 initializer=init_render_worker, initargs=(self.template.path,))
+        return self._executor
+
+    async def _render_in_pool(self, raw: str, team_id_display: str) -> bytes:
+        executor = self._pool()
+        try:
+            # The pool starts its processes as renders are submitted
+            with _without_main_script():
+                future = executor.submit(render_debate_report, raw, team_id_display)
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            # A render process died (killed, out of memory): later exports get a fresh pool
+            if self._executor is executor:
+                logger.error("❌ Report render pool broke; the next render starts a new one")
+                self._executor = None
+            raise
+
+    async def render(self, session_key: str, session_data: Dict[str, Any], team_id_display: str) -> bytes:
+        raw = serialize_session_data(session_data, turn_pairs=True)
+        version = prompt_key(team_id_display, raw)
+        cached = self._reports.get(session_key)
+        if cached is not None and cached[0] == version:
+            self._reports.move_to_end(session_key)
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        content = await self._renders.run(
+            (session_key, version),
+            lambda: self._render_in_pool(raw, team_id_display)
+        )
+        if self.max_entries > 0:
+            self._reports[session_key] = (version, content)
+            self._reports.move_to_end(session_key)
+            while len(self._reports) > self.max_entries:
+                self._reports.popitem(last=False)
+        return content
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def discard(self, session_key: str):
+        """Forget a session's report once it is deleted from history"""
+        self._reports.pop(session_key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._reports),
+            "max_entries": self.max_entries,
+            "cached_bytes": sum(len(content) for _, content in self._reports.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self._renders.joined,
+            "template": self.template.path or "default",
+        }
+
+
+class _ZipChunks:
+    """Write-only sink for ZipFile: collects what was written since the last drain()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def report_filename(team_id: str, used: set) -> str:
+    """A safe, unique .docx name inside the archive for a team"""
+    base = re.sub(r'[\\/:*?"<>|\s]+', "_", team_id).strip("._") or "team"
+    name, n = f"{base}.docx", 1
+    while name in used:
+        n += 1
+        name = f"{base}_{n}.docx"
+    used.add(name)
+    return name
+
+
+async def stream_reports_zip(renderer: ReportRenderer,
+                             sessions: Iterable[Tuple[str, Dict[str, Any], str]]) -> AsyncIterator[bytes]:
+    """
+    ZIP archive of the reports of (session key, session_data, team id) entries, produced as it is built.
+
+    A window of renders runs ahead on the renderer's pool; each finished report is
+    written to the archive and flushed to the client straight away, so the first
+    bytes leave after the first document and memory holds at most the window.
+    The .docx files are already compressed and are stored as they are.
+    """
+    sink = _ZipChunks()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+    loop = asyncio.get_running_loop()
+    window = renderer.workers * 2
+    pending: "deque[Tuple[str, asyncio.Task]]" = deque()
+    entries = iter(sessions)
+    used_names: set = set()
+    try:
+        while True:
+            for session_key, session_data, team_id in entries:
+                task = loop.create_task(renderer.render(session_key, session_data, team_id))
+                pending.append((report_filename(team_id, used_names), task))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+            name, task = pending.popleft()
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            try:
+                content = await task
+            except Exception as e:
+                # One broken session must not cut off the archive for the whole class
+                logger.warning(f"⚠️ Report {name} failed in bulk export: {e}")
+                info.filename = f"{name[:-len('.docx')]}_LỖI.txt"
+                content = f"Không thể tạo báo cáo: {e}".encode("utf-8")
+            archive.writestr(info, content)
+            yield sink.drain()
+        archive.close()
+        yield sink.drain()
+    finally:
+        # Client went away (or a render failed): do not leave renders running for nobody
+        for _, task in pending:
+            task.cancel()
+
+
+def create_report_renderer() -> ReportRenderer:
+    return ReportRenderer(
+        max_entries=int(os.getenv("REPORT_CACHE_SIZE", "100")),
+        workers=int(os.getenv("REPORT_WORKERS", "2")),
+    )
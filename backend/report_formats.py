@@ -0,0 +1,194 @@
+import html
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator
+
+from report_template import (
+    PHASE_REPORT_NAMES, Block, Heading, Paragraph, phase2_turn_pairs, phase3_turn_pairs, phase_score_rows,
+    report_blocks, session_field,
+)
+
+logger = logging.getLogger(__name__)
+
+# format -> (media type, file extension)
+TEXT_REPORT_FORMATS = {
+    "html": ("text/html; charset=utf-8", "html"),
+    "markdown": ("text/markdown; charset=utf-8", "md"),
+    "json": ("application/json", "json"),
+}
+
+CHUNK_SIZE = 16 * 1024
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="vi">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: system-ui, sans-serif; max-width: 52rem; margin: 2rem auto; padding: 0 1rem; line-height: 1.5; }}
+blockquote {{ margin: .5rem 0; padding: .5rem 1rem; border-left: 4px solid #4f81bd; background: #f3f6fb; font-style: italic; }}
+table {{ border-collapse: collapse; margin: .5rem 0 1rem; }}
+td {{ border: 1px solid #999; padding: .25rem .75rem; }}
+.center {{ text-align: center; }}
+</style>
+</head>
+<body>
+"""
+HTML_TAIL = "</body>\n</html>\n"
+
+
+def _batched(pieces: Iterable[str], size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Join small rendered pieces into chunks of about `size` bytes for the response stream"""
+    buffer, buffered = [], 0
+    for piece in pieces:
+        data = piece.encode("utf-8")
+        buffer.append(data)
+        buffered += len(data)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _html_text(text: str) -> str:
+    return html.escape(text).replace("\n", "<br>\n")
+
+
+def _html_block(block: Block) -> str:
+    if isinstance(block, Heading):
+        tag = f"h{min(block.level + 1, 6)}"
+        return f"<{tag}>{_html_text(block.text)}</{tag}>\n"
+    if isinstance(block, Paragraph):
+        if block.style and block.style.startswith('Heading '):
+            tag = f"h{min(int(block.style[len('Heading '):]) + 1, 6)}"
+            return f"<{tag}>{_html_text(block.text)}</{tag}>\n"
+        if block.style == 'Intense Quote':
+            return f"<blockquote>{_html_text(block.text)}</blockquote>\n"
+        if not block.text:
+            return "<br>\n"
+        attrs = ' class="center"' if block.center else ""
+        return f"<p{attrs}>{_html_text(block.text)}</p>\n"
+    rows = "".join(
+        "<tr>" + "".join(f"<td>{_html_text(value)}</td>" for value in row) + "</tr>\n"
+        for row in block.rows
+    )
+    return f"<table>\n{rows}</table>\n"
+
+
+def iter_html_report(session_data: Dict[str, Any], team_id_display: str) -> Iterator[bytes]:
+    """The report as a standalone HTML page, rendered block by block as it is streamed"""
+    def pieces():
+        yield HTML_HEAD.format(title=html.escape(f"MLN Debate - {team_id_display}"))
+        for block in report_blocks(session_data, team_id_display):
+            yield _html_block(block)
+        yield HTML_TAIL
+    return _batched(pieces())
+
+
+def _markdown_text(text: str) -> str:
+    # A line starting with '#' or '>' would turn into a heading or a quote
+    return "\n".join("\\" + line if line.startswith(("#", ">")) else line for line in text.split("\n"))
+
+
+def _markdown_block(block: Block) -> str:
+    if isinstance(block, Heading):
+        return f"{'#' * min(block.level + 1, 6)} {block.text}\n\n"
+    if isinstance(block, Paragraph):
+        if block.style and block.style.startswith('Heading '):
+            return f"{'#' * min(int(block.style[len('Heading '):]) + 1, 6)} {block.text}\n\n"
+        if block.style == 'Intense Quote':
+            return "\n".join(f"> {line}" for line in block.text.split("\n")) + "\n\n"
+        if block.style == 'List Number':
+            # The text already carries its "1. " number
+            return block.text + "\n\n"
+        if not block.text:
+            return ""
+        return _markdown_text(block.text) + "\n\n"
+
+    def cells(row):
+        return "| " + " | ".join(value.replace("|", "\\|").replace("\n", " ") for value in row) + " |\n"
+    header, *rows = block.rows
+    return cells(header) + "|" + "---|" * len(header) + "\n" + "".join(cells(row) for row in rows) + "\n"
+
+
+def iter_markdown_report(session_data: Dict[str, Any], team_id_display: str) -> Iterator[bytes]:
+    """The report as Markdown, rendered block by block as it is streamed"""
+    return _batched(_markdown_block(block) for block in report_blocks(session_data, team_id_display))
+
+
+def report_json(session_data: Dict[str, Any], team_id_display: str) -> Dict[str, Any]:
+    """The report's content as structured data: same pairing and totals as the DOCX, without the layout"""
+    session = session_data.get("session")
+    turns = session_field(session, 'turns', [])
+    phase3_turns = session_field(session, 'phase3_turns', [])
+    team_arguments = session_field(session, 'team_arguments', session_data.get('arguments', []))
+    ai_arguments = session_field(session, 'ai_arguments', session_data.get('ai_arguments', []))
+
+    evaluation = None
+    if session_data.get('evaluation'):
+        scores = session_data['evaluation'].get('scores', {})
+        phases = {}
+        for phase_key in ['phase1', 'phase2', 'phase3', 'phase4']:
+            if phase_key in scores:
+                _, phase_total = phase_score_rows(scores[phase_key])
+                phases[phase_key] = {
+                    "name": PHASE_REPORT_NAMES.get(phase_key, phase_key),
+                    "scores": scores[phase_key],
+                    "total": phase_total,
+                    "max_total": 25,
+                }
+        total_score = sum(phase["total"] for phase in phases.values())
+        total_max_score = 100
+        evaluation = {
+            "phases": phases,
+            "total_score": total_score,
+            "max_score": total_max_score,
+            "percentage": round(total_score / total_max_score * 100, 1),
+            "feedback": session_data['evaluation'].get('feedback', ''),
+        }
+
+    return {
+        "team_id": team_id_display,
+        "topic": session_data.get('topic'),
+        "members": session_data.get('members', []),
+        "course_code": session_data.get('course_code'),
+        "created_at": session_data.get('created_at'),
+        "completed_at": session_data.get('completed_at'),
+        "status": session_data.get('status'),
+        "current_phase": session_data.get('current_phase'),
+        "phase1": {"team_arguments": team_arguments, "ai_arguments": ai_arguments},
+        "phase2": {
+            "ai_questions": session_field(session, 'questions', session_data.get('ai_questions', [])),
+            "turn_pairs": phase2_turn_pairs(session),
+        },
+        "phase3": {"turn_pairs": phase3_turn_pairs(session)},
+        "phase4": {
+            "conclusion": session_field(session, 'conclusion', session_data.get('conclusion', [])),
+            "ai_counter_arguments": session_field(session, 'ai_counter_arguments',
+                                                   session_data.get('ai_counter_arguments', [])),
+        },
+        "evaluation": evaluation,
+        "stats": {
+            "total_turns": len(turns) + len(phase3_turns),
+            "team_arguments": len(team_arguments),
+            "ai_arguments": len(ai_arguments),
+        },
+    }
+
+
+def iter_text_report(report_format: str, raw_session_data: str, team_id_display: str) -> Iterator[bytes]:
+    """
+    Chunks of a lightweight report ('html', 'markdown' or 'json') from a serialized session_data snapshot.
+
+    These reuse the DOCX report's layout and turn pairing but skip python-docx
+    entirely, so a transcript to read costs a fraction of the CPU and bytes.
+    """
+    session_data = json.loads(raw_session_data)
+    if report_format == "html":
+        return iter_html_report(session_data, team_id_display)
+    if report_format == "markdown":
+        return iter_markdown_report(session_data, team_id_display)
+    if report_format == "json":
+        return iter([json.dumps(report_json(session_data, team_id_display), ensure_ascii=False, indent=2).encode("utf-8")])
+    raise ValueError(f"Unknown report format '{report_format}'")
@@ -0,0 +1,352 @@
+import copy
+import json
+import logging
+import os
+import threading
+from io import BytesIO
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from turn_pairs import Phase2TurnPairs, Phase3TurnPairs
+
+logger = logging.getLogger(__name__)
+
+def session_field(session: Optional[Dict[str, Any]], name: str, fallback: Any) -> Any:
+    """A DebateSession field from its serialized form; the session_data copy if there is no session"""
+    return session[name] if session and name in session else fallback
+
+
+class Heading(NamedTuple):
+    text: str
+    level: int = 1
+
+
+class Paragraph(NamedTuple):
+    text: str = ""
+    style: Optional[str] = None
+    center: bool = False
+
+
+class Table(NamedTuple):
+    rows: List[Tuple[str, ...]]
+    style: str = 'Table Grid'
+
+
+Block = Union[Heading, Paragraph, Table]
+
+
+PHASE_REPORT_NAMES = {
+    'phase1': 'Giai đoạn 1: Luận điểm ban đầu',
+    'phase2': 'Giai đoạn 2: AI chất vấn SV',
+    'phase3': 'Giai đoạn 3: SV chất vấn AI',
+    'phase4': 'Giai đoạn 4: Tổng kết luận điểm'
+}
+
+
+def phase2_turn_pairs(session: Optional[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Phase 2 {'ai_question', 'student_answer'} pairs: the session's ready index, or rebuilt from its turns"""
+    pairs = session_field(session, 'phase2_pairs', None)
+    return pairs if pairs is not None else Phase2TurnPairs(session_field(session, 'turns', [])).pairs
+
+
+def phase3_turn_pairs(session: Optional[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Phase 3 {'student_question', 'ai_answer'} pairs: the session's ready index, or rebuilt from its turns"""
+    pairs = session_field(session, 'phase3_pairs', None)
+    return pairs if pairs is not None else Phase3TurnPairs(session_field(session, 'phase3_turns', [])).pairs
+
+
+def phase_score_rows(phase_scores: Dict[str, Any]) -> Tuple[List[Tuple[str, str, str]], int]:
+    """Score table rows of one phase (header, one per criterion, phase total) and the phase total"""
+    rows = [('Tiêu chí', 'Điểm', 'Tối đa')]
+    phase_total = 0
+    for criterion_id, score in phase_scores.items():
+        max_score = "5" if criterion_id.endswith(('.3', '.4', '.5', '.6')) else "6"
+        rows.append((f"Tiêu chí {criterion_id}", str(score), max_score))
+        phase_total += int(score) if score else 0
+
+    # Add phase total row
+    rows.append(('Tổng điểm giai đoạn', str(phase_total), "25"))
+    return rows, phase_total
+
+
+def report_blocks(session_data: Dict[str, Any], team_id_display: str) -> Iterator[Block]:
+    """The report layout: every heading, paragraph and score table, in order, for any writer or text format"""
+    session = session_data.get("session")
+
+    yield Heading('MLN Debate System - Báo Cáo Chi Tiết & Lịch Sử Tranh Luận', 0)
+
+    # Team information
+    yield Heading('📋 Thông Tin Nhóm', level=1)
+    yield Paragraph(f"Team ID: {team_id_display}")
+    yield Paragraph(f"Chủ đề: {session_data.get('topic', 'N/A')}")
+    yield Paragraph(f"Thành viên: {', '.join(session_data.get('members', []))}")
+    yield Paragraph(f"Mã học phần: {session_data.get('course_code', 'N/A')}")
+    yield Paragraph(f"Thời gian tạo: {session_data.get('created_at', 'N/A')}")
+    yield Paragraph(f"Trạng thái: {session_data.get('status', 'N/A')}")
+    if session_data.get('completed_at'):
+        yield Paragraph(f"Thời gian hoàn thành: {session_data.get('completed_at', 'N/A')}")
+
+    # DEBATE HISTORY SECTION
+    yield Heading('🎯 Lịch Sử Tranh Luận Chi Tiết', level=1)
+
+    # Phase 1: Initial Arguments
+    yield Heading('Phase 1: Luận Điểm Ban Đầu', level=2)
+
+    # Team Arguments
+    team_arguments = session_field(session, 'team_arguments', session_data.get('arguments', []))
+
+    if team_arguments:
+        yield Heading('💭 Luận điểm của Team:', level=3)
+        for i, arg in enumerate(team_arguments, 1):
+            yield Paragraph(f"{i}. {arg}", style='List Number')
+    else:
+        yield Paragraph("Chưa có luận điểm từ team.")
+
+    # AI Arguments
+    ai_arguments = session_field(session, 'ai_arguments', session_data.get('ai_arguments', []))
+    if ai_arguments:
+        yield Heading('🤖 Luận điểm của AI:', level=3)
+        for i, arg in enumerate(ai_arguments, 1):
+            yield Paragraph(f"{i}. {arg}", style='List Number')
+    else:
+        yield Paragraph("Chưa có luận điểm từ AI.")
+
+    # Phase 2: AI Questions & Team Responses
+    yield Heading('Phase 2: AI Chất Vấn Team', level=2)
+
+    ai_questions = session_field(session, 'questions', session_data.get('ai_questions', []))
+    if ai_questions:
+        yield Heading('❓ Câu hỏi của AI:', level=3)
+        for i, question in enumerate(ai_questions, 1):
+            yield Paragraph(f"Q{i}: {question}", style='Intense Quote')
+
+    # Phase 2 Dialog: AI Questions & Student Responses
+    if session_field(session, 'turns', []):
+        yield Heading('🔄 Cuộc hội thoại Phase 2 (AI chất vấn Team):', level=3)
+
+        turn_pairs = phase2_turn_pairs(session)
+
+        # Display pairs nicely
+        for i, pair in enumerate(turn_pairs, 1):
+            yield Paragraph(f"Lượt {i}:", style='Heading 4')
+            yield Paragraph(f"🤖 AI hỏi: {pair.get('ai_question', '')}")
+            if pair.get('student_answer'):
+                yield Paragraph(f"👥 Team trả lời: {pair.get('student_answer', '')}", style='Intense Quote')
+            else:
+                yield Paragraph(f"👥 Team trả lời: (Chưa trả lời)")
+            yield Paragraph()  # Empty line
+
+    # Phase 3: Team Questions & AI Responses
+    yield Heading('Phase 3: Team Chất Vấn AI', level=2)
+
+    # 🔧 FIXED: Use dedicated phase3_turns array - no complex logic needed
+    if session_field(session, 'phase3_turns', []):
+        yield Heading('🔄 Lượt hỏi đáp Phase 3:', level=3)
+
+        phase3_pairs = phase3_turn_pairs(session)
+
+        # Display Phase 3 pairs
+        for i, pair in enumerate(phase3_pairs, 1):
+            yield Paragraph(f"Lượt {i}:", style='Heading 4')
+            yield Paragraph(f"👥 Team hỏi: {pair.get('student_question', '')}")
+            if pair.get('ai_answer'):
+                yield Paragraph(f"🤖 AI trả lời: {pair.get('ai_answer', '')}", style='Intense Quote')
+            else:
+                yield Paragraph(f"🤖 AI trả lời: (Đang chờ AI trả lời...)")
+            yield Paragraph()  # Empty line
+    else:
+        yield Paragraph("(Chưa có lượt hỏi đáp nào trong Phase 3)")
+
+    # Phase 4: Final Conclusions
+    yield Heading('Phase 4: Kết Luận Cuối Cùng', level=2)
+
+    # Student Conclusion
+    conclusion = session_field(session, 'conclusion', session_data.get('conclusion', []))
+    if conclusion:
+        yield Heading('🎯 Kết luận của Team (Tại sao team nên thắng):', level=3)
+        for i, conc in enumerate(conclusion, 1):
+            yield Paragraph(f"{i}. {conc}", style='List Number')
+    else:
+        yield Paragraph("Chưa có kết luận từ team.")
+
+    # AI Counter-arguments
+    ai_counter = session_field(session, 'ai_counter_arguments', session_data.get('ai_counter_arguments', []))
+    if ai_counter:
+        yield Heading('🤖 Phản bác của AI (Tại sao AI nên thắng):', level=3)
+        for i, counter in enumerate(ai_counter, 1):
+            yield Paragraph(f"{i}. {counter}", style='List Number')
+    else:
+        yield Paragraph("Chưa có phản bác từ AI.")
+
+    # 🚫 REMOVED: Chat History section completely to prevent data mixing
+    # All conversation data is already displayed in proper Phase 2 and Phase 3 sections above
+
+    # Evaluation scores
+    if session_data.get('evaluation'):
+        evaluation = session_data['evaluation']
+        yield Heading('📊 Kết Quả Chấm Điểm', level=1)
+
+        total_score = 0
+        total_max_score = 100
+
+        for phase_key in ['phase1', 'phase2', 'phase3', 'phase4']:
+            if phase_key in evaluation.get('scores', {}):
+                phase_scores = evaluation['scores'][phase_key]
+                phase_name = PHASE_REPORT_NAMES.get(phase_key, phase_key)
+
+                yield Heading(phase_name, level=2)
+
+                rows, phase_total = phase_score_rows(phase_scores)
+                yield Table(rows, style='Table Grid')
+
+                total_score += phase_total
+
+        # Grand total
+        yield Heading('🏆 Tổng Điểm', level=2)
+        yield Paragraph(f"Tổng điểm: {total_score} / {total_max_score}")
+        yield Paragraph(f"Tỷ lệ: {(total_score/total_max_score*100):.1f}%")
+
+        # Feedback
+        if evaluation.get('feedback'):
+            yield Heading('💭 Nhận Xét Từ AI', level=2)
+            yield Paragraph(evaluation['feedback'])
+
+    # Summary Statistics
+    yield Heading('📈 Thống Kê Tổng Quan', level=1)
+    total_turns = len(session_field(session, 'turns', [])) + len(session_field(session, 'phase3_turns', []))
+    yield Paragraph(f"Tổng số lượt hỏi đáp: {total_turns}")
+    yield Paragraph(f"Số luận điểm team: {len(team_arguments)}")
+    yield Paragraph(f"Số luận điểm AI: {len(ai_arguments)}")
+    yield Paragraph(f"Giai đoạn hiện tại: {session_data.get('current_phase', 'N/A')}")
+
+    # Footer
+    yield Paragraph()
+    yield Paragraph("📋 Báo cáo được tạo bởi MLN Debate System", center=True)
+    yield Paragraph("🌟 Hệ thống hỗ trợ tranh luận học thuật với AI", center=True)
+
+
+REPORT_STYLES = ('Title', 'Heading 1', 'Heading 2', 'Heading 3', 'Heading 4', 'List Number', 'Intense Quote', 'Table Grid')
+
+
+def _heading_style(level: int) -> str:
+    return 'Title' if level == 0 else f'Heading {level}'
+
+
+class ReportTemplate:
+    """
+    A parsed .docx skeleton that every report is cloned from.
+
+    Loading it (python-docx's built-in template by default, or a prepared file
+    with the school's letterhead and styles) parses the package and resolves the
+    report's styles to their ids once. Each report then starts from an in-memory
+    copy of that document instead of reading and parsing the template again, and
+    its writer builds the paragraph and table XML directly with the resolved ids,
+    appending the whole body in one go before saving.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        from docx import Document
+
+        self.path = path
+        self._document = Document(path)
+        self._clone_lock = threading.Lock()
+        missing = [name for name in REPORT_STYLES if name not in self._document.styles]
+        if missing:
+            raise ValueError(f"Report template {path} is missing styles: {', '.join(missing)}")
+        self.style_ids = {name: self._document.styles[name].style_id for name in REPORT_STYLES}
+        section = self._document.sections[-1]
+        self.block_width = section.page_width - section.left_margin - section.right_margin
+
+    def new_writer(self) -> "_TemplateWriter":
+        with self._clone_lock:
+            document = copy.deepcopy(self._document)
+        return _TemplateWriter(document, self.style_ids, self.block_width)
+
+
+class _TemplateWriter:
+    """Report writer over a cloned template: builds the body XML and inserts it at once"""
+
+    def __init__(self, document, style_ids: Dict[str, str], block_width: int):
+        self.document = document
+        self.style_ids = style_ids
+        self.block_width = block_width
+        self._blocks: List[Any] = []
+
+    def heading(self, text: str, level: int = 1):
+        self.paragraph(text, style=_heading_style(level))
+
+    def paragraph(self, text: str = "", style: Optional[str] = None, center: bool = False):
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+        from docx.oxml import OxmlElement
+
+        p = OxmlElement('w:p')
+        if style:
+            p.get_or_add_pPr().style = self.style_ids[style]
+        if center:
+            p.get_or_add_pPr().jc_val = WD_ALIGN_PARAGRAPH.CENTER
+        if text:
+            p.add_r().text = text
+        self._blocks.append(p)
+
+    def table(self, rows: List[Tuple[str, ...]], style: str = 'Table Grid'):
+        from docx.oxml.table import CT_Tbl
+
+        tbl = CT_Tbl.new_tbl(len(rows), len(rows[0]), self.block_width)
+        tbl.tblStyle_val = self.style_ids[style]
+        for tr, values in zip(tbl.tr_lst, rows):
+            for tc, value in zip(tr.tc_lst, values):
+                tc.p_lst[0].add_r().text = value
+        self._blocks.append(tbl)
+
+    def to_bytes(self) -> bytes:
+        body = self.document.element.body
+        sectPr = body.sectPr
+        position = body.index(sectPr) if sectPr is not None else len(body)
+        body[position:position] = self._blocks
+        file_stream = BytesIO()
+        self.document.save(file_stream)
+        return file_stream.getvalue()
+
+
+def write_report(out, session_data: Dict[str, Any], team_id_display: str):
+    """Feed the report layout to a DOCX writer"""
+    for block in report_blocks(session_data, team_id_display):
+        if isinstance(block, Heading):
+            out.heading(block.text, block.level)
+        elif isinstance(block, Paragraph):
+            out.paragraph(block.text, block.style, block.center)
+        else:
+            out.table(block.rows, block.style)
+
+
+_default_template: Optional[ReportTemplate] = None
+_default_template_lock = threading.Lock()
+
+
+def load_report_template() -> ReportTemplate:
+    """The process-wide skeleton from REPORT_TEMPLATE_PATH (python-docx's default if unset), loaded once"""
+    global _default_template
+    with _default_template_lock:
+        if _default_template is None:
+            path = os.getenv("REPORT_TEMPLATE_PATH") or None
+            _default_template = ReportTemplate(path)
+            logger.info(f"📄 Report template loaded from {path or 'python-docx default'}")
+        return _default_template
+
+
+def init_render_worker(template_path: Optional[str]):
+    """Render process start-up: parse the renderer's template once for every report the process builds"""
+    global _default_template
+    _default_template = ReportTemplate(template_path)
+
+
+def render_debate_report(raw_session_data: str, team_id_display: str,
+                         template: Optional[ReportTemplate] = None) -> bytes:
+    """
+    Build the full DOCX report from a serialized session_data snapshot.
+
+    Works on plain JSON rather than the live session so it can run in a render
+    process while handlers keep mutating the session on the event loop.
+    """
+    out = (template or load_report_template()).new_writer()
+    write_report(out, json.loads(raw_session_data), team_id_display)
+    return out.to_bytes()
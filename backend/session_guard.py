@@ -0,0 +1,124 @@
+import asyncio
+import functools
+import inspect
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Header
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+class SessionGuard:
+    """
+    Serializes state-mutating requests per session and replays idempotent retries.
+
+    Each session has an asyncio lock, so two requests for the same team (the
+    DebateRoom timer auto-submitting while the student clicks) run one after the
+    other and "already exists" checks inside a handler are no longer check-then-act.
+    A request carrying an Idempotency-Key header gets its successful response
+    remembered for `ttl_seconds`; a retry with the same key, session and endpoint
+    receives that response again without running the handler. Locks and remembered
+    responses are per worker: across workers the session store's version check
+    still turns a lost race into a 409.
+    """
+
+    def __init__(self, session_key: Callable[[str], str], ttl_seconds: float = 300.0, max_responses: int = 1000):
+        self.session_key = session_key
+        self.ttl_seconds = ttl_seconds
+        self.max_responses = max_responses
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+        self._responses: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.replays = 0
+
+    @asynccontextmanager
+    async def lock(self, session_key: str):
+        """Hold the session's lock; it is dropped again once nobody holds or awaits it"""
+        lock = self._locks.get(session_key)
+        if lock is None:
+            lock = self._locks[session_key] = asyncio.Lock()
+        self._lock_users[session_key] = self._lock_users.get(session_key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[session_key] -= 1
+            if not self._lock_users[session_key]:
+                del self._lock_users[session_key]
+                del self._locks[session_key]
+
+    def _replay(self, cache_key: Optional[Hashable]) -> Optional[Any]:
+        if cache_key is None:
+            return None
+        now = time.time()
+        while self._responses:
+            oldest_key, (created_at, _) = next(iter(self._responses.items()))
+            if now - created_at <= self.ttl_seconds:
+                break
+            del self._responses[oldest_key]
+        entry = self._responses.get(cache_key)
+        if entry is None:
+            return None
+        self.replays += 1
+        logger.info(f"🔁 Replaying response for {cache_key[1]} (idempotency key {cache_key[2]!r})")
+        return entry[1]
+
+    def _remember(self, cache_key: Optional[Hashable], response: Any):
+        if cache_key is None:
+            return
+        self._responses[cache_key] = (time.time(), response)
+        while len(self._responses) > self.max_responses:
+            self._responses.popitem(last=False)
+
+    def mutation(self, endpoint: str, lock: bool = True):
+        """
+        Decorator for a `team_id` endpoint: adds the optional Idempotency-Key header
+        and, unless `lock` is False, runs the handler under the session lock.
+        Handlers that coalesce duplicate LLM calls pass lock=False and take the
+        lock around their write themselves, so a retry can still join the call
+        in flight instead of queueing behind it.
+        """
+        def decorate(handler):
+            @functools.wraps(handler)
+            async def guarded(*args, idempotency_key: Optional[str] = None, **kwargs):
+                session_key = self.session_key(kwargs["team_id"])
+                cache_key = (session_key, endpoint, idempotency_key) if idempotency_key else None
+
+                async def run():
+                    replay = self._replay(cache_key)
+                    if replay is not None:
+                        return replay
+                    response = await handler(*args, **kwargs)
+                    self._remember(cache_key, response)
+                    return response
+
+                if not lock:
+                    return await run()
+                async with self.lock(session_key):
+                    return await run()
+
+            signature = inspect.signature(handler)
+            guarded.__signature__ = signature.replace(parameters=[
+                *signature.parameters.values(),
+                inspect.Parameter(
+                    "idempotency_key",
+                    inspect.Parameter.KEYWORD_ONLY,
+                    default=Header(None, alias=IDEMPOTENCY_HEADER),
+                    annotation=Optional[str],
+                ),
+            ])
+            return guarded
+        return decorate
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "locked_sessions": len(self._locks),
+            "remembered_responses": len(self._responses),
+            "replays": self.replays,
+        }
@@ -0,0 +1,716 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from debate_system import DebateSession
+
+logger = logging.getLogger(__name__)
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Called with (session_key, session_data), or (session_key, None) when the session goes away
+SessionListener = Callable[[str, Optional[Dict[str, Any]]], None]
+
+# Worker threads per process for blocking database/Redis calls made by request handlers
+STORE_IO_THREADS = 4
+
+
+def serialize_session_data(session_data: Dict[str, Any], turn_pairs: bool = False) -> str:
+    """Serialize a session_data dict (including its DebateSession) to JSON; see DebateSession.to_dict for turn_pairs"""
+    payload = dict(session_data)
+    session = payload.get("session")
+    if isinstance(session, DebateSession):
+        payload["session"] = session.to_dict(turn_pairs)
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def deserialize_session_data(raw: str, debate_system=None) -> Dict[str, Any]:
+    """Rebuild a session_data dict, re-binding its DebateSession to the live DebateSystem"""
+    payload = json.loads(raw)
+    if isinstance(payload.get("session"), dict):
+        payload["session"] = DebateSession.from_dict(payload["session"], debate_system)
+    return payload
+
+
+class SessionStore(ABC):
+    """
+    Storage for active and completed debate sessions.
+
+    Active sessions are keyed by normalized team key. Completed sessions are keyed by
+    the same key and kept in completion order, so history lookups and deletes are
+    constant time; archiving a team again replaces its previous record.
+
+    Listeners (the leaderboard, the admin feed) observe changes without rescanning:
+    active listeners are called on every put() and when a session is archived
+    (session_data None); completed listeners when a session is archived or removed
+    from history. Changes made by other workers are delivered once the store is
+    refreshed.
+
+    Request handlers use the awaitable a*() variants (aget, aput, ...); stores that
+    do blocking I/O run those calls off the event loop.
+    """
+
+    def __init__(self):
+        self._active_listeners: List[SessionListener] = []
+        self._completed_listeners: List[SessionListener] = []
+
+    def add_active_listener(self, listener: SessionListener):
+        """Register a listener and replay the current active sessions to it"""
+        self._active_listeners.append(listener)
+        for session_key, session_data in list(self._active.items()):
+            listener(session_key, session_data)
+
+    def add_completed_listener(self, listener: SessionListener):
+        """Register a listener and replay the current archive to it, oldest first"""
+        self._completed_listeners.append(listener)
+        for session_key, session_data in list(self._completed.items()):
+            listener(session_key, session_data)
+
+    def _notify(self, listeners: List[SessionListener], session_key: str, session_data: Optional[Dict[str, Any]]):
+        for listener in listeners:
+            try:
+                listener(session_key, session_data)
+            except Exception as e:
+                logger.error(f"❌ Session listener failed for '{session_key}': {e}")
+
+    def _notify_active(self, session_key: str, session_data: Optional[Dict[str, Any]]):
+        self._notify(self._active_listeners, session_key, session_data)
+
+    def _notify_completed(self, session_key: str, session_data: Optional[Dict[str, Any]]):
+        self._notify(self._completed_listeners, session_key, session_data)
+
+    def refresh_active(self):
+        """Pick up active-session changes made by other workers (no-op for process-local stores)"""
+
+    def refresh_completed(self):
+        """Pick up archive changes made by other workers (no-op for process-local stores)"""
+
+    @abstractmethod
+    def get(self, session_key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def put(self, session_key: str, session_data: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def list_active(self) -> List[Tuple[str, Dict[str, Any]]]:
+        ...
+
+    @abstractmethod
+    def archive(self, session_key: str, completed_data: Dict[str, Any]):
+        """Move a session from active to the completed archive"""
+
+    @abstractmethod
+    def list_completed(self) -> List[Dict[str, Any]]:
+        """All completed sessions, oldest first"""
+
+    @abstractmethod
+    def recent_completed(self, limit: int) -> List[Dict[str, Any]]:
+        """The last `limit` completed sessions, oldest first"""
+
+    @abstractmethod
+    def get_completed(self, session_key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def remove_completed(self, session_key: str) -> Optional[Dict[str, Any]]:
+        """Remove and return a completed session, or None if it is not in the archive"""
+
+    # --- Awaitable access for request handlers ------------------------------
+
+    async def _call(self, method: Callable[..., Any], *args) -> Any:
+        """Run one store operation; process-local stores never block, so it runs inline"""
+        return method(*args)
+
+    async def aget(self, session_key: str) -> Optional[Dict[str, Any]]:
+        return await self._call(self.get, session_key)
+
+    async def aput(self, session_key: str, session_data: Dict[str, Any]):
+        return await self._call(self.put, session_key, session_data)
+
+    async def alist_active(self) -> List[Tuple[str, Dict[str, Any]]]:
+        return await self._call(self.list_active)
+
+    async def aarchive(self, session_key: str, completed_data: Dict[str, Any]):
+        return await self._call(self.archive, session_key, completed_data)
+
+    async def alist_completed(self) -> List[Dict[str, Any]]:
+        return await self._call(self.list_completed)
+
+    async def arecent_completed(self, limit: int) -> List[Dict[str, Any]]:
+        return await self._call(self.recent_completed, limit)
+
+    async def aget_completed(self, session_key: str) -> Optional[Dict[str, Any]]:
+        return await self._call(self.get_completed, session_key)
+
+    async def aremove_completed(self, session_key: str) -> Optional[Dict[str, Any]]:
+        return await self._call(self.remove_completed, session_key)
+
+    async def arefresh_active(self):
+        return await self._call(self.refresh_active)
+
+    async def arefresh_completed(self):
+        return await self._call(self.refresh_completed)
+
+
+def _last_values(ordered: "OrderedDict[str, Dict[str, Any]]", limit: int) -> List[Dict[str, Any]]:
+    """Last `limit` values of an OrderedDict without copying the whole archive"""
+    recent = list(islice(reversed(ordered.values()), max(limit, 0)))
+    recent.reverse()
+    return recent
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store (previous behaviour); everything is lost on restart"""
+
+    def __init__(self):
+        super().__init__()
+        self._active: Dict[str, Dict[str, Any]] = {}
+        self._completed: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, session_key: str) -> Optional[Dict[str, Any]]:
+        return self._active.get(session_key)
+
+    def put(self, session_key: str, session_data: Dict[str, Any]):
+        self._active[session_key] = session_data
+        self._notify_active(session_key, session_data)
+
+    def list_active(self) -> List[Tuple[str, Dict[str, Any]]]:
+        return list(self._active.items())
+
+    def archive(self, session_key: str, completed_data: Dict[str, Any]):
+        # Re-archiving a team moves it to the end, like a fresh completion
+        self._completed.pop(session_key, None)
+        self._completed[session_key] = completed_data
+        if self._active.pop(session_key, None) is not None:
+            self._notify_active(session_key, None)
+        self._notify_completed(session_key, completed_data)
+
+    def list_completed(self) -> List[Dict[str, Any]]:
+        return list(self._completed.values())
+
+    def recent_completed(self, limit: int) -> List[Dict[str, Any]]:
+        return _last_values(self._completed, limit)
+
+    def get_completed(self, session_key: str) -> Optional[Dict[str, Any]]:
+        return self._completed.get(session_key)
+
+    def remove_completed(self, session_key: str) -> Optional[Dict[str, Any]]:
+        removed = self._completed.pop(session_key, None)
+        if removed is not None:
+            self._notify_completed(session_key, None)
+        return removed
+
+
+class SessionConflictError(Exception):
+    """Raised when a session was changed by another worker after this worker read it"""
+
+    def __init__(self, session_key: str):
+        super().__init__(f"Session '{session_key}' was updated by another request, please reload and retry")
+        self.session_key = session_key
+
+
+class VersionedSessionStore(SessionStore):
+    """
+    Base for stores shared by several worker processes.
+
+    Every active session carries a version number in the shared backend. Live objects
+    are cached per process so handlers keep mutating session_data in place, but each
+    get() checks the cached version against the backend and reloads the session when
+    another worker has written it. put() is a compare-and-swap on that version, so a
+    worker holding a stale copy gets a SessionConflictError instead of silently
+    overwriting another worker's update.
+
+    The awaitable variants run on a small per-store thread pool, so a slow database
+    or Redis round trip (and the JSON encoding of a large session) never stalls the
+    event loop. The store lock keeps the cache consistent across those threads;
+    listeners may therefore be called from a store thread.
+
+    Subclasses only implement the small set of backend primitives below.
+    """
+
+    def __init__(self, debate_system=None):
+        super().__init__()
+        self.debate_system = debate_system
+        self._lock = threading.RLock()
+        self._active: Dict[str, Dict[str, Any]] = {}
+        self._versions: Dict[str, int] = {}
+        self._completed: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._completed_ids: Dict[str, int] = {}  # Backend record id behind each cached archive entry
+        self._completed_generation: Optional[int] = None
+        self._io_executor = ThreadPoolExecutor(max_workers=STORE_IO_THREADS, thread_name_prefix="session-store")
+
+    async def _call(self, method: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_executor, functools.partial(method, *args))
+
+    # --- Backend primitives -------------------------------------------------
+
+    @abstractmethod
+    def _fetch_version(self, session_key: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def _fetch(self, session_key: str) -> Optional[Tuple[int, str]]:
+        """Return (version, serialized data) of an active session"""
+
+    @abstractmethod
+    def _write(self, session_key: str, raw: str, expected_version: Optional[int]) -> int:
+        """Store a session if its version still matches (None = must not exist yet); return the new version"""
+
+    @abstractmethod
+    def _fetch_active_versions(self) -> List[Tuple[str, int]]:
+        """All active session keys with their versions, in creation order"""
+
+    @abstractmethod
+    def _move_to_completed(self, session_key: str, raw: str, completed_at: Optional[str],
+                           expected_version: Optional[int]) -> Tuple[int, int]:
+        """
+        Atomically delete the active session and append it to the archive, replacing
+        any earlier record for the same key; return (record id, archive generation)
+        """
+
+    @abstractmethod
+    def _fetch_completed_generation(self) -> int:
+        """Counter bumped by every archive/delete, so an unchanged archive costs one lookup"""
+
+    @abstractmethod
+    def _fetch_completed_index(self) -> List[Tuple[str, int]]:
+        """(session key, record id) of every completed session, oldest first"""
+
+    @abstractmethod
+    def _fetch_completed(self, session_keys: List[str]) -> List[Tuple[str, str]]:
+        ...
+
+    @abstractmethod
+    def _delete_completed(self, session_key: str) -> int:
+        """Delete a completed session; return the new archive generation"""
+
+    # --- SessionStore -------------------------------------------------------
+
+    def _load(self, description: str):
+        active = self.list_active()
+        completed = self.list_completed()
+        logger.info(f"💾 Loaded {len(active)} active and {len(completed)} completed sessions from {description}")
+
+    def _drop_active(self, session_key: str):
+        self._versions.pop(session_key, None)
+        if self._active.pop(session_key, None) is not None:
+            self._notify_active(session_key, None)
+
+    def _reload(self, session_key: str) -> Optional[Dict[str, Any]]:
+        row = self._fetch(session_key)
+        if row is None:
+            self._drop_active(session_key)
+            return None
+        version, raw = row
+        session_data = deserialize_session_data(raw, self.debate_system)
+        self._active[session_key] = session_data
+        self._versions[session_key] = version
+        self._notify_active(session_key, session_data)
+        return session_data
+
+    def get(self, session_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            version = self._fetch_version(session_key)
+            if version is None:
+                # Archived or removed by another worker
+                self._drop_active(session_key)
+                return None
+            if self._versions.get(session_key) == version:
+                return self._active[session_key]
+            return self._reload(session_key)
+
+    def put(self, session_key: str, session_data: Dict[str, Any]):
+        raw = serialize_session_data(session_data)
+        with self._lock:
+            cached = self._active.get(session_key)
+            if cached is None:
+                expected_version = None
+            elif cached is session_data:
+                expected_version = self._versions[session_key]
+            else:
+                # The cached copy was reloaded after this request read its own (now stale) copy
+                raise SessionConflictError(session_key)
+            self._versions[session_key] = self._write(session_key, raw, expected_version)
+            self._active[session_key] = session_data
+            self._notify_active(session_key, session_data)
+
+    def list_active(self) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            versions = self._fetch_active_versions()
+            live_keys = {session_key for session_key, _ in versions}
+            for session_key in [key for key in self._active if key not in live_keys]:
+                self._drop_active(session_key)
+
+            result = []
+            for session_key, version in versions:
+                session_data = self._active.get(session_key)
+                if session_data is None or self._versions.get(session_key) != version:
+                    session_data = self._reload(session_key)
+                if session_data is not None:
+                    result.append((session_key, session_data))
+            return result
+
+    def _sync_completed(self):
+        """Bring the cached archive up to date if another worker archived or deleted sessions"""
+        generation = self._fetch_completed_generation()
+        if generation == self._completed_generation:
+            return
+        index = self._fetch_completed_index()
+        changed = [session_key for session_key, record_id in index if self._completed_ids.get(session_key) != record_id]
+        loaded = {
+            session_key: deserialize_session_data(raw, self.debate_system)
+            for session_key, raw in (self._fetch_completed(changed) if changed else [])
+        }
+        completed: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        completed_ids: Dict[str, int] = {}
+        for session_key, record_id in index:
+            session_data = loaded[session_key] if session_key in loaded else self._completed.get(session_key)
+            if session_data is None:
+                continue
+            completed[session_key] = session_data
+            completed_ids[session_key] = record_id
+        removed = [session_key for session_key in self._completed if session_key not in completed]
+        self._completed = completed
+        self._completed_ids = completed_ids
+        self._completed_generation = generation
+
+        for session_key in removed:
+            self._notify_completed(session_key, None)
+        for session_key, session_data in loaded.items():
+            if session_key in completed:
+                self._notify_completed(session_key, session_data)
+
+    def _note_completed_generation(self, generation: int):
+        # Our own write only bumped the counter by one: the cache is still complete
+        if self._completed_generation is not None and generation == self._completed_generation + 1:
+            self._completed_generation = generation
+        else:
+            self._completed_generation = None
+
+    def archive(self, session_key: str, completed_data: Dict[str, Any]):
+        raw = serialize_session_data(completed_data)
+        with self._lock:
+            record_id, generation = self._move_to_completed(
+                session_key, raw, completed_data.get("completed_at"), self._versions.get(session_key)
+            )
+            self._completed.pop(session_key, None)
+            self._completed[session_key] = completed_data
+            self._completed_ids[session_key] = record_id
+            self._note_completed_generation(generation)
+            self._drop_active(session_key)
+            self._notify_completed(session_key, completed_data)
+
+    def add_active_listener(self, listener: SessionListener):
+        with self._lock:
+            self.list_active()
+            super().add_active_listener(listener)
+
+    def add_completed_listener(self, listener: SessionListener):
+        with self._lock:
+            self._sync_completed()
+            super().add_completed_listener(listener)
+
+    def refresh_active(self):
+        self.list_active()
+
+    def refresh_completed(self):
+        with self._lock:
+            self._sync_completed()
+
+    def list_completed(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._sync_completed()
+            return list(self._completed.values())
+
+    def recent_completed(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._sync_completed()
+            return _last_values(self._completed, limit)
+
+    def get_completed(self, session_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._sync_completed()
+            return self._completed.get(session_key)
+
+    def remove_completed(self, session_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._sync_completed()
+            if session_key not in self._completed:
+                return None
+            self._note_completed_generation(self._delete_completed(session_key))
+            self._completed_ids.pop(session_key, None)
+            removed = self._completed.pop(session_key)
+            self._notify_completed(session_key, None)
+            return removed
+
+
+class SQLiteSessionStore(VersionedSessionStore):
+    """
+    SQLite (WAL) backed store. Every put() writes the serialized state through to
+    disk, sessions are reloaded after a restart, and several worker processes on the
+    same host can share one database file.
+    """
+
+    def __init__(self, db_path: str, debate_system=None):
+        super().__init__(debate_system)
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Other workers may hold the write lock for a moment
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS active_sessions (
+                session_key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completed_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_key TEXT NOT NULL,
+                data TEXT NOT NULL,
+                completed_at TEXT
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_completed_session_key ON completed_sessions (session_key)"
+        )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS store_meta (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("INSERT OR IGNORE INTO store_meta (name, value) VALUES ('completed_generation', 0)")
+        # Databases created before sessions were versioned
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(active_sessions)")}
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE active_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        self._conn.commit()
+        self._load(db_path)
+
+    def _fetch_version(self, session_key: str) -> Optional[int]:
+        row = self._conn.execute(
+            "SELECT version FROM active_sessions WHERE session_key = ?", (session_key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _fetch(self, session_key: str) -> Optional[Tuple[int, str]]:
+        row = self._conn.execute(
+            "SELECT version, data FROM active_sessions WHERE session_key = ?", (session_key,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _write(self, session_key: str, raw: str, expected_version: Optional[int]) -> int:
+        with self._conn:
+            if expected_version is None:
+                try:
+                    self._conn.execute(
+                        "INSERT INTO active_sessions (session_key, data, version, updated_at) "
+                        "VALUES (?, ?, 1, CURRENT_TIMESTAMP)",
+                        (session_key, raw)
+                    )
+                except sqlite3.IntegrityError:
+                    raise SessionConflictError(session_key)
+                return 1
+            cursor = self._conn.execute(
+                "UPDATE active_sessions SET data = ?, version = version + 1, updated_at = CURRENT_TIMESTAMP "
+                "WHERE session_key = ? AND version = ?",
+                (raw, session_key, expected_version)
+            )
+            if cursor.rowcount == 0:
+                raise SessionConflictError(session_key)
+            return expected_version + 1
+
+    def _fetch_active_versions(self) -> List[Tuple[str, int]]:
+        return self._conn.execute("SELECT session_key, version FROM active_sessions ORDER BY rowid").fetchall()
+
+    def _bump_completed_generation(self) -> int:
+        self._conn.execute("UPDATE store_meta SET value = value + 1 WHERE name = 'completed_generation'")
+        return self._fetch_completed_generation()
+
+    def _move_to_completed(self, session_key: str, raw: str, completed_at: Optional[str],
+                           expected_version: Optional[int]) -> Tuple[int, int]:
+        with self._conn:
+            if expected_version is None:
+                self._conn.execute("DELETE FROM active_sessions WHERE session_key = ?", (session_key,))
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM active_sessions WHERE session_key = ? AND version = ?",
+                    (session_key, expected_version)
+                )
+                if cursor.rowcount == 0:
+                    raise SessionConflictError(session_key)
+            self._conn.execute("DELETE FROM completed_sessions WHERE session_key = ?", (session_key,))
+            cursor = self._conn.execute(
+                "INSERT INTO completed_sessions (session_key, data, completed_at) VALUES (?, ?, ?)",
+                (session_key, raw, completed_at)
+            )
+            return cursor.lastrowid, self._bump_completed_generation()
+
+    def _fetch_completed_generation(self) -> int:
+        return self._conn.execute(
+            "SELECT value FROM store_meta WHERE name = 'completed_generation'"
+        ).fetchone()[0]
+
+    def _fetch_completed_index(self) -> List[Tuple[str, int]]:
+        # Older databases may hold several records per team: the latest one wins
+        return self._conn.execute(
+            "SELECT session_key, MAX(id) AS record_id FROM completed_sessions GROUP BY session_key ORDER BY record_id"
+        ).fetchall()
+
+    def _fetch_completed(self, session_keys: List[str]) -> List[Tuple[str, str]]:
+        placeholders = ",".join("?" for _ in session_keys)
+        return self._conn.execute(
+            f"SELECT session_key, data FROM completed_sessions WHERE session_key IN ({placeholders}) ORDER BY id",
+            session_keys
+        ).fetchall()
+
+    def _delete_completed(self, session_key: str) -> int:
+        with self._conn:
+            self._conn.execute("DELETE FROM completed_sessions WHERE session_key = ?", (session_key,))
+            return self._bump_completed_generation()
+
+
+class RedisSessionStore(VersionedSessionStore):
+    """
+    Redis-protocol backed store for workers spread over several hosts. Works with
+    Redis or any server speaking its protocol (KeyDB, Dragonfly, Valkey).
+    Compare-and-swap writes use WATCH/MULTI on the session hash.
+    """
+
+    def __init__(self, url: str, debate_system=None, prefix: str = "mln_debate:"):
+        import redis  # Optional dependency, only needed for SESSION_STORE=redis
+
+        super().__init__(debate_system)
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._redis.ping()
+        self._watch_error = redis.WatchError
+        self._prefix = prefix
+        self._load(url)
+
+    def _key(self, *parts: str) -> str:
+        return self._prefix + ":".join(parts)
+
+    def _fetch_version(self, session_key: str) -> Optional[int]:
+        version = self._redis.hget(self._key("session", session_key), "version")
+        return int(version) if version is not None else None
+
+    def _fetch(self, session_key: str) -> Optional[Tuple[int, str]]:
+        version, raw = self._redis.hmget(self._key("session", session_key), "version", "data")
+        if version is None or raw is None:
+            return None
+        return int(version), raw
+
+    def _check_version(self, pipe, session_key: str, expected_version: Optional[int]):
+        current = pipe.hget(self._key("session", session_key), "version")
+        current = int(current) if current is not None else None
+        if current != expected_version:
+            raise SessionConflictError(session_key)
+
+    def _write(self, session_key: str, raw: str, expected_version: Optional[int]) -> int:
+        session_hash = self._key("session", session_key)
+        new_version = (expected_version or 0) + 1
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(session_hash)
+                self._check_version(pipe, session_key, expected_version)
+                pipe.multi()
+                pipe.hset(session_hash, mapping={"data": raw, "version": new_version})
+                pipe.zadd(self._key("active"), {session_key: time.time()}, nx=True)
+                pipe.execute()
+            except self._watch_error:
+                raise SessionConflictError(session_key)
+        return new_version
+
+    def _fetch_active_versions(self) -> List[Tuple[str, int]]:
+        session_keys = self._redis.zrange(self._key("active"), 0, -1)
+        if not session_keys:
+            return []
+        pipe = self._redis.pipeline(transaction=False)
+        for session_key in session_keys:
+            pipe.hget(self._key("session", session_key), "version")
+        versions = pipe.execute()
+        return [(session_key, int(version)) for session_key, version in zip(session_keys, versions) if version is not None]
+
+    def _move_to_completed(self, session_key: str, raw: str, completed_at: Optional[str],
+                           expected_version: Optional[int]) -> Tuple[int, int]:
+        session_hash = self._key("session", session_key)
+        record_id = self._redis.incr(self._key("completed_seq"))
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(session_hash)
+                if expected_version is not None:
+                    self._check_version(pipe, session_key, expected_version)
+                pipe.multi()
+                pipe.delete(session_hash)
+                pipe.zrem(self._key("active"), session_key)
+                pipe.hset(self._key("completed"), session_key, raw)
+                # Score is the record id: re-archiving a team moves it to the end
+                pipe.zadd(self._key("completed_ids"), {session_key: record_id})
+                pipe.incr(self._key("completed_generation"))
+                generation = pipe.execute()[-1]
+            except self._watch_error:
+                raise SessionConflictError(session_key)
+        return record_id, generation
+
+    def _fetch_completed_generation(self) -> int:
+        return int(self._redis.get(self._key("completed_generation")) or 0)
+
+    def _fetch_completed_index(self) -> List[Tuple[str, int]]:
+        return [
+            (session_key, int(record_id))
+            for session_key, record_id in self._redis.zrange(self._key("completed_ids"), 0, -1, withscores=True)
+        ]
+
+    def _fetch_completed(self, session_keys: List[str]) -> List[Tuple[str, str]]:
+        raws = self._redis.hmget(self._key("completed"), session_keys)
+        return [(session_key, raw) for session_key, raw in zip(session_keys, raws) if raw is not None]
+
+    def _delete_completed(self, session_key: str) -> int:
+        pipe = self._redis.pipeline()
+        pipe.hdel(self._key("completed"), session_key)
+        pipe.zrem(self._key("completed_ids"), session_key)
+        pipe.incr(self._key("completed_generation"))
+        return pipe.execute()[-1]
+
+
+def create_session_store(debate_system=None) -> SessionStore:
+    """Build the store selected by SESSION_STORE (sqlite by default, redis, or memory)"""
+    backend = os.getenv("SESSION_STORE", "sqlite").lower()
+    if backend == "memory":
+        if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+            logger.warning("⚠️ SESSION_STORE=memory with several workers: each worker only sees its own sessions")
+        return InMemorySessionStore()
+
+    if backend == "redis":
+        redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        try:
+            return RedisSessionStore(redis_url, debate_system)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not connect to session Redis {redis_url}: {e}. Falling back to SQLite sessions")
+
+    # Serverless deployments only allow writes under /tmp
+    default_dir = "/tmp" if os.getenv("VERCEL") else script_dir
+    db_path = os.getenv("SESSION_DB_PATH", os.path.join(default_dir, "debate_sessions.db"))
+    try:
+        return SQLiteSessionStore(db_path, debate_system)
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Could not open session database {db_path}: {e}. Falling back to in-memory sessions")
+        return InMemorySessionStore()
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Progress:
+    """Items a streamed generation has produced so far, with a wake-up for readers"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.changed = asyncio.Event()
+
+    def emit(self, item: Any):
+        self.items.append(item)
+        self.notify()
+
+    def notify(self):
+        # Wake everyone waiting on the current event; later waits use a fresh one
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one in-flight generation.
+
+    The first caller for a key starts the work; callers arriving with the same key
+    while it runs await the same task and receive its result (or its exception).
+    The key is forgotten as soon as the task finishes, so later calls run again.
+    Waiters are shielded from each other: a client that disconnects does not
+    cancel the generation the others are still waiting for. stream() does the same
+    for generations whose results are forwarded item by item.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._streams: Dict[Hashable, Tuple[asyncio.Task, _Progress]] = {}
+        self.started = 0
+        self.joined = 0
+
+    async def run(self, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(work())
+            self._calls[key] = task
+            task.add_done_callback(lambda finished: self._forget(key, finished))
+            self.started += 1
+        else:
+            self.joined += 1
+            logger.info(f"🔗 Joined in-flight generation {key}")
+        return await asyncio.shield(task)
+
+    async def stream(self, key: Hashable, work: Callable[[Callable[[Any], None]], Awaitable[Any]]) -> AsyncIterator[Any]:
+        """
+        run() for a generation that is streamed: work(emit) calls emit(item) for each
+        item as it is produced. Every caller, including one joining halfway, receives
+        all items in order; the iteration ends when the work finishes and re-raises
+        its exception. Keys are separate from run()'s.
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            progress = _Progress()
+            task = asyncio.ensure_future(work(progress.emit))
+            flight = self._streams[key] = (task, progress)
+            task.add_done_callback(lambda finished: self._forget_stream(key, finished, progress))
+            self.started += 1
+        else:
+            self.joined += 1
+            logger.info(f"🔗 Joined in-flight stream {key}")
+
+        task, progress = flight
+        sent = 0
+        while True:
+            while sent < len(progress.items):
+                yield progress.items[sent]
+                sent += 1
+            if task.done():
+                break
+            await progress.changed.wait()
+        task.result()  # Raises the generation's exception
+
+    def _forget_stream(self, key: Hashable, task: asyncio.Task, progress: _Progress):
+        progress.notify()  # Readers waiting for the next item see that the work is done
+        if self._streams.get(key, (None, None))[0] is task:
+            del self._streams[key]
+        self._forget(key, task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here so an unawaited failure is not reported as lost
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "started": self.started,
+            "joined": self.joined,
+        }
@@ -0,0 +1,99 @@
+"""
+KeyPool: sliding RPM/TPM window per key and parking after quota errors
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import key_pool
+from key_pool import KeyPool, parse_retry_after
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.time() for key_pool; advance it by assigning clock.now"""
+    class Clock:
+        now = 1000.0
+    monkeypatch.setattr(key_pool.time, "time", lambda: Clock.now)
+    return Clock
+
+
+def test_requests_spread_over_least_loaded_keys(clock):
+    pool = KeyPool(3, rpm_limit=10)
+    assert [pool.try_acquire() for _ in range(3)] == [0, 1, 2]
+    pool.release(1)
+    assert pool.try_acquire() == 1
+
+
+def test_rpm_window_slides(clock):
+    pool = KeyPool(1, rpm_limit=2, window_seconds=60)
+    for _ in range(2):
+        pool.release(pool.try_acquire())
+    assert pool.try_acquire() is None
+    assert pool.next_available_in() == pytest.approx(60)
+
+    clock.now += 59
+    assert pool.try_acquire() is None
+    clock.now += 1
+    assert pool.try_acquire() == 0
+
+
+def test_tpm_budget_uses_actual_tokens(clock):
+    pool = KeyPool(1, rpm_limit=100, tpm_limit=1000)
+    index = pool.try_acquire(estimated_tokens=600)
+    assert pool.try_acquire(estimated_tokens=600) is None
+    # The call used far fewer tokens than estimated: the difference is given back
+    pool.release(index, estimated_tokens=600, actual_tokens=100)
+    assert pool.try_acquire(estimated_tokens=600) == 0
+
+
+def test_idle_key_accepts_an_oversized_request(clock):
+    pool = KeyPool(1, tpm_limit=100)
+    assert pool.try_acquire(estimated_tokens=500) == 0
+
+
+def test_parked_key_is_skipped_until_its_window_resets(clock):
+    pool = KeyPool(2, rpm_limit=10)
+    pool.park(0, seconds=30)
+    assert pool.parked_keys() == {0}
+    assert [pool.try_acquire() for _ in range(2)] == [1, 1]
+    assert pool.stats()[0]["quota_errors"] == 1
+
+    clock.now += 30
+    assert pool.parked_keys() == set()
+    assert pool.try_acquire() == 0
+
+
+def test_every_key_parked_reports_the_shortest_wait(clock):
+    pool = KeyPool(2)
+    pool.park(0, seconds=40)
+    pool.park(1, seconds=10)
+    assert pool.try_acquire() is None
+    assert pool.next_available_in() == pytest.approx(10)
+
+
+def test_acquire_gives_up_after_max_wait(clock):
+    pool = KeyPool(1, rpm_limit=1, max_wait_seconds=5)
+    pool.try_acquire()
+    with pytest.raises(ValueError):
+        pool.acquire()
+
+
+def test_spare_capacity_only_on_an_idle_half_used_key(clock):
+    pool = KeyPool(1, rpm_limit=4)
+    assert pool.has_spare_capacity()
+    index = pool.try_acquire()
+    assert not pool.has_spare_capacity()  # In flight
+    pool.release(index)
+    assert pool.has_spare_capacity()  # 1 of 4 requests used
+    pool.release(pool.try_acquire())
+    assert not pool.has_spare_capacity()  # Half of the window used
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(Exception("429 quota exceeded, retry_delay { seconds: 17 }")) == 18.0
+    assert parse_retry_after(Exception("Please retry in 2.5s.")) == 3.5
+    assert parse_retry_after(Exception("500 internal error")) is None
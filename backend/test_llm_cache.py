@@ -0,0 +1,77 @@
+"""
+LLMCache: TTL expiry, LRU bound, opt-in methods and the SQLite copy
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.time() for llm_cache; advance it by assigning clock.now"""
+    class Clock:
+        now = 1000.0
+    monkeypatch.setattr(llm_cache.time, "time", lambda: Clock.now)
+    return Clock
+
+
+def test_hit_and_miss_are_counted(clock):
+    cache = LLMCache(methods=["arguments"])
+    assert cache.get("arguments", "prompt") is None
+    cache.put("arguments", "prompt", "completion")
+    assert cache.get("arguments", "prompt") == "completion"
+    assert cache.stats()["hits"] == {"arguments": 1}
+    assert cache.stats()["misses"] == {"arguments": 1}
+
+
+def test_only_opted_in_methods_are_cached(clock):
+    cache = LLMCache(methods=["arguments"])
+    cache.put("questions", "prompt", "completion")
+    assert cache.get("questions", "prompt") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = LLMCache(methods=["arguments"], ttl_seconds=60)
+    cache.put("arguments", "prompt", "completion")
+    clock.now += 60
+    assert cache.get("arguments", "prompt") == "completion"
+    clock.now += 1
+    assert cache.get("arguments", "prompt") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = LLMCache(methods=["arguments"], max_entries=2)
+    cache.put("arguments", "a", "A")
+    cache.put("arguments", "b", "B")
+    assert cache.get("arguments", "a") == "A"  # b is now the oldest
+    cache.put("arguments", "c", "C")
+    assert cache.get("arguments", "b") is None
+    assert cache.get("arguments", "a") == "A"
+    assert cache.get("arguments", "c") == "C"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_namespace_separates_models(clock):
+    flash = LLMCache(methods=["arguments"], namespace="gemini-flash")
+    flash.put("arguments", "prompt", "completion")
+    pro = LLMCache(methods=["arguments"], namespace="gemini-pro")
+    assert pro.get("arguments", "prompt") is None
+
+
+def test_disk_copy_survives_a_restart_until_it_expires(clock, tmp_path):
+    db_path = str(tmp_path / "llm_cache.db")
+    LLMCache(methods=["arguments"], ttl_seconds=60, db_path=db_path).put("arguments", "prompt", "completion")
+
+    restarted = LLMCache(methods=["arguments"], ttl_seconds=60, db_path=db_path)
+    assert restarted.get("arguments", "prompt") == "completion"
+
+    clock.now += 61
+    assert LLMCache(methods=["arguments"], ttl_seconds=60, db_path=db_path).get("arguments", "prompt") is None
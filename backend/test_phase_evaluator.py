@@ -0,0 +1,74 @@
+"""
+PhaseEvaluator.evaluate: merge precomputed phase scores, or fall back to one full-debate evaluation
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from contextlib import asynccontextmanager
+
+from debate_system import DEBATE_CRITERIA, DebateSession
+from phase_evaluator import PhaseEvaluator, phase_input_hash
+from session_store import InMemorySessionStore
+
+
+class FakeDebateSystem:
+    def __init__(self):
+        self.phase_calls = []
+        self.full_calls = 0
+
+    async def aevaluate_phase(self, phase_key, phase_data):
+        self.phase_calls.append(phase_key)
+        return {"scores": {criterion["id"]: 3 for criterion in DEBATE_CRITERIA[phase_key]}, "notes": phase_key}
+
+    async def agenerate_feedback(self, topic, phase_results):
+        return "feedback"
+
+    async def aevaluate_debate_detailed(self, debate_data):
+        self.full_calls += 1
+        return {"scores": {phase_key: {} for phase_key in list(DEBATE_CRITERIA) + ["phase5"]}, "feedback": "full"}
+
+
+@asynccontextmanager
+async def no_lock(session_key):
+    yield
+
+
+def make(debate_system):
+    session = DebateSession.from_dict({"topic": "T", "team_arguments": ["A"], "turns": []}, debate_system)
+    return PhaseEvaluator(debate_system, InMemorySessionStore(), no_lock), session
+
+
+def test_nothing_scored_ahead_falls_back_to_one_full_evaluation():
+    debate_system = FakeDebateSystem()
+    evaluator, session = make(debate_system)
+    evaluation = asyncio.run(evaluator.evaluate("team", session))
+    assert evaluation["feedback"] == "full"
+    assert session.evaluation is evaluation
+    assert debate_system.full_calls == 1
+    assert debate_system.phase_calls == []
+    assert evaluator.stats()["full_evaluations"] == 1
+
+
+def test_stored_phase_scores_are_reused_and_the_rest_scored():
+    debate_system = FakeDebateSystem()
+    evaluator, session = make(debate_system)
+    input_hash = phase_input_hash("phase1", session.phase_evaluation_data("phase1"))
+    session.phase_scores["phase1"] = {"scores": {"stored": 5}, "notes": "stored", "input_hash": input_hash}
+
+    evaluation = asyncio.run(evaluator.evaluate("team", session))
+    assert evaluation["scores"]["phase1"] == {"stored": 5}
+    assert evaluation["scores"]["phase5"] == {}
+    assert evaluation["feedback"] == "feedback"
+    assert sorted(debate_system.phase_calls) == ["phase2", "phase3", "phase4"]
+    assert debate_system.full_calls == 0
+
+
+def test_stale_phase_score_is_not_precomputed():
+    debate_system = FakeDebateSystem()
+    evaluator, session = make(debate_system)
+    session.phase_scores["phase1"] = {"scores": {}, "notes": "", "input_hash": "edited since"}
+    asyncio.run(evaluator.evaluate("team", session))
+    assert debate_system.full_calls == 1
@@ -0,0 +1,130 @@
+"""
+Versioned session stores: two SQLiteSessionStore instances on one database file
+stand in for two gunicorn workers sharing sessions
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from session_store import InMemorySessionStore, SessionConflictError, SessionStore, SQLiteSessionStore
+
+
+def new_session(team_id: str, phase: str = "Phase 1") -> dict:
+    return {"team_id": team_id, "members": ["A"], "current_phase": phase, "turns_taken": 0}
+
+
+@pytest.fixture
+def workers(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    return SQLiteSessionStore(db_path), SQLiteSessionStore(db_path)
+
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_write_is_seen_by_the_other_worker(workers):
+    a, b = workers
+    a.put("team", new_session("Team"))
+    data = b.get("team")
+    assert data["current_phase"] == "Phase 1"
+
+    data["current_phase"] = "Phase 2"
+    b.put("team", data)
+    assert a.get("team")["current_phase"] == "Phase 2"
+
+
+def test_unchanged_session_is_served_from_the_cache(workers):
+    a, _ = workers
+    a.put("team", new_session("Team"))
+    assert a.get("team") is a.get("team")
+
+
+def test_stale_copy_conflicts_instead_of_overwriting(workers):
+    a, b = workers
+    a.put("team", new_session("Team"))
+    stale = a.get("team")
+    fresh = b.get("team")
+
+    fresh["current_phase"] = "Phase 2"
+    b.put("team", fresh)
+    # a's get() reloads b's version, so a's old copy is no longer the cached one
+    assert a.get("team")["current_phase"] == "Phase 2"
+    stale["current_phase"] = "Phase 3"
+    with pytest.raises(SessionConflictError):
+        a.put("team", stale)
+    assert b.get("team")["current_phase"] == "Phase 2"
+
+
+def test_concurrent_writes_from_two_workers_conflict(workers):
+    a, b = workers
+    a.put("team", new_session("Team"))
+    copy_a, copy_b = a.get("team"), b.get("team")
+
+    copy_b["turns_taken"] = 1
+    b.put("team", copy_b)
+    copy_a["turns_taken"] = 2
+    with pytest.raises(SessionConflictError):
+        a.put("team", copy_a)
+
+    # Reload and retry, as the handlers do after a 409
+    retry = a.get("team")
+    assert retry["turns_taken"] == 1
+    retry["turns_taken"] = 2
+    a.put("team", retry)
+    assert b.get("team")["turns_taken"] == 2
+
+
+def test_creating_the_same_team_twice_conflicts(workers):
+    a, b = workers
+    a.put("team", new_session("Team"))
+    with pytest.raises(SessionConflictError):
+        b.put("team", new_session("Team"))
+
+
+def test_archive_moves_the_session_for_every_worker(workers):
+    a, b = workers
+    a.put("team", new_session("Team"))
+    assert [key for key, _ in b.list_active()] == ["team"]
+
+    a.archive("team", dict(a.get("team"), status="completed", completed_at="2024-05-01T09:00:00"))
+    assert b.get("team") is None
+    assert b.list_active() == []
+    assert b.get_completed("team")["status"] == "completed"
+
+    assert a.remove_completed("team")["team_id"] == "Team"
+    assert b.get_completed("team") is None
+    assert b.list_completed() == []
+
+
+def test_async_variants_run_the_same_operations(workers):
+    a, b = workers
+
+    async def scenario():
+        await a.aput("team", new_session("Team"))
+        data = await b.aget("team")
+        data["current_phase"] = "Phase 2"
+        await b.aput("team", data)
+        stale = await a.aget("team")
+        await b.aput("team", await b.aget("team"))
+        with pytest.raises(SessionConflictError):
+            await a.aput("team", stale)
+        return [key for key, _ in await a.alist_active()]
+
+    assert asyncio.run(scenario()) == ["team"]
+
+
+def test_in_memory_store_keeps_completion_order():
+    store = InMemorySessionStore()
+    for team in ("a", "b", "c"):
+        store.put(team, new_session(team))
+        store.archive(team, dict(new_session(team), status="completed"))
+    store.put("a", new_session("a"))
+    store.archive("a", dict(new_session("a"), status="completed"))
+    assert [data["team_id"] for data in store.list_completed()] == ["b", "c", "a"]
+    assert [data["team_id"] for data in store.recent_completed(2)] == ["c", "a"]
@@ -0,0 +1,125 @@
+"""
+SingleFlight: concurrent identical calls share one generation
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    runs = 0
+
+    async def work():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.01)
+        return runs
+
+    async def scenario():
+        return await asyncio.gather(*(flight.run("key", work) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == [1] * 5
+    assert runs == 1
+    assert flight.stats() == {"in_flight": 0, "started": 1, "joined": 4}
+
+
+def test_different_keys_and_later_calls_run_again():
+    flight = SingleFlight()
+    runs = []
+
+    async def work(key):
+        runs.append(key)
+        await asyncio.sleep(0)
+        return key
+
+    async def scenario():
+        together = await asyncio.gather(flight.run("a", lambda: work("a")), flight.run("b", lambda: work("b")))
+        later = await flight.run("a", lambda: work("a"))
+        return together, later
+
+    assert asyncio.run(scenario()) == (["a", "b"], "a")
+    assert runs == ["a", "b", "a"]
+
+
+def test_every_waiter_gets_the_exception():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0)
+        raise ValueError("quota")
+
+    async def scenario():
+        return await asyncio.gather(flight.run("key", work), flight.run("key", work), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.stats()["started"] == 1
+
+
+def test_a_cancelled_waiter_does_not_cancel_the_others():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.run("key", work))
+        second = asyncio.ensure_future(flight.run("key", work))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_stream_replays_every_item_to_a_late_joiner():
+    flight = SingleFlight()
+    runs = 0
+
+    async def work(emit):
+        nonlocal runs
+        runs += 1
+        for item in range(3):
+            await asyncio.sleep(0.01)
+            emit(item)
+        return "done"
+
+    async def read(delay):
+        await asyncio.sleep(delay)
+        return [item async for item in flight.stream("key", work)]
+
+    async def scenario():
+        return await asyncio.gather(read(0), read(0.015))
+
+    assert asyncio.run(scenario()) == [[0, 1, 2], [0, 1, 2]]
+    assert runs == 1
+
+
+def test_stream_raises_the_generation_error_after_its_items():
+    flight = SingleFlight()
+
+    async def work(emit):
+        emit("first")
+        await asyncio.sleep(0)
+        raise ValueError("broken")
+
+    async def scenario():
+        items = []
+        with pytest.raises(ValueError):
+            async for item in flight.stream("key", work):
+                items.append(item)
+        await asyncio.sleep(0)
+        return items
+
+    assert asyncio.run(scenario()) == ["first"]
+    assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,102 @@
+"""
+fit_sections and its shrink functions, with a word counter instead of tiktoken
+"""
+
+import os
+import sys
+import types
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from token_budget import ELIDED_MARKER, TokenCounter, elide_middle, fit_sections, truncate_items
+
+
+class WordCounter(TokenCounter):
+    """One token per word, so the expected sizes can be read off the test data"""
+
+    def __init__(self):
+        super().__init__("words")
+        self._loaded = True
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        words = text.split()
+        return text if len(words) <= max_tokens else " ".join(words[:max_tokens]) + "…"
+
+
+counter = WordCounter()
+
+
+def words(n: int, word: str = "w") -> str:
+    return " ".join([word] * n)
+
+
+def size(items):
+    return sum(counter.count(item) for item in items)
+
+
+def test_sections_within_budget_are_untouched():
+    sections = {"turns": [words(5)], "conclusion": [words(5)]}
+    fitted, trimmed = fit_sections(counter, sections, 10, [("turns", elide_middle)])
+    assert fitted is sections
+    assert trimmed == []
+
+
+def test_lowest_priority_section_is_trimmed_first():
+    sections = {"turns": [words(10, f"t{i}") for i in range(6)], "conclusion": [words(20)]}
+    order = [("turns", elide_middle), ("conclusion", truncate_items)]
+    fitted, trimmed = fit_sections(counter, sections, 50, order)
+    assert trimmed == ["turns"]
+    assert fitted["conclusion"] == sections["conclusion"]
+    assert size(fitted["turns"]) + size(fitted["conclusion"]) <= 50
+
+
+def test_one_huge_section_cannot_wipe_out_the_others():
+    sections = {"turns": [words(100)], "conclusion": [words(40)], "team_arguments": [words(40)]}
+    order = [("turns", truncate_items), ("conclusion", truncate_items), ("team_arguments", truncate_items)]
+    fitted, trimmed = fit_sections(counter, sections, 90, order)
+    # Each non-empty section keeps at least an equal share (90 // 3) in the first pass
+    assert size(fitted["turns"]) >= 30
+    assert size(fitted["conclusion"]) >= 30
+    assert sum(size(items) for items in fitted.values()) <= 90
+    assert trimmed == ["turns", "conclusion", "team_arguments"]
+
+
+def test_sections_outside_the_trim_order_are_never_touched():
+    sections = {"turns": [words(30)], "topic": [words(30)]}
+    fitted, trimmed = fit_sections(counter, sections, 40, [("turns", truncate_items)])
+    assert fitted["topic"] == sections["topic"]
+    assert trimmed == ["turns"]
+
+
+def test_elide_middle_keeps_the_first_and_latest_turns():
+    turns = [words(10, f"t{i}") for i in range(8)]
+    marker_size = counter.count(ELIDED_MARKER)
+    kept = elide_middle(counter, turns, 30 + marker_size)
+    assert kept[0] == turns[0]
+    assert kept[-2:] == turns[-2:]
+    assert kept[1] == ELIDED_MARKER.format(count=5)
+
+
+def test_truncate_items_gives_each_item_an_equal_share():
+    items = [words(30), words(2), words(30)]
+    assert truncate_items(counter, items, 30) == [words(10) + "…", words(2), words(10) + "…"]
+
+
+def test_encoding_loads_on_first_count_and_falls_back_to_chars_per_token(monkeypatch):
+    loads = []
+
+    def get_encoding(name):
+        loads.append(name)
+        raise OSError("no network")
+
+    monkeypatch.setitem(sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=get_encoding))
+    fallback = TokenCounter()
+    assert loads == []
+
+    assert fallback.count("abcd" * 10) == 10
+    assert fallback.count("ab") == 1
+    assert fallback.truncate("x" * 100, 5) == "x" * 20 + "…"
+    assert fallback.method == "chars/4"
+    assert loads == ["cl100k_base"]
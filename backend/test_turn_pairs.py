@@ -0,0 +1,80 @@
+"""
+Phase 2/3 turn pairs kept on DebateSession and the turn cursors of the turn endpoints
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from debate_system import DebateSession, Phase2TurnPairs, Phase3TurnPairs, format_turns
+
+
+def ai_question(text):
+    return {"asker": "ai", "question": text, "answer": None}
+
+
+def student_answer(text):
+    return {"asker": "student", "question": "", "answer": text}
+
+
+def test_phase2_answers_pair_with_questions_in_order():
+    pairs = Phase2TurnPairs([
+        ai_question("Q1"), ai_question("Q2"), student_answer("A1"), student_answer("A2"), ai_question("Q3"),
+    ])
+    assert pairs.pairs == [
+        {"ai_question": "Q1", "student_answer": "A1"},
+        {"ai_question": "Q2", "student_answer": "A2"},
+        {"ai_question": "Q3", "student_answer": ""},
+    ]
+
+
+def test_phase2_answer_before_its_question_fills_in_later():
+    pairs = Phase2TurnPairs([student_answer("A1")])
+    pairs.add(ai_question("Q1"))
+    assert pairs.pairs == [{"ai_question": "Q1", "student_answer": "A1"}]
+
+
+def test_phase2_empty_turns_are_ignored():
+    pairs = Phase2TurnPairs([ai_question(""), student_answer(None), ai_question("Q1")])
+    assert pairs.pairs == [{"ai_question": "Q1", "student_answer": ""}]
+
+
+def test_phase3_answer_completes_the_latest_question():
+    pairs = Phase3TurnPairs([
+        {"asker": "ai", "answer": "answer before any question"},
+        {"asker": "student", "question": "S1"},
+        {"asker": "student", "question": "S2"},
+        {"asker": "ai", "answer": "A2"},
+    ])
+    assert pairs.pairs == [
+        {"student_question": "S1", "ai_answer": ""},
+        {"student_question": "S2", "ai_answer": "A2"},
+    ]
+
+
+def test_session_keeps_pairs_up_to_date_and_rebuilds_them_on_restore():
+    session = DebateSession.from_dict({"turns": [], "phase3_turns": []})
+    session.add_turn("ai", "Q1", None)
+    session.add_turn("student", "", "A1")
+    session.add_phase3_turn("student", "S1", None)
+    session.add_phase3_turn("ai", None, "A1")
+    assert session.phase2_pairs.pairs == [{"ai_question": "Q1", "student_answer": "A1"}]
+    assert session.phase3_pairs.pairs == [{"student_question": "S1", "ai_answer": "A1"}]
+
+    data = session.to_dict(turn_pairs=True)
+    assert data["phase2_pairs"] == session.phase2_pairs.pairs
+    assert "phase2_pairs" not in session.to_dict()
+
+    restored = DebateSession.from_dict(session.to_dict())
+    assert restored.phase2_pairs.pairs == session.phase2_pairs.pairs
+    assert restored.phase3_pairs.pairs == session.phase3_pairs.pairs
+
+
+def test_format_turns_cursor_returns_only_new_turns():
+    turns = [ai_question("Q1"), student_answer("A1"), ai_question("Q2")]
+    assert [turn["turn_number"] for turn in format_turns(turns)] == [1, 2, 3]
+
+    since = format_turns(turns, 2)
+    assert since == [{"asker": "ai", "question": "Q2", "answer": None, "turn_number": 3}]
+    assert format_turns(turns, len(turns)) == []
+    assert format_turns(turns, 10) == []
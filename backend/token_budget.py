@@ -0,0 +1,175 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+ELIDED_MARKER = "... (lược bớt {count} mục để vừa giới hạn token) ..."
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens with tiktoken.
+
+    Gemini's own tokenizer is not available offline, so cl100k_base serves as a
+    close approximation; that is accurate enough to budget prompts and to plan
+    capacity. The encoding is loaded on the first count, since tiktoken downloads
+    the file unless it is cached (TIKTOKEN_CACHE_DIR); if that fails (no network),
+    the counter falls back to the old chars / 4 estimate.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def _get_encoding(self):
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        logger.warning(f"⚠️ tiktoken encoding '{self.encoding_name}' unavailable ({e}), "
+                                       f"estimating tokens as chars / 4")
+                    self._loaded = True
+        return self._encoding
+
+    @property
+    def method(self) -> str:
+        return f"tiktoken:{self.encoding_name}" if self._get_encoding() is not None else "chars/4"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return max(1, len(text) // 4)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """text cut to at most max_tokens (plus an ellipsis when something was cut)"""
+        if self.count(text) <= max_tokens:
+            return text
+        encoding = self._get_encoding()
+        if encoding is not None:
+            head = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+        else:
+            head = text[:max_tokens * 4]
+        return head.rstrip() + "…"
+
+
+def elide_middle(counter: TokenCounter, items: List[str], max_tokens: int, keep_head: int = 1) -> List[str]:
+    """Keep the first `keep_head` items and as many of the latest ones as fit; the rest becomes one marker line"""
+    if sum(counter.count(item) for item in items) <= max_tokens:
+        return items
+    if len(items) <= keep_head + 1:
+        return truncate_items(counter, items, max_tokens)
+    head = items[:keep_head]
+    used = sum(counter.count(item) for item in head) + counter.count(ELIDED_MARKER)
+    tail: List[str] = []
+    for item in reversed(items[keep_head:]):
+        cost = counter.count(item)
+        if used + cost > max_tokens:
+            break
+        tail.insert(0, item)
+        used += cost
+    elided = len(items) - len(head) - len(tail)
+    if not tail:
+        # Not even the latest item fits whole: keep it cut down rather than losing the end of the debate
+        room = max(1, max_tokens - used)
+        if elided <= 1:
+            return head + [counter.truncate(items[-1], room)]
+        tail = [counter.truncate(items[-1], room)]
+        elided -= 1
+    return head + [ELIDED_MARKER.format(count=elided)] + tail
+
+
+def truncate_items(counter: TokenCounter, items: List[str], max_tokens: int) -> List[str]:
+    """Give every item an equal share of max_tokens and cut the ones that are longer"""
+    if not items or sum(counter.count(item) for item in items) <= max_tokens:
+        return items
+    share = max(1, max_tokens // len(items))
+    return [counter.truncate(item, share) for item in items]
+
+
+Shrink = Callable[[TokenCounter, List[str], int], List[str]]
+
+
+def fit_sections(counter: TokenCounter, sections: Dict[str, List[str]], budget: int,
+                 trim_order: Sequence[Tuple[str, Shrink]]) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    Shrink sections, lowest priority first, until their total fits in budget.
+
+    `trim_order` lists (section name, shrink function) from the section that
+    matters least to the one that matters most; sections not in it are never
+    touched. A first pass leaves every section at least an equal share of the
+    budget, so one huge section cannot wipe out the others; only if that is not
+    enough does a second pass shrink further. Returns the fitted sections and the
+    names that had to be trimmed.
+    """
+    sizes = {name: sum(counter.count(item) for item in items) for name, items in sections.items()}
+    overflow = sum(sizes.values()) - budget
+    if overflow <= 0:
+        return sections, []
+
+    fitted = dict(sections)
+    trimmed = []
+    share = budget // max(1, sum(1 for items in sections.values() if items))
+    for floor in (share, 1):
+        for name, shrink in trim_order:
+            if overflow <= 0:
+                break
+            if not fitted.get(name) or sizes[name] <= floor:
+                continue
+            fitted[name] = shrink(counter, fitted[name], max(floor, sizes[name] - overflow))
+            new_size = sum(counter.count(item) for item in fitted[name])
+            if new_size < sizes[name]:
+                if name not in trimmed:
+                    trimmed.append(name)
+                overflow -= sizes[name] - new_size
+                sizes[name] = new_size
+    return fitted, trimmed
+
+
+class TokenUsage:
+    """Per-purpose token counts of every model call, for capacity planning"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._purposes: Dict[str, Dict[str, Any]] = {}
+
+    def _entry(self, purpose: str) -> Dict[str, Any]:
+        entry = self._purposes.get(purpose)
+        if entry is None:
+            entry = self._purposes[purpose] = {
+                "calls": 0,
+                "prompt_tokens": 0,
+                "max_prompt_tokens": 0,
+                "reported_total_tokens": 0,
+                "trimmed_prompts": 0,
+            }
+        return entry
+
+    def record(self, purpose: str, prompt_tokens: int, total_tokens: Optional[int] = None):
+        """One model call: the counted prompt size and, when the provider reports it, the billed total"""
+        with self._lock:
+            entry = self._entry(purpose)
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["max_prompt_tokens"] = max(entry["max_prompt_tokens"], prompt_tokens)
+            if total_tokens:
+                entry["reported_total_tokens"] += total_tokens
+
+    def record_trim(self, purpose: str):
+        with self._lock:
+            self._entry(purpose)["trimmed_prompts"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                purpose: dict(entry, avg_prompt_tokens=entry["prompt_tokens"] // entry["calls"] if entry["calls"] else 0)
+                for purpose, entry in self._purposes.items()
+            }
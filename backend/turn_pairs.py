@@ -0,0 +1,46 @@
+from typing import Any, Dict, List
+
+
+class Phase2TurnPairs:
+    """
+    Phase 2 question/answer pairs, kept up to date as turns are added.
+
+    AI questions and student answers are matched in order: the n-th answer
+    belongs to the n-th question. The pairs are derived from the turn list and
+    never persisted; a session restored from the store replays its turns once.
+    """
+
+    def __init__(self, turns: List[Dict[str, Any]] = ()):
+        self.pairs: List[Dict[str, str]] = []
+        self._questions = 0
+        self._answers = 0
+        for turn in turns:
+            self.add(turn)
+
+    def _fill(self, index: int, field: str, text: str):
+        if index == len(self.pairs):
+            self.pairs.append({"ai_question": "", "student_answer": ""})
+        self.pairs[index][field] = text
+
+    def add(self, turn: Dict[str, Any]):
+        if turn.get("asker") == "ai" and turn.get("question"):
+            self._fill(self._questions, "ai_question", turn["question"])
+            self._questions += 1
+        elif turn.get("asker") == "student" and turn.get("answer"):
+            self._fill(self._answers, "student_answer", turn["answer"])
+            self._answers += 1
+
+
+class Phase3TurnPairs:
+    """Phase 3 question/answer pairs: each student question opens a pair, an AI answer completes the latest one"""
+
+    def __init__(self, turns: List[Dict[str, Any]] = ()):
+        self.pairs: List[Dict[str, str]] = []
+        for turn in turns:
+            self.add(turn)
+
+    def add(self, turn: Dict[str, Any]):
+        if turn.get("asker") == "student" and turn.get("question"):
+            self.pairs.append({"student_question": turn["question"], "ai_answer": ""})
+        elif turn.get("asker") == "ai" and turn.get("answer") and self.pairs:
+            self.pairs[-1]["ai_answer"] = turn["answer"]
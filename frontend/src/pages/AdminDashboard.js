@@ -993,25 +993,74 @@ const AdminDashboard = () => {
         }
     }, [currentTab]);
 
+    // Old browsers without EventSource: fall back to polling
     useEffect(() => {
+        if (typeof EventSource !== 'undefined') return undefined;
         fetchSessions();
         const interval = setInterval(fetchSessions, 5000); // Auto-refresh
         return () => clearInterval(interval);
     }, [fetchSessions]);
 
+    // Live updates: the backend pushes a snapshot, then only per-session changes
+    useEffect(() => {
+        if (typeof EventSource === 'undefined') return undefined;
+
+        const source = new EventSource(`${API_CONFIG.baseURL}/admin/feed`);
+        const upsert = (list, item) => {
+            const index = list.findIndex(entry => entry.team_id === item.team_id);
+            if (index === -1) return [...list, item];
+            const updated = [...list];
+            updated[index] = item;
+            return updated;
+        };
+        const withoutTeam = (list, teamId) => list.filter(entry => entry.team_id !== teamId);
+
+        source.addEventListener('snapshot', (e) => {
+            const data = JSON.parse(e.data);
+            setActiveSessions(data.active);
+            setCompletedSessions(data.completed);
+            setCriteria(data.criteria);
+            setLiveScoringData(data.live_scoring);
+            setLiveScoringStats(data.statistics);
+            setError(null);
+            setLoading(false);
+        });
+        source.addEventListener('session', (e) => {
+            const data = JSON.parse(e.data);
+            setActiveSessions(prev => upsert(prev, data.session));
+            setLiveScoringData(prev => upsert(prev, data.live));
+            setLiveScoringStats(data.statistics);
+        });
+        source.addEventListener('session_removed', (e) => {
+            const data = JSON.parse(e.data);
+            setActiveSessions(prev => withoutTeam(prev, data.team_id));
+            setLiveScoringData(prev => withoutTeam(prev, data.team_id));
+            setLiveScoringStats(data.statistics);
+        });
+        source.addEventListener('completed', (e) => {
+            setCompletedSessions(JSON.parse(e.data).completed);
+        });
+        source.onerror = () => {
+            // EventSource reconnects by itself and receives a fresh snapshot
+            if (source.readyState === EventSource.CLOSED) {
+                setError('Failed to fetch sessions. Is the backend running?');
+                setLoading(false);
+            }
+        };
+
+        return () => source.close();
+    }, []);
+
     useEffect(() => {
         fetchLeaderboard();
     }, [fetchLeaderboard]);
 
     useEffect(() => {
+        if (typeof EventSource !== 'undefined') return undefined; // Kept current by the live feed
         fetchLiveScoring();
-        let interval;
-        if (currentTab === 'live-scoring') {
-            interval = setInterval(fetchLiveScoring, 3000); // Auto-refresh every 3 seconds for live data
-        }
-        return () => {
-            if (interval) clearInterval(interval);
-        };
+        if (currentTab !== 'live-scoring') return undefined;
+        const interval = setInterval(fetchLiveScoring, 3000); // Auto-refresh every 3 seconds for live data
+        return () => clearInterval(interval);
     }, [fetchLiveScoring, currentTab]);
 
     const handleForceEnd = async (teamId) => {
@@ -1086,7 +1135,7 @@ const AdminDashboard = () => {
                     </Typography>
                     {is_active ? (
                         <Typography variant="body2" color="text.secondary">
-                            <b>Turns:</b> {session.turns_taken ?? 0}
+                            <b>Turns:</b> {session.turns_taken ?? 0} · <b>Phase 2:</b> {session.phase2_turns ?? 0} · <b>Phase 3:</b> {session.phase3_turns ?? 0}
                         </Typography>
                     ) : (
                          <Typography variant="body2" color="text.secondary">
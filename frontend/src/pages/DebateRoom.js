@@ -29,6 +29,7 @@ import { useTheme } from '@mui/material/styles';
 
 // Import API config
 import API_CONFIG from '../config/api';
+import { postEventStream, streamError } from '../utils/sse';
 
 // Create axios instance with default config
 const api = axios.create({
@@ -53,6 +54,21 @@ function DebateRoom() {
   const navigate = useNavigate();
   const { team_id } = useParams(); // Lấy team_id từ URL
   const teamIdForApi = React.useMemo(() => encodeURIComponent(team_id || ''), [team_id]);
+  // Idempotency-Key scope for this room: the timer auto-submit and a manual click of the
+  // same action send the same key, so the backend replays the first response
+  const idempotencyScope = React.useMemo(() => `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 8)}`, [team_id]);
+  const idempotent = (action) => ({ headers: { 'Idempotency-Key': `${idempotencyScope}-${action}` } });
+  // The turn endpoints only return turns after the `since` cursor we send: keep the
+  // first `since` turns we already hold and append the new ones from the backend
+  const mergeTurns = (heldTurns, since, newTurns) => [
+    ...heldTurns.slice(0, since),
+    ...newTurns.map(turn => ({
+      asker: turn.asker,
+      question: turn.question,
+      answer: turn.answer === 'null' ? null : turn.answer, // Convert "null" string to null
+      turn_number: turn.turn_number
+    }))
+  ];
   const { setShowHeader, setShowFooter } = useLayout();
   const theme = useTheme();
 
@@ -223,10 +239,26 @@ function DebateRoom() {
       setLoading(true);
       setError(null);
       
-      const response = await api.post(`/debate/${teamIdForApi}/phase1`);
-      console.log('Response:', response.data);      
-      if (response.data?.data?.ai_arguments) {
-        setAiPoints(response.data.data.ai_arguments);
+      // Stream AI arguments so the first one renders as soon as it is parsed
+      let finalData = null;
+      let shownFirst = false;
+      await postEventStream(`/debate/${teamIdForApi}/phase1/stream`, {}, (event, data) => {
+        if (event === 'argument') {
+          setAiPoints(prev => (data.index === 0 ? [data.content] : [...prev, data.content]));
+          if (!shownFirst) {
+            shownFirst = true;
+            setPhase(1.5);
+            setLoading(false);
+          }
+        } else if (event === 'done') {
+          finalData = data.data;
+        } else if (event === 'error') {
+          throw streamError(data.status, data.detail);
+        }
+      });
+      console.log('Response:', finalData);
+      if (finalData?.ai_arguments) {
+        setAiPoints(finalData.ai_arguments);
         setPhase(1.5);
         setTimeLeft(300);
         setTimerActive(true);
@@ -236,7 +268,7 @@ function DebateRoom() {
       }
     } catch (error) {
       console.error('Lỗi API:', error);
-      setError('Không thể lấy luận điểm AI. Vui lòng thử lại.');
+      setError(error.response?.data?.detail || 'Không thể lấy luận điểm AI. Vui lòng thử lại.');
     } finally {
       setLoading(false);
     }
@@ -258,7 +290,7 @@ function DebateRoom() {
         const conclusionResponse = await api.post(`/debate/${teamIdForApi}/phase4/conclusion`, {
           team_id: team_id,
           arguments: [conclusion] // Phase 4 chỉ cần 1 conclusion
-        });
+        }, idempotent('phase4-conclusion'));
         console.log('CONCLUSION RESPONSE', conclusionResponse.data);
       } catch (conclusionErr) {
         // If session not found, redirect to home
@@ -275,7 +307,7 @@ function DebateRoom() {
 
       // Step 2: Generate AI counter-arguments (Skip nếu có lỗi)
       try {
-        const aiResponse = await api.post(`/debate/${teamIdForApi}/phase4/ai-conclusion`);
+        const aiResponse = await api.post(`/debate/${teamIdForApi}/phase4/ai-conclusion`, null, idempotent('phase4-ai-conclusion'));
         console.log('AI COUNTER-CONCLUSION RESPONSE', aiResponse.data);
         setAiCounterArguments(aiResponse.data.ai_counter_arguments || []);
       } catch (aiErr) {
@@ -286,7 +318,7 @@ function DebateRoom() {
 
       // Step 3: Complete Phase 4
       try {
-        await api.post(`/debate/${teamIdForApi}/phase4/evaluate`);
+        await api.post(`/debate/${teamIdForApi}/phase4/evaluate`, null, idempotent('phase4-evaluate'));
         console.log('PHASE 4 COMPLETED');
       } catch (phase4Err) {
         // If already completed, that's fine
@@ -296,7 +328,7 @@ function DebateRoom() {
       }
 
       // Step 4: Final evaluation (Phase 5)
-      const response = await api.post(`/debate/${teamIdForApi}/phase5/evaluate`);
+      const response = await api.post(`/debate/${teamIdForApi}/phase5/evaluate`, null, idempotent('phase5-evaluate'));
       console.log('EVALUATION RESPONSE', response.data);
       const evaluationData = response.data.data?.evaluation || response.data.evaluation;
       console.log('SETTING EVALUATION:', evaluationData);
@@ -333,7 +365,7 @@ function DebateRoom() {
         const conclusionResponse = await api.post(`/debate/${teamIdForApi}/phase4/conclusion`, {
           team_id: team_id,
           arguments: [conclusion] // Phase 4 chỉ cần 1 conclusion
-        });
+        }, idempotent('phase4-conclusion'));
         console.log('CONCLUSION SUBMITTED', conclusionResponse.data);
       } catch (conclusionErr) {
         console.log('Conclusion already submitted or error:', conclusionErr.response?.data);
@@ -341,7 +373,7 @@ function DebateRoom() {
       }
       
       // Step 2: Get AI counter arguments
-      const response = await api.post(`/debate/${teamIdForApi}/phase4/ai-conclusion`);
+      const response = await api.post(`/debate/${teamIdForApi}/phase4/ai-conclusion`, null, idempotent('phase4-ai-conclusion'));
       console.log('AI COUNTER-CONCLUSION RESPONSE', response.data);
       setAiCounterArguments(response.data.ai_counter_arguments || []);
       setSuccess("AI đã tạo luận điểm tổng kết phản bác!");
@@ -394,11 +426,11 @@ function DebateRoom() {
                 await api.post(`/debate/${teamIdForApi}/phase4/conclusion`, {
                   team_id: team_id,
                   arguments: [studentArguments[0].trim()]
-                });
+                }, idempotent('phase4-conclusion'));
                 
                 // Step 2: Generate AI counter-arguments
                 try {
-                  const aiResponse = await api.post(`/debate/${teamIdForApi}/phase4/ai-conclusion`);
+                  const aiResponse = await api.post(`/debate/${teamIdForApi}/phase4/ai-conclusion`, null, idempotent('phase4-ai-conclusion'));
                   setAiCounterArguments(aiResponse.data.ai_counter_arguments || ["AI không có phản hồi"]);
                 } catch (aiErr) {
                   console.log('AI counter-arguments skipped:', aiErr.response?.data);
@@ -407,7 +439,7 @@ function DebateRoom() {
                 
                 // Step 3: Complete Phase 4
                 try {
-      await api.post(`/debate/${teamIdForApi}/phase4/evaluate`);
+      await api.post(`/debate/${teamIdForApi}/phase4/evaluate`, null, idempotent('phase4-evaluate'));
                 } catch (phase4Err) {
                   if (phase4Err.response?.status !== 400) {
                     console.log('Phase 4 evaluate error (continuing):', phase4Err.response?.data);
@@ -416,7 +448,7 @@ function DebateRoom() {
                 
                 // Step 4: Final evaluation (Phase 5)
                 setSuccess("⏳ Thời gian hết! AI đang phân tích toàn bộ debate và chấm điểm... (5-10 giây)");
-                const response = await api.post(`/debate/${teamIdForApi}/phase5/evaluate`);
+                const response = await api.post(`/debate/${teamIdForApi}/phase5/evaluate`, null, idempotent('phase5-evaluate'));
                 const evaluationData = response.data.data?.evaluation || response.data.evaluation;
                 setEvaluation(evaluationData);
                 setPhase(5);
@@ -602,6 +634,7 @@ function DebateRoom() {
     }
     
     const answerToSubmit = currentAnswer.trim();
+    const since = turnsPhase2.length; // Turns we already hold from the backend
     
     try {
       setTurnLoading(true);
@@ -644,25 +677,13 @@ function DebateRoom() {
         answer: answerToSubmit,
         asker: 'student',
         question: lastAIQuestion.question,
-      });
+      }, { ...idempotent(`phase2-answer-${since}`), params: { since } });
       
       console.log('🔧 DEBUG: Full backend response:', response.data);
       
-      // 🔧 FIX: Smart merge backend response with optimistic update
+      // 🔧 FIX: Replace the optimistic turn with the backend's new turns
       if (response.data.turns) {
-        const backendTurns = response.data.turns.map((turn, idx) => ({
-          asker: turn.asker,
-          question: turn.question,
-          answer: turn.answer === 'null' ? null : turn.answer, // Convert "null" string to null
-          turn_number: idx + 1
-        }));
-        
-        console.log('🔧 DEBUG: Backend response turns:', backendTurns);
-        
-                 // 🔧 FIX: Use backend turns directly since they contain all data
-         // Backend already has the complete data including the new answer
-         const mergedTurns = backendTurns;
-        
+        const mergedTurns = mergeTurns(turnsPhase2, since, response.data.turns);
         console.log('🔧 DEBUG: Final merged turns:', mergedTurns);
         setTurnsPhase2(mergedTurns);
       }
@@ -695,16 +716,13 @@ function DebateRoom() {
       setError(null);
       
       console.log('🔧 DEBUG: Requesting next AI question for team:', team_id);
-      const response = await api.post(`/debate/${teamIdForApi}/ai-question/generate`);
+      const since = turnsPhase2.length;
+      const response = await api.post(`/debate/${teamIdForApi}/ai-question/generate`, null,
+        { ...idempotent(`phase2-next-${since}`), params: { since } });
       console.log('🔧 DEBUG: AI question generate response:', response.data);
       
       if (response.data.turns) {
-        const backendTurns = response.data.turns.map((turn, idx) => ({
-          asker: turn.asker,
-          question: turn.question,
-          answer: turn.answer === 'null' ? null : turn.answer,
-          turn_number: idx + 1
-        }));
+        const backendTurns = mergeTurns(turnsPhase2, since, response.data.turns);
         
         console.log('🔧 DEBUG: New AI question received, updating turns:', backendTurns);
         setTurnsPhase2(backendTurns);
@@ -743,6 +761,8 @@ function DebateRoom() {
       return;
     }
     
+    const since = turnsPhase3.length; // Turns we already hold from the backend
+    
     try {
       setTurnLoading(true);
       
@@ -754,39 +774,52 @@ function DebateRoom() {
         turn_number: turnsPhase3.length + 1
       };
       
-      setTurnsPhase3(prev => [...prev, optimisticQuestionTurn]);
+      // Placeholder AI turn that fills in as tokens stream from the backend
+      const streamingAnswerTurn = {
+        asker: 'ai',
+        question: null,
+        answer: '',
+        turn_number: turnsPhase3.length + 2
+      };
+      
+      setTurnsPhase3(prev => [...prev, optimisticQuestionTurn, streamingAnswerTurn]);
       setCurrentAnswer(''); // Clear input field immediately
       
-      const response = await api.post(`/debate/${teamIdForApi}/student-question/turn`, {
+      let finalTurns = null;
+      await postEventStream(`/debate/${teamIdForApi}/student-question/stream?since=${since}`, {
         asker: 'student',
         question: question.trim(),
         answer: null
+      }, (event, data) => {
+        if (event === 'token') {
+          setTurnsPhase3(prev => {
+            const updated = [...prev];
+            const last = updated[updated.length - 1];
+            updated[updated.length - 1] = { ...last, answer: (last.answer || '') + data.content };
+            return updated;
+          });
+        } else if (event === 'done') {
+          finalTurns = data.turns;
+        } else if (event === 'error') {
+          // 404/409 after the stream started: the catch below reverts the optimistic turns
+          throw streamError(data.status, data.detail);
+        }
       });
       
-      console.log('🔧 DEBUG Phase 3 response:', response.data);
+      console.log('🔧 DEBUG Phase 3 streamed turns:', finalTurns);
       
-      // 🔧 FIX: Use backend Phase 3 turns directly
-      if (response.data.turns) {
-        const backendTurns = response.data.turns;
-        console.log('🔧 DEBUG: Backend Phase 3 turns:', backendTurns);
-        
-        // Convert backend format to frontend format
-        const formattedTurns = backendTurns.map((turn, idx) => ({
-          asker: turn.asker,
-          question: turn.question,
-          answer: turn.answer === 'null' ? null : turn.answer,
-          turn_number: idx + 1
-        }));
-        
-        setTurnsPhase3(formattedTurns);
+      // 🔧 FIX: Replace the optimistic question/answer with the backend's new Phase 3 turns
+      if (finalTurns) {
+        console.log('🔧 DEBUG: Backend Phase 3 turns:', finalTurns);
+        setTurnsPhase3(prev => mergeTurns(prev, since, finalTurns));
       }
       
     } catch (err) {
       console.error('Phase 3 error:', err);
       setError(err.response?.data?.detail || "Gửi lượt debate phase 3 (Sinh viên chất vấn AI) thất bại!");
       
-      // Revert optimistic update on error
-      setTurnsPhase3(prev => prev.slice(0, -1));
+      // Revert optimistic update (question + streaming answer placeholder) on error
+      setTurnsPhase3(prev => prev.slice(0, -2));
       setCurrentAnswer(question); // Restore input
     } finally {
       setTurnLoading(false);
@@ -978,11 +1011,15 @@ function DebateRoom() {
   // Khi chuyển sang phase 3, load existing turns data correctly separated
   const handleGoToPhase3 = async () => {
     try {
-      // Load existing turns data from backend with proper separation
-      const response = await api.get(`/debate/${teamIdForApi}/turns`);
+      // Load the turns we do not hold yet from backend with proper separation
+      const sincePhase2 = turnsPhase2.length;
+      const sincePhase3 = turnsPhase3.length;
+      const response = await api.get(`/debate/${teamIdForApi}/turns`, {
+        params: { since_phase2: sincePhase2, since_phase3: sincePhase3 }
+      });
       if (response.data.success) {
-        setTurnsPhase2(response.data.phase2_turns || []);
-        setTurnsPhase3(response.data.phase3_turns || []);
+        setTurnsPhase2(prev => mergeTurns(prev, sincePhase2, response.data.phase2_turns || []));
+        setTurnsPhase3(prev => mergeTurns(prev, sincePhase3, response.data.phase3_turns || []));
         console.log('🔧 DEBUG: Loaded separated turns data:', {
           phase2: response.data.phase2_turns?.length || 0,
           phase3: response.data.phase3_turns?.length || 0
@@ -0,0 +1,90 @@
+/**
+ * Minimal Server-Sent Events reader for POST endpoints.
+ * EventSource only supports GET, so we read the fetch body stream directly.
+ */
+import API_CONFIG from '../config/api';
+
+/**
+ * Error shaped like an axios error ({ response: { status, data: { detail } } }),
+ * so callers handle a failed stream like any other failed request.
+ */
+export function streamError(status, detail) {
+  const error = new Error(detail);
+  error.response = { status, data: { detail } };
+  return error;
+}
+
+/**
+ * POST `body` to `path` and call onEvent(event, data) for each event received.
+ * Whatever onEvent throws (e.g. streamError for an `error` event) stops reading
+ * and rejects the returned promise.
+ */
+export async function postEventStream(path, body, onEvent) {
+  const response = await fetch(`${API_CONFIG.baseURL}${path}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream',
+    },
+    body: JSON.stringify(body),
+  });
+
+  if (!response.ok || !response.body) {
+    let detail = `HTTP ${response.status}`;
+    try {
+      const data = await response.json();
+      detail = data.detail || detail;
+    } catch (e) {
+      // Response was not JSON
+    }
+    throw streamError(response.status, detail);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder('utf-8');
+  let buffer = '';
+
+  const dispatch = (rawEvent) => {
+    let event = 'message';
+    const dataLines = [];
+    rawEvent.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) {
+        event = line.slice(6).trim();
+      } else if (line.startsWith('data:')) {
+        dataLines.push(line.slice(5).trim());
+      }
+    });
+    if (dataLines.length === 0) return;
+    let data;
+    try {
+      data = JSON.parse(dataLines.join('\n'));
+    } catch (e) {
+      console.error('Invalid SSE payload:', e);
+      return;
+    }
+    onEvent(event, data);
+  };
+
+  try {
+    // eslint-disable-next-line no-constant-condition
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        dispatch(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+      }
+    }
+    if (buffer.trim()) {
+      dispatch(buffer);
+    }
+  } catch (e) {
+    reader.cancel().catch(() => {});
+    throw e;
+  }
+}
+
+export default postEventStream;
@@ -33,6 +33,35 @@ GEMINI_API_KEY_10=your_gemini_api_key_10_here
 # Giữ lại GOOGLE_API_KEY để backward compatibility
 GEMINI_API_KEY=your_gemini_api_key_primary_here
 
+# Giới hạn quota mỗi key (key bị tạm dừng tới khi cửa sổ quota reset)
+# GEMINI_KEY_RPM_LIMIT=15
+# GEMINI_KEY_TPM_LIMIT=1000000
+
+# Lưu phiên debate: sqlite (mặc định, giữ được khi restart), redis (nhiều máy chủ) hoặc memory
+# SESSION_STORE=sqlite
+# SESSION_DB_PATH=/home/ubuntu/MLN_chatbot_debate/backend/debate_sessions.db
+# REDIS_URL=redis://localhost:6379/0  (SESSION_STORE=redis cần `pip install redis`)
+
+# Số bộ luận điểm AI Phase 1 sinh sẵn cho mỗi chủ đề/lập trường, tổng cho mọi worker gunicorn (0 = tắt)
+# ARGUMENT_POOL_SIZE=3
+
+# Cache câu trả lời AI theo prompt (tắt mặc định): arguments, questions, socratic hoặc all
+# LLM_CACHE=arguments,questions
+# LLM_CACHE_SIZE=1000
+# LLM_CACHE_TTL=3600
+# LLM_CACHE_PATH=/home/ubuntu/MLN_chatbot_debate/backend/llm_cache.db  (giữ cache khi restart)
+
+# Giới hạn token cho dữ liệu debate khi chấm điểm (lịch sử dài sẽ được lược bớt các lượt giữa)
+# EVALUATION_TOKEN_BUDGET=6000
+
+# Xuất báo cáo DOCX: số tiến trình render (mỗi worker gunicorn có nhóm riêng) và số báo cáo giữ trong cache (theo phiên, tự hết hạn khi phiên thay đổi)
+# REPORT_WORKERS=2
+# REPORT_CACHE_SIZE=100
+# REPORT_TEMPLATE_PATH=/home/ubuntu/MLN_chatbot_debate/backend/report_template.docx  (khung .docx có sẵn style)
+
+# Số worker khi chạy gunicorn (quota RPM/TPM của mỗi key được chia đều cho các worker)
+# WEB_CONCURRENCY=4
+
 # === MÔI TRƯỜNG KHÁC ===
 # MongoDB connection (nếu cần)
 # MONGO_URI=mongodb://localhost:27017/